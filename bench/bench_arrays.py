@@ -0,0 +1,76 @@
+"""
+Indexed loops over a DIM array: fill it and sum it back, and the memory
+the elements take against as many numbered variables in the variables
+dict, which is how programs faked arrays before DIM.
+
+    python bench/bench_arrays.py [SIZE]
+"""
+import io, sys, time
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter, rng
+from redbasic.memory import deep_sizeof
+
+CODE = """
+dim A({last})
+let I = 0
+10 A(I) = I * 3
+I += 1
+if I <= {last} then goto 10
+let S = 0
+I = 0
+20 S += A(I)
+I += 1
+if I <= {last} then goto 20
+print S
+"""
+
+# the same loops with a scalar in place of the array
+SCALAR = """
+let X = 0
+let I = 0
+10 X = I * 3
+I += 1
+if I <= {last} then goto 10
+let S = 0
+I = 0
+20 S += X
+I += 1
+if I <= {last} then goto 20
+print S
+"""
+
+def timed(code):
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+    interp.set_source(code)
+    start = time.perf_counter()
+    interp.exec()
+    return interp, time.perf_counter() - start
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    interp, elapsed = timed(CODE.format(last=size - 1))
+    assert interp.output.getvalue() == f"{3 * size * (size - 1) // 2}\n"
+
+    statements = interp.metrics.statements
+    print(f"{size:,} elements filled and summed in {elapsed:.2f} s,"
+          f" {2 * size / elapsed:,.0f} indexed accesses/s, {statements / elapsed:,.0f} statements/s")
+    _, scalar = timed(SCALAR.format(last=size - 1))
+    print(f"the same loops on a scalar: {scalar:.2f} s")
+
+    array = interp.arrays['A']
+    fake = { f'A{i}': i * 3 for i in range(size) }
+    print(f"array: {deep_sizeof(array) / size:.1f} bytes per element,"
+          f" numbered variables: {deep_sizeof(fake) / size:.1f} bytes per element")
+
+    if rng.has_numpy():
+        view = array.numpy()
+        start = time.perf_counter()
+        total = int(view.sum())
+        print(f"sum of the NumPy view: {(time.perf_counter() - start) * 1e3:.2f} ms")
+        assert total == 3 * size * (size - 1) // 2
+
+if __name__=='__main__':
+    main()
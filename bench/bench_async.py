@@ -0,0 +1,87 @@
+"""
+Many interactive sessions in one process. A server runs an
+AsyncInterpreter per connection, every client sends numbers a line
+at a time and waits for the running total before sending the next.
+Half the sessions also spin in a busy loop first, the event loop
+latency shows whether they starve the others.
+
+    python bench/bench_async.py [SESSIONS] [LINES] [SLICE]
+"""
+import asyncio, sys, time
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic.aio import AsyncInterpreter, SLICE
+
+CODE = """
+let S = 0
+let I = 0
+let B = 0
+if W == 0 then goto 10
+5 B += 1
+if B < 2000 then goto 5
+10 input N
+S += N
+print S
+I += 1
+if I < {lines} then goto 10
+"""
+
+async def handle(reader, writer, lines, busy, slice):
+    interp = AsyncInterpreter(reader, writer, slice=slice)
+    interp.set_source(CODE.format(lines=lines))
+    interp.variables['W'] = busy
+    await interp.exec_async()
+    writer.close()
+
+async def client(port, lines):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    total = 0
+    for i in range(lines):
+        writer.write(f'{i}\n'.encode())
+        total += i
+        answer = int(await reader.readline())
+        assert answer == total, (answer, total)
+    writer.close()
+
+async def monitor(latencies):
+    "how late the event loop wakes up a task asking to sleep 1ms"
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        latencies.append(time.perf_counter() - start - 0.001)
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    slice = int(sys.argv[3]) if len(sys.argv) > 3 else SLICE
+
+    count = 0
+    def accept(reader, writer):
+        nonlocal count
+        count += 1
+        return handle(reader, writer, lines, count % 2, slice)
+
+    server = await asyncio.start_server(accept, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    mon = asyncio.create_task(monitor(latencies))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[ client(port, lines) for _ in range(sessions) ])
+    elapsed = time.perf_counter() - start
+
+    mon.cancel()
+    server.close()
+    await server.wait_closed()
+
+    latencies.sort()
+    print(f"{sessions} sessions, slices of {slice} statements")
+    print(f"{sessions} sessions, {sessions * lines} INPUT round trips in {elapsed:.2f} s"
+          f" ({sessions * lines / elapsed:,.0f}/s)")
+    print(f"event loop lag: median {latencies[len(latencies)//2]*1e3:.2f} ms,"
+          f" max {latencies[-1]*1e3:.2f} ms")
+
+if __name__=='__main__':
+    asyncio.run(main())
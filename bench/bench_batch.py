@@ -0,0 +1,57 @@
+"""
+Many small jobs: the batch runner's warm worker pool against starting
+`python -m redbasic -f` for every script, which is what we did before.
+
+    python bench/bench_batch.py [JOBS] [WORKERS]
+"""
+import os, sys, subprocess, tempfile, time
+# HACK: fix path and imports
+import pathlib
+src = pathlib.Path(__file__).absolute().parent.parent/'src'
+sys.path.append(str(src))
+
+from redbasic import batch
+
+CODE = """
+input N
+let S = 0
+let I = 0
+10 S += I
+I += 1
+if I <= N then goto 10
+print S
+"""
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        for i in range(count):
+            path = os.path.join(tmp, f'job{i}.bas')
+            with open(path, 'w') as f:
+                f.write(CODE)
+            with open(os.path.join(tmp, f'job{i}.in'), 'w') as f:
+                f.write(f'{i % 100}\n')
+            jobs.append(batch.make_job(path, output_dir=tmp))
+
+        start = time.perf_counter()
+        results = list(batch.run_batch(jobs, workers))
+        pool = time.perf_counter() - start
+        assert all(r.status == 'ok' for r in results)
+
+        # one process per job, a sample is enough to see the trend
+        sample = jobs[:50]
+        env = dict(os.environ, PYTHONPATH=str(src))
+        start = time.perf_counter()
+        for job in sample:
+            with open(job.stdin) as stdin, open(job.stdout, 'w') as stdout:
+                subprocess.run([sys.executable, '-m', 'redbasic', '-f', job.path], stdin=stdin, stdout=stdout, env=env, check=True)
+        spawn = (time.perf_counter() - start) / len(sample)
+
+    print(f"pool of {workers}: {count} jobs in {pool:.2f} s, {count / pool:,.0f} jobs/s")
+    print(f"process per job: {spawn*1e3:.1f} ms per job, {1 / spawn:,.0f} jobs/s")
+
+if __name__=='__main__':
+    main()
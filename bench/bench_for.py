@@ -0,0 +1,79 @@
+"""
+Counted loops: FOR/NEXT against the LET, increment and IF ... THEN GOTO
+they replace, as in Samples/rnumbers.bas, with and without the optimizer,
+which fuses the increment and the IF of the GOTO loop.
+
+    python bench/bench_for.py [ITERATIONS]
+"""
+import io, sys, time
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+
+FOR = """
+let S = 0
+for I = 1 to {n}
+S += I
+next I
+print S
+"""
+
+GOTO = """
+let S = 0
+let I = 1
+10 S += I
+I = I + 1
+if I <= {n} then goto 10
+print S
+"""
+
+# a nested loop, the inner one is short so FOR pays for its frames
+NESTED_FOR = """
+let S = 0
+for I = 1 to {n}
+for J = 1 to 4
+S += J
+next J
+next I
+print S
+"""
+
+NESTED_GOTO = """
+let S = 0
+let J = 0
+let I = 1
+10 J = 1
+20 S += J
+J = J + 1
+if J <= 4 then goto 20
+I = I + 1
+if I <= {n} then goto 10
+print S
+"""
+
+def timed(code, optimize):
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(), optimize=optimize)
+    interp.set_source(code)
+    start = time.perf_counter()
+    interp.exec()
+    return interp, time.perf_counter() - start
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    cases = (('loop', FOR, GOTO, n, n * (n + 1) // 2), ('nested', NESTED_FOR, NESTED_GOTO, n // 4, n // 4 * 10))
+    for name, for_code, goto_code, count, total in cases:
+        for optimize in (True, False):
+            results = []
+            for kind, code in (('FOR/NEXT', for_code), ('GOTO', goto_code)):
+                interp, elapsed = timed(code.format(n=count), optimize)
+                assert interp.output.getvalue() == f"{total}\n"
+                results.append(elapsed)
+                print(f"{name:<7} optimize={optimize!s:<5} {kind:<9} {elapsed:6.2f} s,"
+                      f" {interp.metrics.statements / elapsed:>10,.0f} statements/s,"
+                      f" {interp.metrics.statements:>9,} statements")
+            print(f"{'':<22} FOR/NEXT is {results[1] / results[0]:.2f}x the speed of GOTO")
+
+if __name__=='__main__':
+    main()
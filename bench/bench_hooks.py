@@ -0,0 +1,51 @@
+"""
+Cost of the hook API. exec on an interpreter that never had hooks,
+one whose hooks were added and removed again, and one with a no-op
+line hook. The first two run the same loop, so they should match.
+
+    python bench/bench_hooks.py [ITERATIONS]
+"""
+import io, sys, timeit
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+
+CODE = """
+I = 0
+S = 0
+10 S = S + I * 2
+I += 1
+if I < {n} then goto 10
+"""
+
+def make(n):
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+    interp.set_source(CODE.format(n=n))
+    interp.link()
+    return interp
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    noop = lambda interp, event, arg: None
+
+    plain = make(n)
+
+    removed = make(n)
+    removed.add_hook('line', noop)
+    removed.remove_hook('line', noop)
+
+    hooked = make(n)
+    hooked.add_hook('line', noop)
+
+    results = {}
+    for name, interp in (('no hooks', plain), ('hooks removed', removed), ('line hook', hooked)):
+        results[name] = min(timeit.repeat(interp.exec, number=1, repeat=5))
+
+    base = results['no hooks']
+    for name, t in results.items():
+        print(f"{name:>14}: {t*1e3:9.2f} ms  ({(t/base - 1)*100:+6.1f}%)")
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+INPUT throughput, in values/sec, for a program summing numbers
+read from a pipe, and the cost of classifying a single value.
+
+    python bench/bench_input.py [VALUES]
+"""
+import os, sys, time, threading, timeit
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+from redbasic.parser import parse_int
+from redbasic.streams import parse_value
+
+CODE = """
+let S = 0
+let I = 0
+10 input N
+S += N
+I += 1
+if I < {count} then goto 10
+"""
+
+def feed(fd, count):
+    with open(fd, 'w') as pipe:
+        for i in range(count):
+            pipe.write(f'{i}\n' if i % 3 else f'{i}.5\n')
+
+def parse_with_exceptions(line):
+    "how INPUT used to classify values"
+    try:
+        value = float(line)
+        if value.is_integer():
+            value = int(value)
+        return value
+    except ValueError:
+        pass
+    try:
+        return parse_int(line)
+    except ValueError:
+        pass
+    return line
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    rfd, wfd = os.pipe()
+    writer = threading.Thread(target=feed, args=(wfd, count))
+    writer.start()
+    with open(rfd) as pipe:
+        interp = Interpreter(textin=pipe)
+        interp.set_source(CODE.format(count=count))
+        interp.link()
+        start = time.perf_counter()
+        interp.exec()
+        elapsed = time.perf_counter() - start
+    writer.join()
+    print(f"INPUT: {count / elapsed:12,.0f} values/sec")
+
+    for sample in ('12345', '3.25', '0x1F', 'hello'):
+        new = timeit.timeit(lambda: parse_value(sample), number=100_000)
+        old = timeit.timeit(lambda: parse_with_exceptions(sample), number=100_000)
+        print(f"{sample:>6}: parse_value {new*10:.3f} us, exceptions {old*10:.3f} us")
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+MAT statements and SUM against the FOR/NEXT element loops they replace,
+with NumPy kernels and with the Python loops of redbasic.matrix, and the
+size where NumPy starts to pay off for A + B and SUM.
+
+    python bench/bench_mat.py [N]
+"""
+import io, sys, time, timeit
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter, matrix, rng
+from redbasic.arrays import Array
+
+SETUP = """
+dim A({n}, {n}), B({n}, {n})
+for I = 0 to {n}
+for J = 0 to {n}
+A(I, J) = I + J
+B(I, J) = I - J
+next J
+next I
+"""
+
+LOOPS = """
+dim C({n}, {n}), D({n}, {n})
+let S = 0
+let T = 0
+for I = 0 to {n}
+for J = 0 to {n}
+C(I, J) = A(I, J) + B(I, J)
+S += C(I, J)
+next J
+next I
+for I = 0 to {n}
+for J = 0 to {n}
+T = 0
+for K = 0 to {n}
+T += A(I, K) * B(K, J)
+next K
+D(I, J) = T
+next J
+next I
+print S
+"""
+
+MAT = """
+mat C = A + B
+let S = sum(C())
+mat D = A * B
+print S
+"""
+
+def run(n, code):
+    "seconds of code after the setup, and the interpreter"
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+    interp.exec_src(SETUP.format(n=n))
+    arrays = dict(interp.arrays)
+    interp.set_source(code.format(n=n))
+    interp.link()
+    interp.reset()
+    interp.arrays.update(arrays)
+    start = time.perf_counter()
+    interp.exec()
+    return time.perf_counter() - start, interp
+
+def break_even():
+    "elements where the NumPy kernels get faster than the loops"
+    found = {}
+    for n in (16, 32, 64, 128, 256, 512, 1024, 2048):
+        a = Array('A', (n - 1,))
+        for i in range(n):
+            a.set([i], i)
+        for name, kernel in (('A + B', lambda: matrix.elementwise('C', '+', a, a)),
+                             ('SUM', lambda: matrix.array_sum(a))):
+            times = []
+            for size in (0, None):
+                matrix.NUMPY_MIN_SIZE = size
+                times.append(min(timeit.repeat(kernel, number=200, repeat=3)))
+            if times[0] < times[1]:
+                found.setdefault(name, n)
+    return found
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    default = matrix.NUMPY_MIN_SIZE
+    loops, interp = run(n, LOOPS)
+    expected = interp.output.getvalue()
+    product = interp.arrays['D'].data.tolist()
+    print(f"{n+1}x{n+1} matrices, {(n + 1) ** 2} elements, add, sum and multiply")
+    print(f"  FOR/NEXT loops     {loops*1e3:9.1f} ms")
+
+    backends = [('MAT, Python loops', None)]
+    if rng.has_numpy():
+        # imported on first use, don't time that
+        rng.numpy
+        backends.append(('MAT, NumPy', 0))
+    for name, size in backends:
+        matrix.NUMPY_MIN_SIZE = size
+        elapsed, interp = run(n, MAT)
+        assert interp.output.getvalue() == expected and interp.arrays['D'].data.tolist() == product
+        print(f"  {name:<18} {elapsed*1e3:9.1f} ms, {loops / elapsed:,.0f}x the loops")
+
+    if rng.has_numpy():
+        found = break_even()
+        print(f"NumPy is faster from {found} elements, NUMPY_MIN_SIZE is {default}")
+    matrix.NUMPY_MIN_SIZE = default
+
+if __name__=='__main__':
+    main()
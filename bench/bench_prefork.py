@@ -0,0 +1,88 @@
+"""
+Pre-forked workers that inherit parsed and linked programs against the
+batch runner, whose workers parse every job's script. Also how much of
+the workers' memory stays shared with the parent, with and without
+gc.freeze(), from /proc/PID/smaps_rollup (Linux only).
+
+    python bench/bench_prefork.py [JOBS] [WORKERS]
+"""
+import os, sys, tempfile, time
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import batch
+from redbasic.prefork import PreforkPool
+
+PROGRAMS = 20
+# enough lines that the programs are a good part of the memory
+LINES = 1000
+
+def program(n):
+    lines = [ 'input N', 'let S = 0' ]
+    lines += [ f'let V{i} = N * {i} + {n}' for i in range(LINES) ]
+    lines += [ 'let I = 0', '10 S += I', 'I += 1', 'if I <= N then goto 10', 'print S + V1' ]
+    return '\n'.join(lines)
+
+def memory(pid):
+    "kB of rss, pss and private memory of a process"
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[key] = int(value.split()[0])
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+def prefork(programs, requests, workers, freeze):
+    with PreforkPool(programs, workers, freeze) as pool:
+        forked = [ memory(pid) for pid in pool.pids ]
+        list(pool.map(requests[:workers * 4]))
+        start = time.perf_counter()
+        latencies = []
+        for reply in pool.map(requests):
+            assert not reply.error, reply.error
+            latencies.append(reply.seconds)
+        elapsed = time.perf_counter() - start
+        usage = [ memory(pid) for pid in pool.pids ]
+    return elapsed, latencies, forked, usage
+
+def average(usage):
+    return [ sum(u[i] for u in usage) / len(usage) / 1024 for i in range(3) ]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    programs = { f'p{n}': program(n) for n in range(PROGRAMS) }
+    requests = [ (f'p{i % PROGRAMS}', f'{i % 50}\n') for i in range(count) ]
+
+    for freeze in (True, False):
+        elapsed, latencies, forked, usage = prefork(programs, requests, workers, freeze)
+        latencies.sort()
+        print(f"prefork, freeze={freeze}: {count / elapsed:,.0f} jobs/s,"
+              f" median job {latencies[len(latencies)//2]*1e3:.2f} ms")
+        for when, u in (('forked', forked), ('after jobs', usage)):
+            rss, pss, private = average(u)
+            print(f"  per worker {when}: rss {rss:.1f} MB, pss {pss:.1f} MB, private {private:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        # every job parses its script, a sample is enough
+        for i, (name, stdin) in enumerate(requests[:50]):
+            path = os.path.join(tmp, f'{name}.bas')
+            if not os.path.exists(path):
+                with open(path, 'w') as f:
+                    f.write(programs[name])
+            inp = os.path.join(tmp, f'job{i}.in')
+            with open(inp, 'w') as f:
+                f.write(stdin)
+            jobs.append(batch.make_job(path, stdin=inp))
+        start = time.perf_counter()
+        results = list(batch.run_batch(jobs, workers))
+        elapsed = time.perf_counter() - start
+        assert all(r.status == 'ok' for r in results)
+        seconds = sorted(r.seconds for r in results)
+        print(f"batch runner: {len(jobs) / elapsed:,.0f} jobs/s, median job {seconds[len(seconds)//2]*1e3:.2f} ms")
+
+if __name__=='__main__':
+    main()
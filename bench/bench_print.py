@@ -0,0 +1,49 @@
+"""
+PRINT throughput, in lines/sec, of each output buffering mode
+writing to a pipe.
+
+    python bench/bench_print.py [LINES]
+"""
+import os, sys, time, threading
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+from redbasic.streams import BUFFER_MODES
+
+CODE = """
+let I = 0
+10 print "line "; I, I * 2; " end"
+I += 1
+if I < {lines} then goto 10
+"""
+
+def drain(fd):
+    while os.read(fd, 1 << 16):
+        pass
+
+def run(mode, lines):
+    rfd, wfd = os.pipe()
+    reader = threading.Thread(target=drain, args=(rfd,))
+    reader.start()
+
+    with open(wfd, 'w') as pipe:
+        interp = Interpreter(textout=pipe, buffering=mode)
+        interp.set_source(CODE.format(lines=lines))
+        interp.link()
+        start = time.perf_counter()
+        interp.exec()
+        elapsed = time.perf_counter() - start
+
+    reader.join()
+    os.close(rfd)
+    return lines / elapsed
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    for mode in BUFFER_MODES:
+        print(f"{mode:>5}: {run(mode, lines):12,.0f} lines/sec")
+
+if __name__=='__main__':
+    main()
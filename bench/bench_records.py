@@ -0,0 +1,52 @@
+"""
+Records/sec of --per-record, the program is parsed once, against
+running `python -m redbasic` once per record like we used to.
+
+    python bench/bench_records.py [RECORDS] [WORKERS]
+"""
+import os, sys, subprocess, tempfile, time
+# HACK: fix path and imports
+import pathlib
+src = pathlib.Path(__file__).absolute().parent.parent/'src'
+sys.path.append(str(src))
+
+from redbasic import Parser, batch
+
+CODE = """
+input NAME, N
+let S = 0
+let I = 0
+10 S += I
+I += 1
+if I <= N then goto 10
+print NAME, S
+"""
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'records.txt')
+        with open(path, 'w') as f:
+            for i in range(count):
+                f.write(f'row{i}\t{i % 50}\n')
+
+        start = time.perf_counter()
+        program = Parser().parse(CODE)
+        size = sum(len(out) for out, err in batch.run_records(program, batch.read_records(path), workers))
+        pooled = time.perf_counter() - start
+
+    env = dict(os.environ, PYTHONPATH=str(src))
+    sample = 30
+    start = time.perf_counter()
+    for i in range(sample):
+        subprocess.run([sys.executable, '-m', 'redbasic', '-c', CODE], input=f'row{i}\n{i}\n',
+                       capture_output=True, text=True, env=env, check=True)
+    spawn = (time.perf_counter() - start) / sample
+
+    print(f"--per-record -j {workers}: {count / pooled:,.0f} records/s ({size:,} bytes of output)")
+    print(f"process per record: {1 / spawn:,.1f} records/s")
+
+if __name__=='__main__':
+    main()
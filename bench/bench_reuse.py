@@ -0,0 +1,54 @@
+"""
+Runs per second of a small program with a different input every time:
+a new interpreter per run, a new one given the parsed program, and one
+interpreter reused with run().
+
+    python bench/bench_reuse.py [RUNS]
+"""
+import io, sys, time
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+
+CODE = """
+input N
+let S = 0
+let I = 0
+10 S += I * I
+I += 1
+if I <= N then goto 10
+if S > 100 then print "big" else print "small"
+print S
+"""
+
+def fresh(runs):
+    for i in range(runs):
+        interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(f'{i % 10}\n'))
+        interp.set_source(CODE)
+        interp.exec()
+
+def fresh_parsed(runs):
+    program = Interpreter(textout=io.StringIO(), textin=io.StringIO()).parser.parse(CODE)
+    for i in range(runs):
+        interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(f'{i % 10}\n'))
+        interp.ast = program
+        interp.exec()
+
+def reused(runs):
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+    for i in range(runs):
+        interp.run(CODE, input=f'{i % 10}\n', output=io.StringIO())
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    for name, func in (('new interpreter, parse', fresh), ('new interpreter, parsed program', fresh_parsed),
+                       ('reused, run()', reused)):
+        start = time.perf_counter()
+        func(runs)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<32} {runs / elapsed:>10,.0f} runs/s")
+
+if __name__=='__main__':
+    main()
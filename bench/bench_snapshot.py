@@ -0,0 +1,41 @@
+"""
+snapshot() and restore() latency and size as the number of variables
+grows, against running the LET lines that set them up again.
+
+    python bench/bench_snapshot.py
+"""
+import io, sys, timeit
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter
+
+def main():
+    print(f"{'variables':>9} {'bytes':>10} {'snapshot':>12} {'restore':>12} {'setup code':>12}")
+    for count in (10, 100, 1_000, 10_000):
+        code = '\n'.join(f'let V{i} = {i} * 1.5' for i in range(count)) + '\nprint 1'
+        interp = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+        interp.set_source(code)
+        interp.begin()
+        interp.run_for(count)
+        blob = interp.snapshot()
+
+        number = max(1, 10_000 // count)
+        snap = timeit.timeit(interp.snapshot, number=number) / number
+        other = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+        other.ast = interp.ast
+        # the first restore links the program, that's paid once per interpreter
+        other.restore(blob)
+        load = timeit.timeit(lambda: other.restore(blob), number=number) / number
+
+        def setup():
+            other.begin()
+            other.variables.clear()
+            other.run_for(count)
+        rerun = timeit.timeit(setup, number=number) / number
+
+        print(f"{count:>9} {len(blob):>10} {snap*1e6:>10.1f}us {load*1e6:>10.1f}us {rerun*1e6:>10.1f}us")
+
+if __name__=='__main__':
+    main()
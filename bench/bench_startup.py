@@ -0,0 +1,62 @@
+"""
+Startup time of short runs. Reads `python -X importtime` for the import
+of redbasic.__main__, lists the slowest modules and times a whole
+`python -m redbasic -c "print 1"` against an empty interpreter. The exit
+status is 1 when the import takes longer than the budget.
+
+    python bench/bench_startup.py [BUDGET_MS] [RUNS]
+"""
+import os, sys, subprocess, time, statistics
+# HACK: fix path and imports
+import pathlib
+src = pathlib.Path(__file__).absolute().parent.parent/'src'
+
+# ms for importing redbasic.__main__, about what it took once the heavy modules
+# were made lazy, so an import that creeps back onto the startup path fails it.
+# Pass a bigger one on slower machines.
+BUDGET_MS = 80
+
+env = dict(os.environ, PYTHONPATH=str(src))
+
+def importtime():
+    "module -> (self, cumulative) microseconds"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import redbasic.__main__'],
+                          env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = int(own), int(cumulative)
+    return times
+
+def wall(args, runs):
+    "median seconds of running python with args"
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], env=env, stdout=subprocess.DEVNULL, check=True)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    samples = [ importtime() for _ in range(runs) ]
+    total = min(s['redbasic.__main__'][1] for s in samples) / 1e3
+    times = samples[-1]
+    print("slowest modules, self time:")
+    for name, (own, _) in sorted(times.items(), key=lambda kv: -kv[1][0])[:10]:
+        print(f"  {own/1e3:>7.2f} ms  {name}")
+
+    empty = wall(['-c', 'pass'], runs)
+    run = wall(['-m', 'redbasic', '-c', 'print 1'], runs)
+    print(f"import redbasic.__main__: {total:.1f} ms, budget {budget:.0f} ms")
+    print(f"python -c pass: {empty*1e3:.1f} ms, python -m redbasic -c 'print 1': {run*1e3:.1f} ms")
+    if total > budget:
+        print("over budget", file=sys.stderr)
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+One program over many inputs: run_lanes against an Interpreter per
+input. The program's jumps don't depend on the input, so all lanes
+stay together.
+
+    python bench/bench_vector.py [LANES]
+"""
+import io, sys, time, random
+# HACK: fix path and imports
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
+
+from redbasic import Interpreter, Parser
+from redbasic.vector import run_lanes
+
+CODE = """
+input X, R
+let Y = 0
+let I = 0
+10 Y = Y * X + R / (I + 1)
+if Y > 100 then Y = Y - 100
+I += 1
+if I < 50 then goto 10
+print X, Y
+"""
+
+def main():
+    lanes = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(1)
+    inputs = [ f'{rng.uniform(-1, 1)}\n{rng.randint(0, 99)}\n' for _ in range(lanes) ]
+    program = Parser().parse(CODE)
+
+    start = time.perf_counter()
+    batch = run_lanes(program, inputs)
+    vector = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outputs = []
+    for text in inputs:
+        out = io.StringIO()
+        interp = Interpreter(textout=out, textin=io.StringIO(text))
+        interp.ast = program
+        interp.exec()
+        outputs.append(out.getvalue())
+    scalar = time.perf_counter() - start
+
+    assert outputs == [ lane.output for lane in batch.lanes ]
+    print(f"{lanes} lanes, {batch.vector_statements} statements for all lanes at once,"
+          f" diverged at {batch.diverged_at}")
+    print(f"run_lanes: {vector*1e3:.1f} ms, interpreter per input: {scalar*1e3:.1f} ms ({scalar/vector:.1f}x)")
+
+if __name__=='__main__':
+    main()
@@ -6,7 +6,22 @@ __all__ = [
     "ast",
     "interpreter",
     "parser",
-    "error"
+    "error",
+    "cfg",
+    "optimize",
+    "streams",
+    "rng",
+    "functions",
+    "profiler",
+    "hooks",
+    "metrics",
+    "memory",
+    "aio",
+    "batch",
+    "vector",
+    "prefork",
+    "arrays",
+    "matrix",
 ]
 
 from .interpreter import Interpreter, repl
@@ -1,42 +1,155 @@
-import argparse
-import pprint
+import sys
+import time
 from . import ast, Parser, Interpreter, repl
+# argparse, pprint, tracemalloc and the batch runner are imported when
+# they're needed, a plain -c or -f run starts without them
 
 # baseado nesses cursos
 # https://www.udemy.com/share/10416o3@N9X6Bjw-H_pG4ToOt2Ziwam5GYDem5TVH65wxJ4zMRYt0RPOS055QUvpe49AeSIW/
 # https://youtube.com/playlist?list=PL_2VhOvlMk4UHGqYCLWc6GO8FaPl8fQTh&si=Z6xQIWjwEH5tTdt2
 
+def fast_path(argv:list[str]) -> bool:
+    """
+    Run `-c CODE` or `-f FILE` without building the argument parser,
+    returns False for anything else and main parses the arguments.
+    """
+    if len(argv) != 2 or argv[0] not in ('-c', '-f') or argv[1].startswith('-'):
+        return False
+    if argv[0] == '-c':
+        code = argv[1]
+    else:
+        try:
+            with open(argv[1]) as f:
+                code = f.read()
+        except OSError:
+            # argparse reports it
+            return False
+
+    interp = Interpreter()
+    interp.set_source(code)
+    interp.exec()
+    return True
+
+
 def main():
+    if fast_path(sys.argv[1:]):
+        return
+
+    import argparse
+    from .streams import BUFFER_MODES
+    from .profiler import FORMATS as PROFILE_FORMATS
+
     pargs = argparse.ArgumentParser('redbasic')
     pargs.add_argument('-c', dest='code', help="parse string")
     pargs.add_argument('-f', dest='file', type=argparse.FileType(), help="Parse file")
     pargs.add_argument('-i', dest='interactive', action='store_true', help="interactive mode, can be combined with -f or -c")
-    pargs.add_argument('--dump', action='append', choices=('ast', 'vars'), help="dump info at program exit")
+    pargs.add_argument('--dump', action='append', choices=('ast', 'vars', 'mem'),
+                       help="dump info at program exit, mem reports memory used by the program and the interpreter")
+    pargs.add_argument('--profile', nargs='?', const='text', choices=PROFILE_FORMATS,
+                       help="print a per line profile to stderr, in text (default), json or collapsed stacks format")
+    pargs.add_argument('--seed', type=int, help="seed for RND, runs with the same seed give the same numbers")
+    pargs.add_argument('--per-record', metavar='FILE',
+                       help="run the program once per line of FILE, the line's tab separated fields are its INPUT")
+    pargs.add_argument('--ensemble', metavar='RUNS', type=int,
+                       help="run the program RUNS times with RND seeded seed-base, seed-base+1... and summarize its variables")
+    pargs.add_argument('--seed-base', type=int, default=0, help="first seed of --ensemble")
+    pargs.add_argument('--vars', help="comma separated variables --ensemble summarizes, default is all numeric ones")
+    pargs.add_argument('-j', dest='jobs', type=int, help="worker processes for --per-record and --ensemble, default is one per CPU")
+    pargs.add_argument('--metrics', metavar='FILE', help="write runtime counters to FILE in OpenMetrics text format at exit")
+    pargs.add_argument('--buffer', choices=BUFFER_MODES, help="output buffering, default is line for terminals and full otherwise")
+
+    sub = pargs.add_subparsers(dest='command')
+    prun = sub.add_parser('run', help="run many scripts in a pool of worker processes")
+    prun.add_argument('files', nargs='*', help="scripts to run, INPUT comes from name.in next to each one if it exists")
+    prun.add_argument('-m', dest='manifest', help="file listing jobs, one `script [stdin [stdout]]` per line")
+    prun.add_argument('-j', dest='jobs', type=int, help="worker processes, default is one per CPU")
+    prun.add_argument('-o', dest='output_dir', help="write the output of each script to OUTPUT_DIR/name.out")
+    prun.add_argument('--timeout', type=float, help="seconds a script may run")
 
     args = pargs.parse_args()
+    if args.command == 'run':
+        exit(run(args))
+
+    if args.dump and 'mem' in args.dump:
+        import tracemalloc
+        tracemalloc.start()
     p = Parser()
 
+    parse_start = time.perf_counter()
     if args.code:
         Ast = p.parse(args.code)
     elif args.file:
         text = args.file.read()
         Ast = p.parse(text)
+    parse_time = time.perf_counter() - parse_start
 
+    if args.per_record:
+        exit(per_record(Ast, args))
+    if args.ensemble:
+        from . import batch
+        names = args.vars.split(',') if args.vars else None
+        result = batch.run_ensemble(Ast, args.ensemble, args.seed_base, names, args.jobs)
+        print(result.format())
+        exit(int(bool(result.errors)))
 
     if args.interactive:
         prog = Ast if (args.code or args.file) else ast.Program([])
         repl(prog)
         exit()
 
-    interp = Interpreter()
+    interp = Interpreter(buffering=args.buffer, seed=args.seed)
+    interp.parser = p
     interp.ast = Ast
-    interp.exec()
+    interp.metrics.parse_seconds += parse_time
+    try:
+        if args.profile:
+            prof = interp.profile()
+            print(prof.format(Ast, args.profile), file=sys.stderr)
+        else:
+            interp.exec()
+    finally:
+        if args.metrics:
+            from .metrics import to_openmetrics
+            with open(args.metrics, 'w') as f:
+                f.write(to_openmetrics(interp.stats()))
 
     if args.dump:
+        import pprint
         if 'ast' in args.dump:
             pprint.pp(Ast)
         if 'vars' in args.dump:
             pprint.pp(interp.variables)
+        if 'mem' in args.dump:
+            report = interp.memory_report(tracemalloc.take_snapshot())
+            print(report.format(Ast))
+
+
+def run(args):
+    "run subcommand, the exit status is 1 if any job failed"
+    import os
+    from . import batch
+    jobs = [ batch.make_job(f, output_dir=args.output_dir, timeout=args.timeout) for f in args.files ]
+    if args.manifest:
+        jobs += batch.read_manifest(args.manifest, args.output_dir, args.timeout)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    results = list(batch.run_batch(jobs, args.jobs))
+    print(batch.summary(results))
+    return int(any(r.status != 'ok' for r in results))
+
+
+def per_record(program:ast.Program, args):
+    "--per-record, outputs are written in record order, the exit status is 1 if any run failed"
+    from . import batch
+    failed = 0
+    records = batch.read_records(args.per_record)
+    for n, (output, err) in enumerate(batch.run_records(program, records, args.jobs, seed=args.seed), 1):
+        sys.stdout.write(output)
+        if err:
+            failed += 1
+            print(f"record {n}: {err}", file=sys.stderr)
+    return int(failed > 0)
 
 
 if __name__=='__main__':
@@ -0,0 +1,66 @@
+# redbasic asyncio support
+import asyncio, io
+from .interpreter import Interpreter, DONE, WAITING
+from .streams import FeedReader
+
+# statements run between chances for other tasks to run
+SLICE = 1000
+
+
+class WriterStream:
+    "text stream over an asyncio StreamWriter, exec_async drains it"
+
+    def __init__(self, writer:asyncio.StreamWriter, encoding:str='utf-8'):
+        self.writer = writer
+        self.encoding = encoding
+
+    def write(self, text:str):
+        self.writer.write(text.encode(self.encoding))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+
+class AsyncInterpreter(Interpreter):
+    """
+    Interpreter for asyncio hosts, it runs programs with exec_async. The
+    program gives way to other tasks while INPUT waits for a line, while
+    its output is drained, and every slice statements.
+    """
+
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter, slice:int=SLICE,
+                 encoding:str='utf-8', **kwargs):
+        super().__init__(textout=WriterStream(writer, encoding), textin=io.StringIO(), **kwargs)
+        self.stream_reader = reader
+        self.stream_writer = writer
+        self.encoding = encoding
+        self.slice = slice
+        self.reader = FeedReader()
+
+    async def exec_async(self):
+        self.begin()
+        while True:
+            status = self.run_for(self.slice)
+            if status == DONE:
+                await self.stream_writer.drain()
+                return
+
+            if status == WAITING:
+                await self.stream_writer.drain()
+                line = await self.stream_reader.readline()
+                if line:
+                    self.reader.feed(line.decode(self.encoding))
+                else:
+                    self.reader.close()
+            else:
+                self.flush()
+                await self.stream_writer.drain()
+                # drain only waits when the transport is full
+                await asyncio.sleep(0)
@@ -0,0 +1,100 @@
+# redbasic arrays
+from array import array
+from math import prod
+
+# typecodes of the storage, every element of an array has the same kind
+INT_CODE = 'q'
+FLOAT_CODE = 'd'
+
+
+def _integral(value, name:str) -> int:
+    "subscripts and bounds are whole numbers, 2.0 is accepted as 2"
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+        raise IndexError(f"bad subscript {value!r} for {name}()")
+    return int(value)
+
+
+class Array:
+    """
+    Numbers of a DIM statement in contiguous storage. DIM A(N, M) has
+    (N+1)*(M+1) elements, subscripts go from 0 to their bound and the
+    last one varies fastest. Elements start as 0 in an int64 array,
+    storing a float converts it to float64 once.
+    """
+    __slots__ = ('name', 'bounds', 'data', '_strides')
+
+    def __init__(self, name:str, bounds:tuple[int, ...], data:array=None):
+        "data is the storage to use, it's zeroed int64 storage when it's None"
+        bounds = tuple(_integral(b, name) for b in bounds)
+        if not bounds or any(b < 0 for b in bounds):
+            raise ValueError(f"bad bounds {bounds} for {name}()")
+        self.name = name
+        self.bounds = bounds
+        size = prod(b + 1 for b in bounds)
+        if data is None:
+            data = array(INT_CODE, bytes(array(INT_CODE).itemsize * size))
+        elif len(data) != size or data.typecode not in (INT_CODE, FLOAT_CODE):
+            raise ValueError(f"{name}() needs {size} numbers, got {len(data)} of type {data.typecode!r}")
+        self.data = data
+
+        strides = []
+        stride = 1
+        for b in reversed(bounds):
+            strides.append(stride)
+            stride *= b + 1
+        self._strides = tuple(reversed(strides))
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(b + 1 for b in self.bounds)
+
+    def offset(self, subscripts:list) -> int:
+        "position of an element in data, IndexError when it's out of bounds"
+        bounds = self.bounds
+        if len(subscripts) == 1 == len(bounds):
+            # the common case, no loop
+            i = subscripts[0]
+            if type(i) is not int:
+                i = _integral(i, self.name)
+            if 0 <= i <= bounds[0]:
+                return i
+            raise IndexError(f"subscript out of range: {self.name}({i})")
+
+        if len(subscripts) != len(bounds):
+            raise IndexError(f"{self.name}() has {len(bounds)} dimensions, got {len(subscripts)} subscripts")
+        offset = 0
+        for i, bound, stride in zip(subscripts, bounds, self._strides):
+            if type(i) is not int:
+                i = _integral(i, self.name)
+            if not 0 <= i <= bound:
+                raise IndexError(f"subscript out of range: {self.name}({', '.join(map(str, subscripts))})")
+            offset += i * stride
+        return offset
+
+    def get(self, subscripts:list):
+        return self.data[self.offset(subscripts)]
+
+    def set(self, subscripts:list, value):
+        self.store(self.offset(subscripts), value)
+
+    def store(self, offset:int, value):
+        try:
+            self.data[offset] = value
+        except TypeError:
+            if not isinstance(value, float) or self.data.typecode != INT_CODE:
+                raise TypeError(f"{self.name}() holds numbers, not {type(value).__name__}") from None
+            self.data = array(FLOAT_CODE, self.data)
+            self.data[offset] = value
+        except OverflowError:
+            raise OverflowError(f"{value} doesn't fit in {self.name}()") from None
+
+    def numpy(self):
+        "NumPy view of the elements in shape, it shares the storage until a float converts it"
+        import numpy
+        return numpy.frombuffer(self.data, dtype=self.data.typecode).reshape(self.shape)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"Array({self.name!r}, {self.bounds}, {self.data.typecode!r})"
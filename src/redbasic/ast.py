@@ -1,7 +1,7 @@
 # redbasic AST
 import io, functools
-from dataclasses import dataclass
-from typing import TextIO
+from dataclasses import dataclass, field
+from typing import TextIO, Callable
 
 # --- base classes ---
 class Ast:
@@ -45,8 +45,19 @@ class BinaryExpr(Expr):
 class LogicalExpr(BinaryExpr):
     pass
 
+@dataclass
+class Subscript(Expr):
+    "element of an array, A(I) or A(I, J)"
+    name:str
+    indexes:list[Expr]
+
+    @property
+    def key(self):
+        "the array's entry in Interpreter.versions, apart from a variable of the same name"
+        return self.name + '()'
+
 class AssignmentExpr(BinaryExpr):
-    left:Identifier
+    left:Identifier|Subscript
 
 
 @dataclass
@@ -78,6 +89,8 @@ class UnaryExpr(Expr):
 class Func(Expr):
     name:str
     arguments:list[Expr]
+    # implementation, bound by Interpreter.link
+    impl:Callable = field(default=None, compare=False, repr=False)
 
 # --- statements ---
 @dataclass
@@ -98,7 +111,8 @@ class Label(Line):
     """
     def __init__(self, statement:Stmt, name:str):
         self.name = name
-        super().__init__(statement, hash(name))
+        # keyed by its name, hash() of a str changes from process to process
+        super().__init__(statement, name)
 
 @dataclass
 class Program(Stmt):
@@ -127,7 +141,7 @@ class PrintStmt(Stmt):
 
 @dataclass
 class InputStmt(Stmt):
-    varlist:list[Identifier]
+    varlist:list[Identifier|Subscript]
 
 @dataclass
 class GotoStmt(Stmt):
@@ -136,6 +150,70 @@ class GotoStmt(Stmt):
 class GosubStmt(GotoStmt):
     pass
 
+@dataclass
+class DimStmt(Stmt):
+    """
+    Arrays with the upper bounds of their subscripts
+        DIM A(10), B(3, 4)
+    """
+    arrays:list[Subscript]
+
+@dataclass
+class MatStmt(Stmt):
+    """
+    Whole array assignment from other arrays
+        MAT C = A          copy
+        MAT C = A + B      element by element, and A - B
+        MAT C = A * B      matrix product
+    """
+    target:str
+    left:str
+    operator:str = None
+    right:str = None
+
+@dataclass
+class MatScaleStmt(Stmt):
+    """
+    Whole array times a number
+        MAT C = (K) * A
+    """
+    target:str
+    factor:Expr
+    source:str
+
+@dataclass
+class MatFillStmt(Stmt):
+    """
+    Array of zeros, ones or the identity matrix, kind is 'zer', 'con' or
+    'idn'. Without bounds the array keeps the shape it has.
+        MAT A = ZER
+        MAT I = IDN(3, 3)
+    """
+    target:str
+    kind:str
+    bounds:list[Expr] = None
+
+@dataclass
+class ForStmt(Stmt):
+    """
+    Counted loop up to the matching NEXT, limit and step are evaluated once
+        FOR I = 1 TO N STEP 2
+    """
+    var:Identifier
+    start:Expr
+    limit:Expr
+    step:Expr = None
+    # body index past the matching NEXT where a loop that doesn't run at all
+    # goes, set when the program is linked
+    target:int = field(default=None, compare=False)
+
+@dataclass
+class NextStmt(Stmt):
+    "end of the innermost FOR loop, or of the one on var"
+    var:Identifier = None
+    # body index of the matching FOR's first statement, set when the program is linked
+    target:int = field(default=None, compare=False)
+
 @dataclass
 class ExpressionStmt(Stmt):
     expression:Expr
@@ -167,6 +245,55 @@ class ListStmt(InteractiveStmt):
 class NewStmt(Empty, InteractiveStmt):
     pass
 
+# --- optimizer statements ---
+# made by the optimizer, the parser never produces these
+
+@dataclass
+class BlockStmt(Stmt):
+    "statements that run in sequence, the optimizer makes them of inlined subroutines"
+    statements:list[Stmt]
+
+@dataclass
+class AccumulateStmt(Stmt):
+    """
+    In place update of a variable
+        S = S + X
+        S += X
+    """
+    name:str
+    operator:str
+    value:Expr
+
+@dataclass
+class IncrementBranchStmt(Stmt):
+    """
+    Counter update followed by a conditional jump
+        I = I + 1
+        IF I < N THEN GOTO 30
+    """
+    name:str
+    operator:str
+    step:Expr
+    relation:str
+    limit:Expr
+    destination:Expr
+    target:int
+
+@dataclass
+class PrintTextStmt(Stmt):
+    "PRINT of literals only, the output is rendered ahead of time"
+    text:str
+
+@dataclass
+class CachedExpr(Expr):
+    """
+    Pure expression whose value is reused until one of
+    the variables it depends on is assigned again
+    """
+    expression:Expr
+    deps:tuple[str, ...]
+    slot:int
+
 # reconstruct util
 
 def reconstruct_expr(expr, ss:TextIO=None):
@@ -180,10 +307,15 @@ def reconstruct_expr(expr, ss:TextIO=None):
             for e in expr:
                 reconstruct_expr(e, ss)
                 ss.write(',')
-            pos = ss.tell()
-            ss.truncate(pos-1) # remove last ,
+            if expr:
+                ss.seek(ss.tell()-1) # remove last ,
+                ss.truncate()
         case Identifier():
             ss.write(expr.name)
+        case Subscript():
+            ss.write(f'{expr.name}(')
+            reconstruct_expr(expr.indexes, ss)
+            ss.write(')')
         case Func():
             ss.write(f'{expr.name}(')
             reconstruct_expr(expr.arguments, ss)
@@ -200,6 +332,8 @@ def reconstruct_expr(expr, ss:TextIO=None):
             reconstruct_expr(expr.left, ss)
             ss.write(expr.operator)
             reconstruct_expr(expr.right, ss)
+        case CachedExpr():
+            reconstruct_expr(expr.expression, ss)
         case _:
             raise RuntimeError(f"cannot recontruct {expr!r}")
     
@@ -222,12 +356,12 @@ def reconstruct_stmt(stmt:Stmt, ss:TextIO=None):
         case InputStmt():
             ss.write("input ")
             recon(stmt.varlist)
-        case GotoStmt():
-            ss.write("goto ")
-            recon(stmt.destination)
         case GosubStmt():
             ss.write("gosub ")
             recon(stmt.destination)
+        case GotoStmt():
+            ss.write("goto ")
+            recon(stmt.destination)
         case VariableDecl():
             ss.write('let ')
             recon(stmt.iden)
@@ -241,6 +375,38 @@ def reconstruct_stmt(stmt:Stmt, ss:TextIO=None):
             if stmt.alternate:
                 ss.write(' else ')
                 reconstruct_stmt(stmt.alternate, ss)
+        case DimStmt():
+            ss.write('dim ')
+            recon(stmt.arrays)
+        case MatStmt():
+            ss.write(f'mat {stmt.target}={stmt.left}')
+            if stmt.operator:
+                ss.write(f'{stmt.operator}{stmt.right}')
+        case MatScaleStmt():
+            ss.write(f'mat {stmt.target}=(')
+            recon(stmt.factor)
+            ss.write(f')*{stmt.source}')
+        case MatFillStmt():
+            ss.write(f'mat {stmt.target}={stmt.kind}')
+            if stmt.bounds:
+                ss.write('(')
+                recon(stmt.bounds)
+                ss.write(')')
+        case ForStmt():
+            ss.write('for ')
+            recon(stmt.var)
+            ss.write('=')
+            recon(stmt.start)
+            ss.write(' to ')
+            recon(stmt.limit)
+            if stmt.step is not None:
+                ss.write(' step ')
+                recon(stmt.step)
+        case NextStmt():
+            ss.write('next')
+            if stmt.var is not None:
+                ss.write(' ')
+                recon(stmt.var)
         case ExpressionStmt():
             recon(stmt.expression)
         case ReturnStmt():
@@ -251,11 +417,31 @@ def reconstruct_stmt(stmt:Stmt, ss:TextIO=None):
             ss.write('end')
         case RunStmt():
             ss.write('run')
+        case NewStmt():
+            ss.write('new')
         case ListStmt():
             ss.write('list ')
             if stmt.arguments:
                 recon(stmt.arguments)
             ss.write(stmt.mode)
+        case BlockStmt():
+            for i, s in enumerate(stmt.statements):
+                if i:
+                    ss.write(' : ')
+                reconstruct_stmt(s, ss)
+        case AccumulateStmt():
+            ss.write(f'{stmt.name}{stmt.operator}=')
+            recon(stmt.value)
+        case IncrementBranchStmt():
+            ss.write(f'{stmt.name}{stmt.operator}=')
+            recon(stmt.step)
+            ss.write(f' : if {stmt.name}{stmt.relation}')
+            recon(stmt.limit)
+            ss.write(' then goto ')
+            recon(stmt.destination)
+        case PrintTextStmt():
+            ss.write('print ')
+            recon(StringLiteral(stmt.text.removesuffix('\n')))
         case None:
             # BUG?
             pass
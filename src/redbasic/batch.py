@@ -0,0 +1,344 @@
+# redbasic batch runner
+import os, io, time, math, itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from . import ast
+from .interpreter import Interpreter, DONE
+
+# most statements run between timeout checks
+SLICE = 10_000
+
+# seconds a slice should take, slices shrink when their statements are slow
+# and grow back up to SLICE when they're fast
+SLICE_SECONDS = 0.01
+
+# chunks of work in flight per worker
+WINDOW = 4
+
+# records sent to a worker at a time
+RECORD_CHUNK = 64
+
+# ensemble runs sent to a worker at a time
+ENSEMBLE_CHUNK = 100
+
+
+@dataclass
+class Job:
+    "a script to run, with the files it reads INPUT from and PRINTs to"
+    path:str
+    stdin:str = None
+    stdout:str = None
+    # seconds, None for no limit
+    timeout:float = None
+
+
+@dataclass
+class JobResult:
+    path:str
+    # ok, error or timeout
+    status:str
+    seconds:float
+    statements:int = 0
+    error:str = ''
+
+
+def run_job(job:Job) -> JobResult:
+    "run a job in this process, errors are reported in the result"
+    start = time.perf_counter()
+    interp = None
+    status, err = 'ok', ''
+    # a missing or unwritable file fails the job, not the batch
+    try:
+        with (open(job.stdin or os.devnull) as stdin,
+              open(job.stdout or os.devnull, 'w') as stdout):
+            interp = Interpreter(textout=stdout, textin=stdin)
+            with open(job.path) as f:
+                interp.set_source(f.read())
+            interp.begin()
+            # the budget lets us check the clock without signals, it starts
+            # small so a program of slow statements can't overrun the timeout
+            budget = 1
+            while True:
+                started = time.perf_counter()
+                if interp.run_for(budget) == DONE:
+                    break
+                now = time.perf_counter()
+                if job.timeout is not None and now - start > job.timeout:
+                    status = 'timeout'
+                    break
+                took = now - started
+                if took > SLICE_SECONDS:
+                    budget = max(1, int(budget * SLICE_SECONDS / took))
+                else:
+                    budget = min(SLICE, budget * 2)
+    except Exception as e:
+        status, err = 'error', f'{type(e).__name__}: {e}'
+
+    statements = interp.metrics.statements if interp is not None else 0
+    return JobResult(job.path, status, time.perf_counter() - start, statements, err)
+
+
+def _warm_up():
+    "pool initializer, the first job doesn't pay for setting up the parser"
+    with open(os.devnull, 'w') as out, open(os.devnull) as inp:
+        Interpreter(textout=out, textin=inp).set_source('10 print 1')
+
+
+def run_batch(jobs:list[Job], workers:int=None):
+    "run jobs in a pool of worker processes, results come in the order of jobs"
+    jobs = list(jobs)
+    if workers == 1:
+        yield from map(run_job, jobs)
+        return
+
+    workers = workers or os.cpu_count()
+    # small jobs are handed out in chunks to save round trips to the workers
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(workers, initializer=_warm_up) as pool:
+        yield from pool.map(run_job, jobs, chunksize=chunksize)
+
+
+def make_job(path:str, stdin:str=None, stdout:str=None, output_dir:str=None, timeout:float=None) -> Job:
+    """
+    Job with the default files: INPUT comes from name.in next to the
+    script when there is one, output goes to name.out in output_dir.
+    """
+    base, _ = os.path.splitext(path)
+    if stdin is None and os.path.exists(base + '.in'):
+        stdin = base + '.in'
+    if stdout is None and output_dir is not None:
+        stdout = os.path.join(output_dir, os.path.basename(base) + '.out')
+    return Job(path, stdin, stdout, timeout)
+
+
+def read_manifest(path:str, output_dir:str=None, timeout:float=None) -> list[Job]:
+    """
+    Jobs listed in a manifest, one per line as `script [stdin [stdout]]`.
+    Paths are relative to the manifest, # starts a comment.
+    """
+    root = os.path.dirname(path)
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            fields = line.partition('#')[0].split()
+            if not fields:
+                continue
+            fields = [ os.path.join(root, p) for p in fields ]
+            jobs.append(make_job(*fields[:3], output_dir=output_dir, timeout=timeout))
+    return jobs
+
+
+def summary(results:list[JobResult]) -> str:
+    out = [f"{'status':<8} {'ms':>9} {'statements':>11}  script"]
+    counts = {}
+    total = 0.0
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+        total += r.seconds
+        out.append(f"{r.status:<8} {r.seconds*1e3:>9.1f} {r.statements:>11}  {r.path}" + (f"  {r.error}" if r.error else ''))
+    out.append('')
+    out.append(f"{len(results)} jobs, " + ', '.join(f'{n} {status}' for status, n in sorted(counts.items()))
+               + f", {total:.3f} s of job time")
+    return '\n'.join(out)
+
+
+# --- one program, many records ---
+
+# the interpreter of a worker process, linked to the program it runs over and over,
+# and the seed RND starts from on every run, None for one from the OS
+_worker_interp:Interpreter = None
+_worker_seed:int = None
+
+def program_interpreter(program:ast.Program, seed:int=None) -> Interpreter:
+    "interpreter with program linked, to run it many times with fresh_run"
+    interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(), seed=seed)
+    interp.ast = program
+    interp.link()
+    return interp
+
+def _init_program_worker(program:ast.Program, seed:int=None):
+    "pool initializer, every worker links the program once"
+    global _worker_interp, _worker_seed
+    _worker_interp = program_interpreter(program, seed)
+    _worker_seed = seed
+
+def fresh_run(interp:Interpreter, stdin:str='', seed:int=None) -> str|None:
+    """
+    run the program from a clean slate, returns the error if it failed.
+    RND starts over from seed when it's given.
+    """
+    out = interp.output
+    out.seek(0)
+    out.truncate()
+    if seed is not None:
+        interp.rng.seed(seed)
+    try:
+        interp.run(input=stdin)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+def _ordered(pool:ProcessPoolExecutor, func, parts, window:int):
+    "results of func over parts in order, with at most window calls in flight"
+    pending = deque()
+    for part in parts:
+        pending.append(pool.submit(func, part))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def run_record(interp:Interpreter, fields:list[str], seed:int=None) -> tuple[str, str]:
+    "output of a fresh run with fields as the INPUT lines, and the error if it failed"
+    err = fresh_run(interp, '\n'.join(fields), seed)
+    return interp.output.getvalue(), err or ''
+
+def _run_record_chunk(chunk:list[list[str]]):
+    return [ run_record(_worker_interp, fields, _worker_seed) for fields in chunk ]
+
+
+def read_records(path:str):
+    "records of a file, one per line, its tab separated fields are the INPUT lines"
+    with open(path) as f:
+        for line in f:
+            yield line.rstrip('\n').split('\t')
+
+
+def run_records(program:ast.Program, records, workers:int=None, chunk:int=RECORD_CHUNK, window:int=WINDOW,
+                seed:int=None):
+    """
+    Run program once per record, yielding (output, error) in the order of
+    records. Records are read as they're needed and at most window chunks
+    per worker are in flight, so memory stays bounded for any input size.
+    With a seed every run starts RND from it, the output doesn't depend
+    on the workers.
+    """
+    if workers == 1:
+        interp = program_interpreter(program, seed)
+        for fields in records:
+            yield run_record(interp, fields, seed)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers, initializer=_init_program_worker, initargs=(program, seed)) as pool:
+        for results in _ordered(pool, _run_record_chunk, itertools.batched(records, chunk), window * workers):
+            yield from results
+
+
+# --- one program, many seeds ---
+
+@dataclass
+class Summary:
+    "running count, mean, spread and range of a variable, mergeable across workers"
+    count:int = 0
+    mean:float = 0.0
+    # sum of squared differences from the mean
+    m2:float = 0.0
+    min:float = math.inf
+    max:float = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other:'Summary'):
+        count = self.count + other.count
+        if not count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+@dataclass
+class EnsembleResult:
+    runs:int = 0
+    # variable name -> summary of its final values
+    summaries:dict[str, Summary] = field(default_factory=dict)
+    # (seed, error) of the runs that failed
+    errors:list[tuple[int, str]] = field(default_factory=list)
+
+    def merge(self, other:'EnsembleResult'):
+        self.runs += other.runs
+        for name, summary in other.summaries.items():
+            self.summaries.setdefault(name, Summary()).merge(summary)
+        self.errors += other.errors
+
+    def format(self) -> str:
+        out = [f"{'variable':<12} {'mean':>14} {'std':>14} {'min':>14} {'max':>14} {'runs':>8}"]
+        for name, s in sorted(self.summaries.items()):
+            out.append(f"{name:<12} {s.mean:>14.6g} {s.std:>14.6g} {s.min:>14.6g} {s.max:>14.6g} {s.count:>8}")
+        out.append('')
+        out.append(f"{self.runs} runs, {len(self.errors)} failed")
+        return '\n'.join(out)
+
+
+def run_seed(interp:Interpreter, seed:int) -> str|None:
+    "a fresh run with RND seeded with seed, returns the error if it failed"
+    interp.rng.seed(seed)
+    return fresh_run(interp)
+
+def _ensemble_chunk(interp:Interpreter, seeds, names, keep):
+    result = EnsembleResult()
+    runs = []
+    for seed in seeds:
+        err = run_seed(interp, seed)
+        result.runs += 1
+        if err:
+            result.errors.append((seed, err))
+            continue
+        variables = interp.variables
+        for name in (variables if names is None else names):
+            value = variables.get(name)
+            if isinstance(value, (int, float)):
+                result.summaries.setdefault(name, Summary()).add(value)
+        if keep:
+            runs.append((seed, dict(variables), interp.output.getvalue()))
+    return result, runs
+
+def _run_ensemble_chunk(args):
+    return _ensemble_chunk(_worker_interp, *args)
+
+
+def run_ensemble(program:ast.Program, runs:int, seed_base:int=0, names:list[str]=None, workers:int=None,
+                 each=None, chunk:int=ENSEMBLE_CHUNK) -> EnsembleResult:
+    """
+    Run program once per seed from seed_base to seed_base+runs-1 and
+    summarize the final values of the variables in names, all numeric
+    ones when it's None. Workers send back summaries, not runs, unless
+    each is given: it's called as each(seed, variables, output) for
+    every successful run, in seed order.
+    """
+    result = EnsembleResult()
+    parts = ( (part, names, each is not None) for part in itertools.batched(range(seed_base, seed_base + runs), chunk) )
+
+    if workers == 1:
+        interp = program_interpreter(program)
+        done = ( _ensemble_chunk(interp, *args) for args in parts )
+        pool = None
+    else:
+        workers = workers or os.cpu_count()
+        pool = ProcessPoolExecutor(workers, initializer=_init_program_worker, initargs=(program,))
+        done = _ordered(pool, _run_ensemble_chunk, parts, WINDOW * workers)
+
+    try:
+        for partial, outputs in done:
+            result.merge(partial)
+            for run in outputs:
+                each(*run)
+    finally:
+        if pool:
+            pool.shutdown()
+    return result
@@ -0,0 +1,325 @@
+# redbasic control flow graph
+import bisect, copy
+from dataclasses import dataclass, field, replace
+from . import ast
+
+# successor markers for edges that can't be resolved statically
+RETURN_EDGE = 'return'
+DYNAMIC_EDGE = '?'
+
+
+@dataclass
+class BasicBlock:
+    """
+    A straight run of lines with one entry and one exit.
+    start and stop are indexes into the program body, only the
+    statement on the last line can transfer control.
+    """
+    start:int
+    stop:int
+    statements:list[ast.Stmt]
+    successors:list[int|str] = field(default_factory=list)
+    # source statements the block stands for, see source_count
+    size:int = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.size = sum(map(source_count, self.statements))
+
+    @property
+    def last(self):
+        return self.stop - 1
+
+
+def source_count(stmt:ast.Stmt) -> int:
+    """
+    Statements of the source that stmt runs in place of. A fused increment
+    and branch is two, an inlined subroutine counts the rest of its own
+    when it runs, like the GOSUB it replaces.
+    """
+    return 2 if isinstance(stmt, ast.IncrementBranchStmt) else 1
+
+
+def is_terminator(stmt:ast.Stmt):
+    "statements that can change the flow of execution end a block"
+    return isinstance(stmt, (ast.GotoStmt, ast.ReturnStmt, ast.EndStmt, ast.IfStmt,
+                             ast.RunStmt, ast.NewStmt, ast.IncrementBranchStmt,
+                             ast.ForStmt, ast.NextStmt))
+
+def iter_jumps(stmt:ast.Stmt):
+    "GOTO/GOSUB statements in stmt, including the ones nested in IFs"
+    match stmt:
+        case ast.GotoStmt() | ast.IncrementBranchStmt():
+            yield stmt
+        case ast.IfStmt():
+            yield from iter_jumps(stmt.consequent)
+            yield from iter_jumps(stmt.alternate)
+
+def iter_loop_ends(stmt:ast.Stmt):
+    "FOR/NEXT statements in stmt, including the ones nested in IFs"
+    match stmt:
+        case ast.ForStmt() | ast.NextStmt():
+            yield stmt
+        case ast.IfStmt():
+            yield from iter_loop_ends(stmt.consequent)
+            yield from iter_loop_ends(stmt.alternate)
+
+def iter_assigned(stmt:ast.Stmt):
+    "names of the variables a statement can write to"
+    match stmt:
+        case ast.VariableDecl():
+            yield stmt.iden.name
+            yield from _assigned_in_expr(stmt.init)
+        case ast.InputStmt():
+            for var in stmt.varlist:
+                if isinstance(var, ast.Subscript):
+                    yield var.key
+                    yield from _assigned_in_expr(var.indexes)
+                else:
+                    yield var.name
+        case ast.DimStmt():
+            for array in stmt.arrays:
+                yield array.key
+                yield from _assigned_in_expr(array.indexes)
+        case ast.AccumulateStmt() | ast.IncrementBranchStmt():
+            yield stmt.name
+            yield from _assigned_in_expr(list(iter_exprs(stmt)))
+        case ast.ForStmt():
+            yield stmt.var.name
+            yield from _assigned_in_expr(list(iter_exprs(stmt)))
+        case ast.MatStmt() | ast.MatScaleStmt() | ast.MatFillStmt():
+            yield stmt.target + '()'
+            yield from _assigned_in_expr(list(iter_exprs(stmt)))
+        case ast.NextStmt():
+            if stmt.var is not None:
+                yield stmt.var.name
+        case ast.BlockStmt():
+            for s in stmt.statements:
+                yield from iter_assigned(s)
+        case ast.IfStmt():
+            yield from _assigned_in_expr(stmt.test)
+            yield from iter_assigned(stmt.consequent)
+            yield from iter_assigned(stmt.alternate)
+        case ast.Stmt():
+            for expr in iter_exprs(stmt):
+                yield from _assigned_in_expr(expr)
+
+def iter_exprs(stmt:ast.Stmt):
+    "top level expressions of a statement"
+    match stmt:
+        case ast.ExpressionStmt():
+            yield stmt.expression
+        case ast.VariableDecl():
+            yield stmt.init
+        case ast.PrintStmt():
+            for item in stmt.printlist:
+                yield item.expression
+        case ast.GotoStmt():
+            yield stmt.destination
+        case ast.IfStmt():
+            yield stmt.test
+        case ast.AccumulateStmt():
+            yield stmt.value
+        case ast.IncrementBranchStmt():
+            yield stmt.step
+            yield stmt.limit
+        case ast.MatScaleStmt():
+            yield stmt.factor
+        case ast.MatFillStmt():
+            if stmt.bounds is not None:
+                yield stmt.bounds
+        case ast.ForStmt():
+            yield stmt.start
+            yield stmt.limit
+            if stmt.step is not None:
+                yield stmt.step
+
+def _assigned_in_expr(expr):
+    match expr:
+        case list():
+            for e in expr:
+                yield from _assigned_in_expr(e)
+        case ast.AssignmentExpr():
+            if isinstance(expr.left, ast.Subscript):
+                yield expr.left.key
+                yield from _assigned_in_expr(expr.left.indexes)
+            else:
+                yield expr.left.name
+            yield from _assigned_in_expr(expr.right)
+        case ast.Subscript():
+            yield from _assigned_in_expr(expr.indexes)
+        case ast.BinaryExpr():
+            yield from _assigned_in_expr(expr.left)
+            yield from _assigned_in_expr(expr.right)
+        case ast.UnaryExpr():
+            yield from _assigned_in_expr(expr.argument)
+        case ast.Func():
+            yield from _assigned_in_expr(expr.arguments)
+
+
+class ControlFlowGraph:
+    "basic blocks of a program"
+
+    def __init__(self, program:ast.Program):
+        self.program = program
+        self.blocks:list[BasicBlock] = []
+        # linenum -> body index, labels are keyed by their name
+        self.index:dict[int|str, int] = {}
+        # variables written anywhere in the program
+        self.assigned:set[str] = set()
+        self._entries:dict[int, BasicBlock] = {}
+        self._starts:list[int] = []
+
+    def resolve(self, dest:ast.Expr):
+        "body index of a static jump destination, None if it's only known at runtime"
+        match dest:
+            case ast.IntLiteral():
+                return self.index.get(dest.value)
+            case ast.Identifier() if dest.name not in self.assigned:
+                return self.index.get(dest.name)
+        return None
+
+    def entry(self, start:int) -> BasicBlock:
+        "block beginning at body index start, jumping mid-block yields the block's tail"
+        try:
+            return self._entries[start]
+        except KeyError:
+            pass
+
+        block = self.block_of(start)
+        body = self.program.body
+        tail = BasicBlock(start, block.stop,
+                          [line.statement for line in body[start:block.stop] if line.statement is not None],
+                          block.successors)
+        self._entries[start] = tail
+        return tail
+
+    def is_leader(self, index:int):
+        "a block starts at body index"
+        i = bisect.bisect_left(self._starts, index)
+        return i < len(self._starts) and self._starts[i] == index
+
+    def block_of(self, index:int) -> BasicBlock:
+        "block that contains body index"
+        i = bisect.bisect_right(self._starts, index) - 1
+        return self.blocks[i]
+
+    def dump(self):
+        "human readable listing of the graph"
+        names = { b.start: f'B{i}' for i,b in enumerate(self.blocks) }
+        out = []
+        for i, block in enumerate(self.blocks):
+            succ = ', '.join(names.get(s, s) for s in block.successors) or 'exit'
+            out.append(f'B{i} [{block.start}:{block.stop}] -> {succ}')
+            lines = ast.Program(self.program.body[block.start:block.stop])
+            for src in ast.reconstruct(lines).splitlines():
+                out.append(f'    {src}')
+        return '\n'.join(out)
+
+
+def build_cfg(program:ast.Program) -> ControlFlowGraph:
+    "split a program into basic blocks"
+    cfg = ControlFlowGraph(program)
+    body = program.body
+    n = len(body)
+
+    for i, line in enumerate(body):
+        if line.linenum:
+            cfg.index.setdefault(line.linenum, i)
+
+    for line in body:
+        cfg.assigned.update(iter_assigned(line.statement))
+
+    # find leaders, a block starts at each one of them
+    leaders = {0} if n else set()
+    dynamic = False
+    for i, line in enumerate(body):
+        stmt = line.statement
+        if isinstance(line, ast.Label):
+            leaders.add(i)
+        if is_terminator(stmt):
+            leaders.add(i+1)
+        for jump in iter_jumps(stmt):
+            dest = cfg.resolve(jump.destination)
+            if dest is None:
+                dynamic = True
+            else:
+                leaders.add(dest)
+        for end in iter_loop_ends(stmt):
+            if end.target is None:
+                dynamic = True
+            else:
+                leaders.add(end.target)
+
+    if dynamic:
+        # a computed goto can land on any numbered line
+        leaders.update(i for i, line in enumerate(body) if line.linenum)
+
+    cfg._starts = sorted(x for x in leaders if x < n)
+    bounds = cfg._starts + [n]
+
+    for start, stop in zip(bounds, bounds[1:]):
+        stmts = [line.statement for line in body[start:stop] if line.statement is not None]
+        block = BasicBlock(start, stop, stmts)
+        block.successors = _successors(cfg, body[stop-1].statement, stop)
+        cfg.blocks.append(block)
+        cfg._entries[start] = block
+
+    return cfg
+
+def _successors(cfg:ControlFlowGraph, stmt:ast.Stmt, fallthrough:int):
+    succ = []
+    falls = True
+    match stmt:
+        case ast.GosubStmt():
+            pass
+        case ast.GotoStmt():
+            falls = False
+        case ast.ReturnStmt():
+            succ.append(RETURN_EDGE)
+            falls = False
+        case ast.EndStmt() | ast.NewStmt():
+            falls = False
+        case ast.RunStmt():
+            succ.append(0)
+            falls = False
+        case ast.IfStmt():
+            if isinstance(stmt.consequent, ast.ReturnStmt) or isinstance(stmt.alternate, ast.ReturnStmt):
+                succ.append(RETURN_EDGE)
+
+    for jump in iter_jumps(stmt):
+        dest = cfg.resolve(jump.destination)
+        succ.append(DYNAMIC_EDGE if dest is None else dest)
+    for end in iter_loop_ends(stmt):
+        succ.append(DYNAMIC_EDGE if end.target is None else end.target)
+
+    if falls and fallthrough < len(cfg.program.body):
+        succ.append(fallthrough)
+
+    # remove duplicates, keep order
+    return list(dict.fromkeys(succ))
+
+def match_loops(program:ast.Program) -> ast.Program:
+    """
+    Copy of program with each FOR and its NEXT pointing at each other. A
+    NEXT without a variable ends the innermost loop, NEXT I the loop on I
+    and the ones inside it that have no NEXT of their own. NEXTs left
+    without a variable get the one of their FOR. Loops that open or close
+    inside an IF are only matched at runtime.
+    """
+    body = list(program.body)
+    fors = []
+    for i, line in enumerate(body):
+        stmt = line.statement
+        if isinstance(stmt, ast.ForStmt):
+            fors.append(i)
+        elif isinstance(stmt, ast.NextStmt):
+            while fors:
+                start = fors.pop()
+                loop = body[start].statement
+                if stmt.var is None or stmt.var.name == loop.var.name:
+                    body[start] = copy.copy(body[start])
+                    body[start].statement = replace(loop, target=i+1)
+                    body[i] = copy.copy(line)
+                    body[i].statement = replace(stmt, var=loop.var, target=start+1)
+                    break
+    return ast.Program(body)
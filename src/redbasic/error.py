@@ -13,3 +13,8 @@ class UndefinedVar(LookupError):
         super().__init__(f'{varname} is undefined')
 
 
+class InputNeeded(Exception):
+    "INPUT has to wait for more lines, the statement runs again once they arrive"
+    def __init__(self, lines:int):
+        self.lines = lines
+        super().__init__(f'waiting for {lines} input lines')
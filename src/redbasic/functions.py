@@ -0,0 +1,96 @@
+# redbasic builtin functions
+import math
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class Builtin:
+    "a function BASIC programs can call"
+    name:str
+    func:Callable
+    # min and max number of arguments, max None for no limit
+    arity:tuple[int, int|None] = (0, None)
+    # same arguments always give the same result, and there are no side effects.
+    # The optimizer caches calls to pure functions, functions have to opt in
+    pure:bool = False
+    # func takes the interpreter as its first argument
+    context:bool = False
+    # the name can't be used for a variable, otherwise it's only a call when a '(' follows
+    reserved:bool = True
+
+    def accepts(self, nargs:int):
+        low, high = self.arity
+        return low <= nargs and (high is None or nargs <= high)
+
+
+class FunctionRegistry:
+    """
+    Builtin functions by name. The parser tokenizes registered names as
+    functions and the interpreter binds Func nodes to them when linking.
+    """
+
+    def __init__(self):
+        self._builtins:dict[str, Builtin] = {}
+
+    def register(self, name:str, func:Callable, arity:tuple[int, int|None]=(0, None),
+                 pure=False, context=False, reserved=True):
+        "add or replace a function, names are case insensitive"
+        name = name.casefold()
+        self._builtins[name] = Builtin(name, func, arity, pure, context, reserved)
+
+    def unregister(self, name:str):
+        del self._builtins[name.casefold()]
+
+    def get(self, name:str) -> Builtin|None:
+        return self._builtins.get(name.casefold())
+
+    def is_pure(self, name:str):
+        b = self.get(name)
+        return b is not None and b.pure
+
+    def copy(self):
+        reg = FunctionRegistry()
+        reg._builtins = self._builtins.copy()
+        return reg
+
+    def __contains__(self, name:str):
+        return name.casefold() in self._builtins
+
+    def __iter__(self):
+        return iter(self._builtins.values())
+
+
+def builtin_rnd(interp, low:int, high:int=None):
+    return interp.rng.rnd(low, high)
+
+def builtin_usr(interp, *args):
+    "USR calls into the host application, see Interpreter.usr"
+    if interp.usr is None:
+        raise RuntimeError("USR: no handler, set Interpreter.usr to a callable")
+    return interp.usr(*args)
+
+# SUM, MIN and MAX are in matrix, which is imported on their first call
+
+def builtin_sum(*values):
+    from .matrix import array_sum
+    return array_sum(*values)
+
+def builtin_min(*values):
+    from .matrix import array_min
+    return array_min(*values)
+
+def builtin_max(*values):
+    from .matrix import array_max
+    return array_max(*values)
+
+
+default_registry = FunctionRegistry()
+default_registry.register('rnd', builtin_rnd, (1, 2), context=True)
+default_registry.register('usr', builtin_usr, context=True)
+default_registry.register('pow', pow, (2, 3), pure=True)
+default_registry.register('sqrt', math.sqrt, (1, 1), pure=True)
+# over numbers and whole arrays, SUM(A()). Programs have variables with these names.
+default_registry.register('sum', builtin_sum, (1, None), pure=True, reserved=False)
+default_registry.register('min', builtin_min, (1, None), pure=True, reserved=False)
+default_registry.register('max', builtin_max, (1, None), pure=True, reserved=False)
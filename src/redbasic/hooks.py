@@ -0,0 +1,45 @@
+# redbasic instrumentation hooks
+#   callbacks are called as callback(interpreter, event, arg)
+#       line    body index of the statement about to run
+#       jump    (from, to) body indexes of a GOTO
+#       gosub   (from, to) body indexes of a GOSUB
+#       return  (from, to) body indexes of a RETURN
+#       print   text written by the program
+#       input   line read by INPUT
+#       error   exception raised by a statement, it's re-raised after the hooks run
+from typing import Callable
+
+EVENTS = ('line', 'jump', 'gosub', 'return', 'print', 'input', 'error')
+
+type Hook = Callable[[object, str, object], None]
+
+
+class HookedOutput:
+    "output buffer that reports writes as print events"
+
+    def __init__(self, out, emit:Callable[[str, object], None]):
+        self.out = out
+        self.emit = emit
+
+    def write(self, text:str):
+        self.emit('print', text)
+        return self.out.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+
+class HookedReader:
+    "input reader that reports lines as input events"
+
+    def __init__(self, reader, emit:Callable[[str, object], None]):
+        self.reader = reader
+        self.emit = emit
+
+    def readline(self) -> str:
+        line = self.reader.readline()
+        self.emit('input', line)
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
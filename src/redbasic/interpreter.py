@@ -1,20 +1,27 @@
-import sys, os, pprint
-import math
-from typing import TextIO as Stream
+import sys, io, time
+import operator, functools
+from dataclasses import dataclass
+from typing import TextIO as Stream, TYPE_CHECKING
 from . import ast, error
-from .parser import Parser, parse_int
+from .error import InputNeeded
+from .parser import Parser
+from .cfg import ControlFlowGraph, build_cfg, match_loops, source_count
+from .optimize import optimize_program, bind_functions
+from .functions import FunctionRegistry, default_registry
+from .streams import OutputBuffer, InputReader, parse_value
+from .rng import RandomSource
+from .hooks import EVENTS, Hook, HookedOutput, HookedReader
+from .metrics import Metrics
 
-type Error = error.Err
-
-def builtin_rnd(min:int, max:int=None):
-    import random
-    if max is None:
-        min, max = 0, min
+if TYPE_CHECKING:
+    from .arrays import Array
+    from .memory import MemoryReport
+    from .profiler import Profiler
 
-    return random.randint(min, max)
+# pickle, pprint, the profiler, the memory report, arrays and the MAT kernels are
+# imported where they're used, short runs don't need them and they add to startup time
 
-def builtin_usr(*args):
-    raise NotImplementedError("USR func")
+type Error = error.Err
 
 def find_index_of(item, sequence, attr=None):
     if attr:
@@ -28,39 +35,561 @@ def find_index_of(item, sequence, attr=None):
 
 VAR_NOT_FOUND = object()
 
+# format of snapshot blobs
+SNAPSHOT_VERSION = 4
+
+# how run_for stopped
+DONE = 'done'
+YIELDED = 'yielded'
+WAITING = 'waiting'
+
+# operators of fused statements
+ARITHMETIC_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+}
+
+RELATIONAL_OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '<>': operator.ne,
+    '><': operator.ne,
+}
+
+@dataclass
+class LoopFrame:
+    "a FOR loop in progress"
+    name:str
+    limit:int|float
+    step:int|float
+    # body index of the loop's first statement, NEXT jumps back to it
+    top:int
+
+
 class Interpreter:
     "Redbasic interpreter"
 
     TEMP_VAR = '_'
 
-    def __init__(self, textout:Stream=sys.stdout, textin:Stream=sys.stdin):
+    def __init__(self, textout:Stream=sys.stdout, textin:Stream=sys.stdin, optimize=True, buffering:str=None,
+                 seed=None, functions:FunctionRegistry=None):
         assert textout.writable()
         assert textin.readable()
 
-        self.parser = Parser()
+        self.optimize = optimize
+        # functions available to programs, register more before parsing them
+        self.functions = (default_registry if functions is None else functions).copy()
+        # called by USR(...) with its arguments
+        self.usr = None
+        self.parser = Parser(self.functions)
         self.output = textout
+        # program output goes through the buffer, see streams.BUFFER_MODES
+        self.out = OutputBuffer(textout, buffering)
         self.input = textin
+        self.reader = InputReader(textin)
+        self.rng = RandomSource(seed)
+        # event -> callbacks, see add_hook
+        self.hooks:dict[str, list[Hook]] = {}
+        # counters for stats()
+        self.metrics = Metrics()
         self.variables = {}
+        # DIM arrays by name, apart from the variables
+        self.arrays:dict[str, 'Array'] = {}
+        # bumped by setvar, CachedExprs are valid while their variables keep the same version,
+        # arrays are versioned as a whole under Subscript.key
+        self.versions = {}
         self.substack = []
+        # FOR loops in progress, innermost last
+        self.loops:list[LoopFrame] = []
+        # id of a compound statement -> where to pick it up when it runs again after waiting for input
+        self.resume = {}
         self.ast:ast.Program = None
+        # (source, program) parsed last by set_source, run reuses it for the same source
+        self._parsed:tuple[str, ast.Program] = None
+        self.cursor = 0
+        self.nextcursor = None
+        # a run is in progress, RUN restarts it instead of starting another
+        self.running = False
+        self.clear_memo()
+        self.invalidate()
+
+    def invalidate(self):
+        "forget the linked program, call it after changing the program body in place"
+        self._cfg:ControlFlowGraph = None
+        # linked with fused=False, when optimize is on
+        self._unfused:ControlFlowGraph = None
+        self._linked:ast.Program = None
+
+    def link(self, fused=True) -> ControlFlowGraph:
+        """
+        prepare the program for execution, the result is cached until self.ast changes.
+        fused=False doesn't inline GOSUBs or merge statements, for the loops that
+        report on every line and jump. Body indexes are the same either way.
+        """
+        if self._linked is not self.ast:
+            self._cfg = self._unfused = None
+            self._linked = self.ast
+        if not fused and self.optimize:
+            if self._unfused is None:
+                self._unfused = self._build_cfg(fuse=False)
+            return self._unfused
+        if self._cfg is None:
+            self._cfg = self._build_cfg()
+        return self._cfg
+
+    def _build_cfg(self, fuse=True) -> ControlFlowGraph:
+        program = match_loops(self.ast)
+        if self.optimize:
+            program = optimize_program(program, self.functions, fuse=fuse)
+        program = bind_functions(program, self.bind_function)
+        return build_cfg(program)
 
+    def clear_memo(self):
+        "drop cached expression values and reset the hit/miss counters"
+        self.memo = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
 
     def set_source(self, code:str):
+        start = time.perf_counter()
         self.ast = self.parser.parse(code)
+        self._parsed = code, self.ast
+        self.metrics.parse_seconds += time.perf_counter() - start
+
+    def reset(self, keep_program=True):
+        """
+        Clear what a run leaves behind: variables, arrays, the GOSUB and FOR
+        stacks, the cursor, INPUT waits and cached values. The parser, hooks, streams
+        and counters stay, and so does the linked program unless
+        keep_program is False.
+        """
+        self.variables.clear()
+        self.arrays.clear()
+        # memo entries are keyed by versions, they go together
+        self.versions.clear()
+        self.clear_memo()
+        self.substack.clear()
+        self.loops.clear()
+        self.resume.clear()
+        self.cursor = 0
+        self.nextcursor = None
+        self.running = False
+        if not keep_program:
+            self.ast = None
+            self._parsed = None
+            self.invalidate()
+
+    def run(self, program:ast.Program|str=None, input:str|Stream=None, output:Stream=None) -> Stream:
+        """
+        Run a program from a clean slate and return the stream it printed
+        to. program is a Program or its source, None runs the current one
+        again, and the linked program is reused while it's the same one.
+        input is the text for INPUT or a stream to read it from. Streams
+        given stay in place for the next runs.
+        """
+        if isinstance(program, str):
+            if self._parsed is None or self._parsed[0] != program or self._parsed[1] is not self.ast:
+                self.set_source(program)
+        elif program is not None:
+            self.ast = program
+        self.reset()
+
+        if input is not None:
+            if isinstance(input, str):
+                input = io.StringIO(input)
+            count = self.reader.count
+            self.input = input
+            self.reader = InputReader(input)
+            self.reader.count = count
+        if output is not None:
+            self.out.flush()
+            written = self.out.written
+            self.output = output
+            self.out = OutputBuffer(output, self.out.mode)
+            self.out.written = written
+
+        self.exec()
+        return self.output
+
+    def stats(self) -> dict:
+        "aggregate counters since the interpreter was created, see metrics.METRICS"
+        m = self.metrics
+        return {
+            'statements': m.statements,
+            'gotos': m.gotos,
+            'gosubs': m.gosubs,
+            'returns': m.returns,
+            'max_depth': m.max_depth,
+            'variables': len(self.variables),
+            'print_bytes': self.out.written,
+            'input_lines': self.reader.count,
+            'parse_seconds': m.parse_seconds,
+            'exec_seconds': m.exec_seconds,
+        }
 
     def exec(self):
-        maxcursor = len(self.ast.body)
+        if self.hooks:
+            return self._exec_hooked()
+
+        cfg = self.link()
+        maxcursor = len(cfg.program.body)
+        self.cursor = 0
+        self.nextcursor = None
+        self.loops.clear()
+        self.clear_memo()
+
+        exec_statement = self.exec_statement
+        entry = cfg.entry
+        executed = 0
+        started = time.perf_counter()
+        self.running = True
+
+        # run a whole block at a time, only its last statement can jump
+        # so the cursor only has to be right for that one
+        try:
+            while self.cursor < maxcursor:
+                block = entry(self.cursor)
+                self.cursor = block.last
+                for stmt in block.statements:
+                    exec_statement(stmt)
+                executed += block.size
+
+                if self.nextcursor is not None:
+                    self.cursor = self.nextcursor
+                    self.nextcursor = None
+                else:
+                    self.cursor = block.stop
+        finally:
+            self.running = False
+            self.metrics.statements += executed
+            self.metrics.exec_seconds += time.perf_counter() - started
+            self.flush()
+
+    def snapshot(self, program=False) -> bytes:
+        """
+        Run state as bytes for restore: variables, arrays, cursor, GOSUB and FOR
+        stacks and RND state, and the program too if asked. Call it between run_for
+        calls to checkpoint a run, or after setup code to warm-start others.
+        """
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'variables': self.variables,
+            'arrays': self.arrays,
+            'cursor': self.cursor,
+            'substack': self.substack,
+            'loops': self.loops,
+            'rng': self.rng.getstate(),
+            'resume': self._resume_state(),
+            'program': self.ast if program else None,
+            # the cursor is an index into the program as linked with this setting
+            'optimize': self.optimize,
+        }
+        import pickle
+        return pickle.dumps(state, protocol=5)
+
+    def restore(self, blob:bytes):
+        """
+        Go back to the state of a snapshot, continue the run with run_for.
+        Input and output streams aren't part of it, and optimize is set
+        like it was. Only restore snapshots you trust, they are pickles.
+        """
+        import pickle
+        state = pickle.loads(blob)
+        if state.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {state.get('version')}")
+
+        if state['program'] is not None:
+            self.ast = state['program']
+        if self.optimize != state['optimize']:
+            self.optimize = state['optimize']
+            self.invalidate()
+        self.begin()
+        self.variables = state['variables']
+        self.arrays = state['arrays']
+        self.versions = {}
+        self.substack = state['substack']
+        self.loops = state['loops']
+        self.cursor = state['cursor']
+        self.rng.setstate(state['rng'])
+        for stmt, value in zip(self._compound_at_cursor(), state['resume']):
+            if value is not None:
+                self.resume[id(stmt)] = value
+
+    def _compound_at_cursor(self):
+        "IFs and blocks of the statement at the cursor, in the same order for any copy of the program"
+        body = self.link().program.body
+        stack = [ body[self.cursor].statement ] if self.cursor < len(body) else []
+        while stack:
+            stmt = stack.pop()
+            match stmt:
+                case ast.IfStmt():
+                    yield stmt
+                    stack += [stmt.alternate, stmt.consequent]
+                case ast.BlockStmt():
+                    yield stmt
+                    stack += reversed(stmt.statements)
+
+    def _resume_state(self):
+        "resume keyed by position instead of by id, ids don't survive a pickle"
+        if not self.resume:
+            return []
+        return [ self.resume.get(id(stmt)) for stmt in self._compound_at_cursor() ]
+
+    def memory_report(self, snapshot=None) -> 'MemoryReport':
+        "sizes of the program, the parser state, the variables, the arrays and the linked program"
+        linked = self._cfg if self._linked is self.ast else None
+        from .memory import memory_report
+        return memory_report(self.ast, self.parser, self.variables, linked, snapshot, self.arrays)
+
+    def begin(self):
+        "get ready to run the program from the start with run_for"
+        self.link()
+        self.cursor = 0
+        self.nextcursor = None
+        self.loops.clear()
+        self.resume.clear()
+        self.clear_memo()
+
+    def run_for(self, budget:int) -> str:
+        """
+        Continue the run for up to budget statements and say why it stopped:
+            DONE     the program ended
+            YIELDED  out of budget, call again to continue
+            WAITING  INPUT needs lines that haven't arrived, see streams.FeedReader
+        The statement that waits runs again on the next call. begin() starts
+        a new run.
+        """
+        cfg = self.link()
+        body = cfg.program.body
+        maxcursor = len(body)
+        exec_statement = self.exec_statement
+        entry = cfg.entry
+        left = budget
+        # source statements, the budget counts statements as linked
+        executed = 0
+        status = DONE
+        started = time.perf_counter()
+        self.running = True
+
+        try:
+            while self.cursor < maxcursor:
+                if left <= 0:
+                    status = YIELDED
+                    break
+
+                block = entry(self.cursor)
+                statements = block.statements
+                if len(statements) > left:
+                    statements = statements[:left]
+                self.cursor = block.last
+
+                done = 0
+                try:
+                    for stmt in statements:
+                        exec_statement(stmt)
+                        done += 1
+                except InputNeeded:
+                    self.cursor = self._position(body, block, done)
+                    status = WAITING
+                    break
+                finally:
+                    left -= done
+                    if done == len(block.statements):
+                        executed += block.size
+                    else:
+                        executed += sum(map(source_count, statements[:done]))
+
+                if done < len(block.statements):
+                    # out of budget mid-block
+                    self.cursor = self._position(body, block, done)
+                elif self.nextcursor is not None:
+                    self.cursor = self.nextcursor
+                    self.nextcursor = None
+                else:
+                    self.cursor = block.stop
+        finally:
+            self.running = False
+            self.metrics.statements += executed
+            self.metrics.exec_seconds += time.perf_counter() - started
+            # output waits in the buffer while the program is only paused
+            if status != YIELDED:
+                self.flush()
+        return status
+
+    def steps(self, budget:int=1):
+        "run the program from the start, yielding the status of every run_for(budget) until it's DONE"
+        self.begin()
+        while (status := self.run_for(budget)) != DONE:
+            yield status
+
+    def _position(self, body:list[ast.Line], block, n:int):
+        "body index of the n-th statement of block"
+        for i in range(block.start, block.stop):
+            if body[i].statement is not None:
+                if n == 0:
+                    return i
+                n -= 1
+        return block.stop
+
+    def flush(self):
+        "write out buffered program output"
+        self.out.flush()
+
+    def add_hook(self, event:str, callback:Hook):
+        """
+        Call callback(interpreter, event, arg) on event, see hooks.EVENTS.
+        exec only runs the instrumented loop while there are hooks.
+        """
+        if event not in EVENTS:
+            raise ValueError(f"unknown event '{event}'")
+        self.hooks.setdefault(event, []).append(callback)
+
+    def remove_hook(self, event:str, callback:Hook):
+        callbacks = self.hooks.get(event, [])
+        callbacks.remove(callback)
+        if not callbacks:
+            del self.hooks[event]
+
+    def _emit(self, event:str, arg):
+        for callback in self.hooks.get(event, ()):
+            callback(self, event, arg)
+
+    def _exec_hooked(self):
+        "exec with hooks, a statement at a time, GOSUBs aren't inlined so they're seen"
+        cfg = self.link(fused=False)
+        body = cfg.program.body
+        maxcursor = len(body)
         self.cursor = 0
         self.nextcursor = None
+        self.loops.clear()
+        self.clear_memo()
+
+        emit = self._emit
+        exec_statement = self.exec_statement
+        substack = self.substack
 
-        while self.cursor < maxcursor:
-            item = self.ast.body[self.cursor]
-            self.exec_statement(item.statement)
-            if self.nextcursor:
-                self.cursor = self.nextcursor
-                self.nextcursor = None
-                continue
-            self.cursor += 1
+        out, reader = self.out, self.reader
+        self.out = HookedOutput(out, emit)
+        self.reader = HookedReader(reader, emit)
+        executed = 0
+        started = time.perf_counter()
+        self.running = True
+        try:
+            while self.cursor < maxcursor:
+                index = self.cursor
+                depth = len(substack)
+                emit('line', index)
+                try:
+                    exec_statement(body[index].statement)
+                except Exception as e:
+                    emit('error', e)
+                    raise
+                executed += 1
+
+                if self.nextcursor is not None:
+                    dest = self.nextcursor
+                    if len(substack) > depth:
+                        emit('gosub', (index, dest))
+                    elif len(substack) < depth:
+                        emit('return', (index, dest))
+                    elif dest < maxcursor:
+                        emit('jump', (index, dest))
+                    self.cursor = dest
+                    self.nextcursor = None
+                else:
+                    self.cursor += 1
+        finally:
+            self.running = False
+            self.out, self.reader = out, reader
+            self.metrics.statements += executed
+            self.metrics.exec_seconds += time.perf_counter() - started
+            self.flush()
+
+    def profile(self, profiler:'Profiler|None'=None) -> 'Profiler':
+        """
+        Run the program like exec, one statement at a time, timing every line.
+        This is a separate loop so exec doesn't pay for it. GOSUBs aren't
+        inlined, their lines and jumps are part of the profile.
+        """
+        if profiler is None:
+            from .profiler import Profiler
+            profiler = Profiler()
+
+        cfg = self.link(fused=False)
+        body = cfg.program.body
+        maxcursor = len(body)
+        self.cursor = 0
+        self.nextcursor = None
+        self.loops.clear()
+        self.clear_memo()
+
+        clock = time.perf_counter
+        exec_statement = self.exec_statement
+        substack = self.substack
+        # gosub call sites
+        stack = ()
+        
+        # time expressions by shadowing eval, nested calls are part of the outermost one
+        real_eval = self.eval
+        exprs = 0.0
+        nested = False
+        def timed_eval(expr):
+            nonlocal exprs, nested
+            if nested:
+                return real_eval(expr)
+            nested = True
+            start = clock()
+            try:
+                return real_eval(expr)
+            finally:
+                exprs += clock() - start
+                nested = False
+
+        self.eval = timed_eval
+        started = clock()
+        self.running = True
+        try:
+            while self.cursor < maxcursor:
+                index = self.cursor
+                depth = len(substack)
+                exprs = 0.0
+
+                start = clock()
+                exec_statement(body[index].statement)
+                profiler.record(index, clock() - start, exprs, stack)
+                self.metrics.statements += 1
+
+                if self.nextcursor is not None:
+                    if len(substack) > depth:
+                        kind = 'gosub'
+                        stack += (index,)
+                    elif len(substack) < depth:
+                        kind = 'return'
+                        stack = stack[:-1]
+                    else:
+                        kind = 'goto'
+                    # END and NEW jump past the program, they aren't edges
+                    if self.nextcursor < maxcursor:
+                        profiler.edges[kind, index, self.nextcursor] += 1
+                    self.cursor = self.nextcursor
+                    self.nextcursor = None
+                else:
+                    self.cursor += 1
+        finally:
+            self.running = False
+            del self.eval
+            profiler.elapsed += clock() - started
+            self.metrics.exec_seconds += clock() - started
+            profiler.memo_hits += self.memo_hits
+            profiler.memo_misses += self.memo_misses
+            self.flush()
+
+        return profiler
 
     def exec_script(self, path):
         with open(path) as s:
@@ -75,18 +604,45 @@ class Interpreter:
     def exec_line(self, line:ast.Line|str):
         if isinstance(line, str):
             line = self.parser.parse_line(line)
-        self.exec_statement(line.statement)
+        try:
+            self.exec_statement(line.statement)
+            self.metrics.statements += 1
+        finally:
+            self.flush()
 
     # ---
 
     def exec_statement(self, stmt:ast.Stmt):
         match stmt:
+            # optimizer statements go first, they're the ones in hot loops
+            case ast.AccumulateStmt():
+                value = self.eval(stmt.value)
+                self.setvar(stmt.name, ARITHMETIC_OPS[stmt.operator](self.getvar(stmt.name), value))
+            case ast.IncrementBranchStmt():
+                step = self.eval(stmt.step)
+                value = ARITHMETIC_OPS[stmt.operator](self.getvar(stmt.name), step)
+                self.setvar(stmt.name, value)
+                if RELATIONAL_OPS[stmt.relation](value, self.eval(stmt.limit)):
+                    self.nextcursor = stmt.target
+                    self.metrics.gotos += 1
+            case ast.NextStmt():
+                self._next(stmt)
+            case ast.PrintTextStmt():
+                self.out.write(stmt.text)
+            case ast.BlockStmt():
+                self._block(stmt)
             case ast.VariableDecl():
                 name = stmt.iden.name
                 if name in self.variables:
                     raise RuntimeError(f"'{name}' already defined")
                 value = self.eval(stmt.init)
                 self.setvar(name, value)
+            case ast.DimStmt():
+                self._dim(stmt)
+            case ast.ForStmt():
+                self._for(stmt)
+            case ast.MatStmt() | ast.MatScaleStmt() | ast.MatFillStmt():
+                self._mat(stmt)
             case ast.ExpressionStmt():
                 val = self.eval(stmt.expression)
                 # se for uma expressão solta, salvar em TEMP_VAR
@@ -98,6 +654,7 @@ class Interpreter:
                 self._goto(stmt)
             case ast.EndStmt():
                 self.nextcursor = 2**31
+                self.flush()
             case ast.IfStmt():
                 self._if(stmt)
             case ast.InputStmt():
@@ -109,7 +666,7 @@ class Interpreter:
             case ast.ClearStmt():
                 self._clear()
             case ast.RunStmt():
-                self.exec()
+                self._run()
             case ast.NewStmt():
                 self._new()
             case None:
@@ -128,14 +685,23 @@ class Interpreter:
                 return [self.eval(e) for e in expr] 
             case ast.AssignmentExpr():
                 return self._assignment(expr)
+            case ast.LogicalExpr():
+                return self._logical_expr(expr)
             case ast.BinaryExpr():
                 return self._binary_expr(expr)
             case ast.UnaryExpr():
                 return self._unary_expr(expr)
             case ast.Identifier():
                 return self.getvar(expr.name)
+            case ast.Subscript():
+                if not expr.indexes:
+                    # A() is the whole array, the parser only allows it as a function argument
+                    return self.getarray(expr.name)
+                return self.getarray(expr.name).get([ self.eval(i) for i in expr.indexes ])
             case ast.Func():
                 return self._func(expr)
+            case ast.CachedExpr():
+                return self._cached_expr(expr)
             case _:        
                 raise NotImplementedError(f"unsupported expression {expr}")
 
@@ -155,55 +721,83 @@ class Interpreter:
         
         if stmt.mode == 'code':
             src = ast.reconstruct(tmp)
-            print(src, file=self.output)
+            print(src, file=self.out)
         elif stmt.mode == 'ast':
-            pprint.pp(tmp, stream=self.output)
+            import pprint
+            pprint.pp(tmp, stream=self.out)
+        elif stmt.mode == 'cfg':
+            print(build_cfg(tmp).dump(), file=self.out)
         else:
             raise RuntimeError(f"invalid list mode '{stmt.mode}'")
 
     def _clear(self):
+        self.flush()
         if self.output.isatty():
+            import os
             os.system('cls' if os.name=='nt' else 'clear')
 
+    def _run(self):
+        if not self.running:
+            self.exec()
+            return
+        # restart in place, a program that RUNs itself doesn't grow the Python stack
+        self.substack.clear()
+        self.loops.clear()
+        self.resume.clear()
+        self.clear_memo()
+        self.nextcursor = 0
+
     def _new(self):
-        self.output.write("New program\n\n")
+        self.out.write("New program\n\n")
         self.ast.body.clear()
+        self.invalidate()
+        self.nextcursor = 2**31
+
+    def bind_function(self, name:str):
+        "callable that implements the function name"
+        builtin = self.functions.get(name)
+        if builtin is None:
+            raise RuntimeError(f"unknown function '{name}'")
+        if builtin.context:
+            return functools.partial(builtin.func, self)
+        return builtin.func
 
     def _func(self, func:ast.Func):
+        # statements that weren't linked, like the REPL's, are bound on every call
+        impl = func.impl or self.bind_function(func.name)
+        args = self.eval(func.arguments)
         try:
-            args = self.eval(func.arguments)
-
-            if func.name == 'rnd':
-                return builtin_rnd(*args)
-            elif func.name == 'usr':
-                return builtin_usr(*args)
-            elif func.name == 'pow':
-                return pow(*args)
-            elif func.name == 'sqrt':
-                return math.sqrt(*args)
+            return impl(*args)
         except AttributeError as e:
             raise RuntimeError(f"{func.name}: {e}")
 
 
     def _print(self, printstmt:ast.PrintStmt):
+        parts = []
         for item in printstmt.printlist:
             val = self.eval(item.expression)
             if item.sep == ',':
-                string = f"{val:<8}"
+                parts.append(format(val, '<8'))
             elif item.sep == ';' or item.sep is None:
-                string = str(val)
+                parts.append(str(val))
             else:
                 raise error.BadSyntax(f"Bad print separator '{item.sep}'", self.cursor)
-            
-            self.output.write(string)
-        self.output.write('\n')
+        
+        parts.append('\n')
+        self.out.write(''.join(parts))
 
 
     def _goto(self, goto:ast.GotoStmt):
+        metrics = self.metrics
         if isinstance(goto, ast.GosubStmt):
             if len(self.substack) > 255:
                 raise RecursionError()
             self.substack.append(self.cursor+1)
+            metrics.gosubs += 1
+            if len(self.substack) > metrics.max_depth:
+                metrics.max_depth = len(self.substack)
+        else:
+            metrics.gotos += 1
         
         # if its an identifier, its either a variable w/ line num
         # or a label name
@@ -216,12 +810,10 @@ class Interpreter:
             dest = goto.destination.name
 
         # calculate goto destination
-        if isinstance(dest, str):
-            dest = hash(dest)
         if dest == 0:
             raise Error("0 is not a valid destination")
         
-        dest = find_index_of(dest, (x.linenum for x in self.ast.body))
+        dest = self.link().index.get(dest, -1)
         if dest == -1:
             raise RuntimeError(f"Unexpected destination {dest}")
         
@@ -230,41 +822,148 @@ class Interpreter:
 
     def _return(self):
         self.nextcursor = self.substack.pop()
+        self.metrics.returns += 1
+
+
+    def _for(self, stmt:ast.ForStmt):
+        name = stmt.var.name
+        start = self.eval(stmt.start)
+        limit = self.eval(stmt.limit)
+        step = 1 if stmt.step is None else self.eval(stmt.step)
+        self.setvar(name, start)
+
+        # a FOR on a variable that is already looping replaces that loop and the ones inside it
+        loops = self.loops
+        for i in range(len(loops) - 1, -1, -1):
+            if loops[i].name == name:
+                del loops[i:]
+                break
 
+        if start > limit if step >= 0 else start < limit:
+            # runs no times at all
+            if stmt.target is None:
+                raise RuntimeError(f"FOR {name} without NEXT")
+            self.nextcursor = stmt.target
+            self.metrics.gotos += 1
+        else:
+            loops.append(LoopFrame(name, limit, step, self.cursor + 1))
+
+    def _next(self, stmt:ast.NextStmt):
+        "increment, test and jump back in one step"
+        loops = self.loops
+        if not loops:
+            raise RuntimeError("NEXT without FOR")
+        frame = loops[-1]
+        if stmt.var is not None and stmt.var.name != frame.name:
+            # closes the loops inside the one on var too
+            for i in range(len(loops) - 2, -1, -1):
+                if loops[i].name == stmt.var.name:
+                    del loops[i+1:]
+                    frame = loops[i]
+                    break
+            else:
+                raise RuntimeError(f"NEXT {stmt.var.name} without FOR")
+
+        value = self.getvar(frame.name) + frame.step
+        self.setvar(frame.name, value)
+        if value <= frame.limit if frame.step >= 0 else value >= frame.limit:
+            self.nextcursor = frame.top
+            self.metrics.gotos += 1
+        else:
+            loops.pop()
+
+    def _block(self, stmt:ast.BlockStmt):
+        "an inlined subroutine, counted like the GOSUB and RETURN it stands for"
+        start = self.resume.pop(id(stmt), 0) if self.resume else 0
+        metrics = self.metrics
+        if not start:
+            metrics.gosubs += 1
+            if len(self.substack) + 1 > metrics.max_depth:
+                metrics.max_depth = len(self.substack) + 1
+        statements = stmt.statements
+        for i in range(start, len(statements)):
+            try:
+                self.exec_statement(statements[i])
+            except InputNeeded:
+                # the statements before it already ran
+                self.resume[id(stmt)] = i
+                raise
+        metrics.returns += 1
+        # the subroutine's statements and its RETURN, the block itself is the GOSUB
+        metrics.statements += len(statements) + 1
 
     def _if(self, stmt:ast.IfStmt):
-        cond = self.eval(stmt.test)
-        if cond:
-            self.exec_statement(stmt.consequent)
-        elif stmt.alternate:
-            self.exec_statement(stmt.alternate)
+        cond = self.resume.pop(id(stmt), VAR_NOT_FOUND) if self.resume else VAR_NOT_FOUND
+        if cond is VAR_NOT_FOUND:
+            cond = self.eval(stmt.test)
+        try:
+            if cond:
+                self.exec_statement(stmt.consequent)
+            elif stmt.alternate:
+                self.exec_statement(stmt.alternate)
+        except InputNeeded:
+            # don't evaluate the test again, it could have side effects
+            self.resume[id(stmt)] = cond
+            raise
 
     def _input(self, stmt:ast.InputStmt):
+        # prompts have to be visible before blocking on input
+        self.flush()
+        if not self.reader.available(len(stmt.varlist)):
+            raise InputNeeded(len(stmt.varlist))
+        readline = self.reader.readline
         for var in stmt.varlist:
-            line = self.input.readline().strip()
-
-            try:
-                value = float(line)
-                if value.is_integer():
-                    value = int(value)
+            value = parse_value(readline().strip())
+            if isinstance(var, ast.Subscript):
+                self._set_element(var, '=', value)
+            else:
                 self.setvar(var.name, value)
-                continue
-            except ValueError:
-                pass
 
-            try:
-                value = parse_int(line)
-                self.setvar(var.name, value)
-                continue
-            except ValueError:
-                pass
+    def _dim(self, stmt:ast.DimStmt):
+        from .arrays import Array
+        for decl in stmt.arrays:
+            if decl.name in self.arrays:
+                raise RuntimeError(f"'{decl.name}()' already dimensioned")
+            self.arrays[decl.name] = Array(decl.name, tuple(self.eval(decl.indexes)))
+            self.versions[decl.key] = self.versions.get(decl.key, 0) + 1
 
-            # str
-            value = line
-            self.setvar(var.name, value)
+    def _mat(self, stmt:ast.MatStmt|ast.MatScaleStmt|ast.MatFillStmt):
+        "whole array assignment, the target takes the shape of the result and doesn't need a DIM"
+        from . import matrix
+        match stmt:
+            case ast.MatStmt(operator=None):
+                result = matrix.copy(stmt.target, self.getarray(stmt.left))
+            case ast.MatStmt(operator='*'):
+                result = matrix.product(stmt.target, self.getarray(stmt.left), self.getarray(stmt.right))
+            case ast.MatStmt():
+                result = matrix.elementwise(stmt.target, stmt.operator,
+                                            self.getarray(stmt.left), self.getarray(stmt.right))
+            case ast.MatScaleStmt():
+                result = matrix.scale(stmt.target, self.eval(stmt.factor), self.getarray(stmt.source))
+            case ast.MatFillStmt():
+                if stmt.bounds is None:
+                    bounds = self.getarray(stmt.target).bounds
+                else:
+                    bounds = tuple(self.eval(stmt.bounds))
+                result = matrix.fill(stmt.target, stmt.kind, bounds)
+        self.arrays[stmt.target] = result
+        key = stmt.target + '()'
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _set_element(self, target:ast.Subscript, operator:str, value):
+        array = self.getarray(target.name)
+        offset = array.offset([ self.eval(i) for i in target.indexes ])
+        if operator != '=':
+            value = ARITHMETIC_OPS[operator[0]](array.data[offset], value)
+        array.store(offset, value)
+        self.versions[target.key] = self.versions.get(target.key, 0) + 1
+        return value
 
 
     def _assignment(self, expr:ast.AssignmentExpr):
+        if type(expr.left) is ast.Subscript:
+            return self._set_element(expr.left, expr.operator, self.eval(expr.right))
+
         name = expr.left.name
         value = self.eval(expr.right)
 
@@ -290,9 +989,32 @@ class Interpreter:
         self.setvar(name, var)
         return var
                     
+    def _cached_expr(self, expr:ast.CachedExpr):
+        versions = self.versions
+        key = tuple([ versions.get(name) for name in expr.deps ])
+        cached = self.memo.get(expr.slot)
+        if cached is not None and cached[0] == key:
+            self.memo_hits += 1
+            return cached[1]
+
+        self.memo_misses += 1
+        value = self.eval(expr.expression)
+        self.memo[expr.slot] = key, value
+        return value
+
+    def _logical_expr(self, expr:ast.LogicalExpr):
+        # left to right, the right side only runs if it decides the result
+        lhs = self.eval(expr.left)
+        if expr.operator == '&&':
+            return lhs and self.eval(expr.right)
+        if expr.operator == '||':
+            return lhs or self.eval(expr.right)
+
+        raise RuntimeError(f"bad logical operator '{expr.operator}'")
+
     def _binary_expr(self, expr:ast.BinaryExpr):
-        rhs = self.eval(expr.right)
         lhs = self.eval(expr.left)
+        rhs = self.eval(expr.right)
 
         match expr.operator:
             case '+':
@@ -306,7 +1028,7 @@ class Interpreter:
             case '>':
                 return lhs > rhs
             case '>=':
-                return lhs > rhs
+                return lhs >= rhs
             case '<':
                 return lhs < rhs
             case '<=':
@@ -315,10 +1037,6 @@ class Interpreter:
                 return lhs != rhs
             case '==':
                 return lhs == rhs
-            case '||':
-                return lhs or rhs
-            case '&&':
-                return lhs and rhs
             
         raise RuntimeError(f"bad binary operator '{expr.operator}'")
 
@@ -348,6 +1066,13 @@ class Interpreter:
         
     def setvar(self, name:str, value):
         self.variables[name] = value
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    def getarray(self, name:str) -> 'Array':
+        try:
+            return self.arrays[name]
+        except KeyError:
+            raise error.UndefinedVar(name + '()')
 
 
     def repl(self, welcome, prompt="> "):
@@ -386,6 +1111,7 @@ class Interpreter:
                             body[idx] = line
                         else:
                             body.append(line)
+                        self.invalidate()
                     else:
                         self.exec_line(line)
         except EOFError:
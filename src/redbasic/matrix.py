@@ -0,0 +1,158 @@
+# redbasic MAT statements and array aggregates
+#   whole array kernels, NumPy ones when it's installed and loops over the
+#   array storage otherwise. Int results that could go past int64 are left
+#   to the loops, which raise OverflowError like storing an element does,
+#   instead of wrapping around like NumPy would.
+import operator
+from array import array
+from math import prod, fsum
+from . import rng
+from .arrays import Array, INT_CODE, FLOAT_CODE
+
+# largest value of the int storage
+INT_LIMIT = 2**63 - 1
+
+# arrays with fewer elements run the loops, NumPy's fixed cost per call is
+# more than they take (it's about where A + B and SUM break even, see
+# bench/bench_mat.py). None never uses NumPy.
+NUMPY_MIN_SIZE = 256
+
+ELEMENTWISE = {
+    '+': (operator.add, 'add'),
+    '-': (operator.sub, 'subtract'),
+}
+
+
+def _numpy(*arrays:Array):
+    "NumPy for a kernel over arrays, None when the loops should run"
+    if NUMPY_MIN_SIZE is None or max(len(a) for a in arrays) < NUMPY_MIN_SIZE:
+        return None
+    return rng.numpy
+
+def _code(*arrays:Array, factor=0) -> str:
+    "storage of a result, floats as soon as one operand has them"
+    if isinstance(factor, float) or any(a.data.typecode == FLOAT_CODE for a in arrays):
+        return FLOAT_CODE
+    return INT_CODE
+
+def _bound(a:Array) -> int:
+    "largest magnitude of the elements, from NumPy"
+    view = a.numpy()
+    return max(int(view.max()), -int(view.min()))
+
+def _empty(name:str, shape:tuple[int, ...], code:str) -> Array:
+    "zeroed array for a NumPy kernel to write its result to"
+    return Array(name, tuple(n - 1 for n in shape), array(code, bytes(array(code).itemsize * prod(shape))))
+
+def _result(name:str, shape:tuple[int, ...], code:str, values) -> Array:
+    "array of the values a loop computed"
+    try:
+        data = array(code, values)
+    except OverflowError:
+        raise OverflowError(f"MAT result doesn't fit in {name}()") from None
+    return Array(name, tuple(n - 1 for n in shape), data)
+
+# --- MAT statements ---
+# each one returns a new array, the target of the statement gets its shape
+
+def copy(name:str, a:Array) -> Array:
+    "MAT C = A"
+    return Array(name, a.bounds, a.data[:])
+
+def elementwise(name:str, op:str, a:Array, b:Array) -> Array:
+    "MAT C = A + B and MAT C = A - B"
+    if a.shape != b.shape:
+        raise ValueError(f"MAT {a.name}() {op} {b.name}(): shapes {a.shape} and {b.shape} differ")
+    func, ufunc = ELEMENTWISE[op]
+    code = _code(a, b)
+    numpy = _numpy(a, b)
+    if numpy is not None and (code == FLOAT_CODE or _bound(a) + _bound(b) <= INT_LIMIT):
+        result = _empty(name, a.shape, code)
+        getattr(numpy, ufunc)(a.numpy(), b.numpy(), out=result.numpy())
+        return result
+    return _result(name, a.shape, code, map(func, a.data, b.data))
+
+def product(name:str, a:Array, b:Array) -> Array:
+    "MAT C = A * B, the matrix product, either of them can be a vector"
+    if len(a.shape) > 2 or len(b.shape) > 2 or len(a.shape) + len(b.shape) < 3 or a.shape[-1] != b.shape[0]:
+        raise ValueError(f"MAT {a.name}() * {b.name}(): can't multiply shapes {a.shape} and {b.shape}")
+    inner = b.shape[0]
+    rows = len(a) // inner
+    cols = len(b) // inner
+    shape = a.shape[:-1] + b.shape[1:]
+    code = _code(a, b)
+    numpy = _numpy(a, b)
+    if numpy is not None and (code == FLOAT_CODE or _bound(a) * _bound(b) * inner <= INT_LIMIT):
+        result = _empty(name, shape, code)
+        numpy.matmul(a.numpy(), b.numpy(), out=result.numpy())
+        return result
+
+    x = a.data
+    columns = [ b.data[j::cols] for j in range(cols) ]
+    values = []
+    for i in range(0, rows * inner, inner):
+        row = x[i:i+inner]
+        values.extend(sum(map(operator.mul, row, col)) for col in columns)
+    return _result(name, shape, code, values)
+
+def scale(name:str, factor, a:Array) -> Array:
+    "MAT C = (K) * A"
+    if not isinstance(factor, (int, float)):
+        raise TypeError(f"MAT: can't multiply {a.name}() by {factor!r}")
+    code = _code(a, factor=factor)
+    numpy = _numpy(a)
+    if numpy is not None and (code == FLOAT_CODE
+                              or abs(factor) <= INT_LIMIT and abs(factor) * _bound(a) <= INT_LIMIT):
+        result = _empty(name, a.shape, code)
+        numpy.multiply(a.numpy(), factor, out=result.numpy())
+        return result
+    return _result(name, a.shape, code, [ factor * x for x in a.data ])
+
+def fill(name:str, kind:str, bounds:tuple[int, ...]) -> Array:
+    "MAT A = ZER, CON or IDN, zeros, ones or the identity matrix"
+    result = Array(name, bounds)
+    if kind == 'con':
+        result.data = array(INT_CODE, [1]) * len(result)
+    elif kind == 'idn':
+        shape = result.shape
+        if len(shape) != 2 or shape[0] != shape[1]:
+            raise ValueError(f"IDN needs a square matrix, {name}() has shape {shape}")
+        result.data[::shape[0] + 1] = array(INT_CODE, [1]) * shape[0]
+    elif kind != 'zer':
+        raise ValueError(f"unknown MAT fill {kind!r}")
+    return result
+
+# --- aggregates ---
+# builtins over numbers and whole arrays, SUM(A(), 1) adds 1 to the sum of A's elements
+
+def _sum(a:Array):
+    # floats are added with fsum whatever the size, NumPy's pairwise sum
+    # rounds differently and the result would depend on NUMPY_MIN_SIZE
+    if a.data.typecode == FLOAT_CODE:
+        return fsum(a.data)
+    if _numpy(a) is not None and _bound(a) * len(a) <= INT_LIMIT:
+        return a.numpy().sum().item()
+    return sum(a.data)
+
+def _extreme(values, pick, method:str):
+    found = []
+    for v in values:
+        if isinstance(v, Array):
+            v = pick(v.data) if _numpy(v) is None else getattr(v.numpy(), method)().item()
+        found.append(v)
+    return pick(found)
+
+def array_sum(*values):
+    "SUM of numbers and the elements of arrays"
+    total = 0
+    for v in values:
+        total += _sum(v) if isinstance(v, Array) else v
+    return total
+
+def array_min(*values):
+    "MIN of numbers and the elements of arrays"
+    return _extreme(values, min, 'min')
+
+def array_max(*values):
+    "MAX of numbers and the elements of arrays"
+    return _extreme(values, max, 'max')
@@ -0,0 +1,167 @@
+# redbasic memory usage report
+import sys, os, types, functools, tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field, is_dataclass
+from . import ast
+from .profiler import line_source
+
+# not walked by deep_sizeof: code and the objects it hangs off of, like the interpreter behind a bound builtin
+OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+          types.MethodType, functools.partial)
+
+
+def deep_sizeof(obj, seen:set[int]=None) -> int:
+    "bytes used by obj and everything it references, objects in seen are skipped and then added to it"
+    if seen is None:
+        seen = set()
+
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, OPAQUE):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__'):
+            stack.append(vars(o))
+        elif hasattr(type(o), '__slots__'):
+            stack.extend(getattr(o, name) for name in type(o).__slots__ if hasattr(o, name))
+    return size
+
+
+def _children(node):
+    "AST nodes directly referenced by node"
+    for value in vars(node).values():
+        if isinstance(value, list):
+            yield from (v for v in value if _is_node(v))
+        elif _is_node(value):
+            yield value
+
+def _is_node(obj):
+    return isinstance(obj, ast.Ast) or is_dataclass(obj) and not isinstance(obj, type)
+
+def _own_size(node, seen:set[int]) -> int:
+    "bytes used by node itself, child nodes excluded"
+    if id(node) in seen:
+        return 0
+    seen.add(id(node))
+    size = sys.getsizeof(node)
+    attrs = vars(node)
+    if id(attrs) not in seen:
+        seen.add(id(attrs))
+        size += sys.getsizeof(attrs)
+    for value in attrs.values():
+        if isinstance(value, list):
+            if id(value) not in seen:
+                seen.add(id(value))
+                size += sys.getsizeof(value)
+            size += sum(deep_sizeof(v, seen) for v in value if not _is_node(v))
+        elif not _is_node(value):
+            size += deep_sizeof(value, seen)
+    return size
+
+
+@dataclass
+class MemoryReport:
+    "where the memory of a program and the state around it goes, sizes in bytes"
+    # body index -> bytes of the line and everything below it
+    lines:dict[int, int] = field(default_factory=dict)
+    # node type name -> bytes, and how many nodes of the type there are
+    node_bytes:Counter[str] = field(default_factory=Counter)
+    node_count:Counter[str] = field(default_factory=Counter)
+    # parser attribute name -> bytes it keeps alive
+    parser:dict[str, int] = field(default_factory=dict)
+    variables:int = 0
+    # DIM arrays, their storage included
+    arrays:int = 0
+    # the optimized and linked copy of the program, beyond what it shares with the AST
+    linked:int = 0
+    # tracemalloc statistics, when it was tracing
+    traced:list[tracemalloc.Statistic] = field(default_factory=list)
+
+    @property
+    def ast_bytes(self):
+        return sum(self.lines.values())
+
+    def format(self, program:ast.Program, top:int=10) -> str:
+        out = [f"AST: {self.ast_bytes} bytes in {len(self.lines)} lines, {sum(self.node_count.values())} nodes"]
+        if self.lines:
+            average = self.ast_bytes / len(self.lines)
+            out.append('')
+            out.append(f"{'bytes':>9}  largest lines, * is over twice the average of {average:.0f}")
+            for index, size in sorted(self.lines.items(), key=lambda x: x[1], reverse=True)[:top]:
+                flag = '*' if size > 2 * average else ' '
+                out.append(f"{size:>9}{flag} {line_source(program, index)}")
+
+            out.append('')
+            out.append(f"{'bytes':>9} {'nodes':>7} {'avg':>6}  node type")
+            for name, size in self.node_bytes.most_common(top):
+                count = self.node_count[name]
+                out.append(f"{size:>9} {count:>7} {size/count:>6.0f}  {name}")
+
+        out.append('')
+        for name, size in self.parser.items():
+            out.append(f"parser.{name}: {size} bytes")
+        out.append(f"variables: {self.variables} bytes")
+        out.append(f"arrays: {self.arrays} bytes")
+        out.append(f"linked program: {self.linked} bytes more than the AST")
+
+        if self.traced:
+            out.append('')
+            out.append(f"{'bytes':>9} {'blocks':>7}  allocated at")
+            for stat in self.traced[:top]:
+                frame = stat.traceback[0]
+                out.append(f"{stat.size:>9} {stat.count:>7}  {frame.filename}:{frame.lineno}")
+        return '\n'.join(out)
+
+
+def memory_report(program:ast.Program, parser=None, variables:dict=None, linked=None,
+                  snapshot:tracemalloc.Snapshot=None, arrays:dict=None) -> MemoryReport:
+    """
+    Size up a program and optionally the parser that made it, the variables and
+    arrays of a run and the linked program. snapshot adds the allocation sites in redbasic.
+    """
+    report = MemoryReport()
+    seen = { id(program), id(vars(program)), id(program.body) }
+
+    for index, line in enumerate(program.body):
+        total = 0
+        stack = [line]
+        while stack:
+            node = stack.pop()
+            size = _own_size(node, seen)
+            if size:
+                name = type(node).__name__
+                report.node_bytes[name] += size
+                report.node_count[name] += 1
+            total += size
+            stack.extend(_children(node))
+        report.lines[index] = total
+
+    if parser is not None:
+        for name, value in vars(parser).items():
+            if name == 'functions':
+                continue
+            report.parser[name] = deep_sizeof(value, seen.copy())
+
+    if variables is not None:
+        report.variables = deep_sizeof(variables)
+    if arrays is not None:
+        report.arrays = deep_sizeof(arrays)
+
+    if linked is not None:
+        report.linked = deep_sizeof(linked, seen.copy())
+
+    if snapshot is not None:
+        package = os.path.dirname(__file__)
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(True, os.path.join(package, '*'))])
+        report.traced = snapshot.statistics('lineno')
+
+    return report
@@ -0,0 +1,45 @@
+# redbasic runtime metrics
+from dataclasses import dataclass
+
+# name, OpenMetrics type, unit and help of every Interpreter.stats() value
+METRICS = (
+    ('statements', 'counter', '', "statements executed"),
+    ('gotos', 'counter', '', "GOTO jumps taken"),
+    ('gosubs', 'counter', '', "GOSUB calls"),
+    ('returns', 'counter', '', "RETURNs from GOSUB"),
+    ('max_depth', 'gauge', '', "deepest GOSUB stack seen"),
+    ('variables', 'gauge', '', "variables defined"),
+    ('print_bytes', 'counter', 'bytes', "program output written"),
+    ('input_lines', 'counter', '', "lines read by INPUT"),
+    ('parse_seconds', 'counter', 'seconds', "time spent parsing"),
+    ('exec_seconds', 'counter', 'seconds', "time spent running programs"),
+)
+
+
+@dataclass
+class Metrics:
+    "counters the interpreter keeps as it runs, see Interpreter.stats"
+    statements:int = 0
+    gotos:int = 0
+    gosubs:int = 0
+    returns:int = 0
+    max_depth:int = 0
+    parse_seconds:float = 0.0
+    exec_seconds:float = 0.0
+
+
+def to_openmetrics(stats:dict, prefix:str='redbasic') -> str:
+    "stats in the OpenMetrics text format"
+    out = []
+    for key, kind, unit, help in METRICS:
+        if key not in stats:
+            continue
+        name = f'{prefix}_{key}'
+        out.append(f'# TYPE {name} {kind}')
+        if unit:
+            out.append(f'# UNIT {name} {unit}')
+        out.append(f'# HELP {name} {help}')
+        sample = name + '_total' if kind == 'counter' else name
+        out.append(f'{sample} {stats[key]}')
+    out.append('# EOF')
+    return '\n'.join(out) + '\n'
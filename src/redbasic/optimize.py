@@ -0,0 +1,378 @@
+# redbasic optimizer
+#   rewrites a program into an equivalent one that runs faster,
+#   body indexes and line numbers are preserved so jumps keep working
+import copy
+from typing import Callable
+from . import ast
+from .functions import FunctionRegistry, default_registry
+from .cfg import ControlFlowGraph, build_cfg, is_terminator, iter_assigned, iter_jumps
+
+# subroutines with more statements than this are not inlined
+INLINE_LIMIT = 8
+
+RELATIONAL_OPS = ('<', '<=', '>', '>=', '==', '<>', '><')
+
+
+def is_pure(expr:ast.Expr, functions:FunctionRegistry=default_registry):
+    "expr has no side effects and always yields the same value for the same variables"
+    match expr:
+        case list():
+            return all(is_pure(e, functions) for e in expr)
+        case ast.Literal() | ast.Identifier() | ast.CachedExpr():
+            return True
+        case ast.AssignmentExpr():
+            return False
+        case ast.Subscript():
+            # the array's version stands for its elements, see variables_of
+            return is_pure(expr.indexes, functions)
+        case ast.BinaryExpr():
+            return is_pure(expr.left, functions) and is_pure(expr.right, functions)
+        case ast.UnaryExpr():
+            return is_pure(expr.argument, functions)
+        case ast.Func():
+            return functions.is_pure(expr.name) and is_pure(expr.arguments, functions)
+    return False
+
+def is_simple(stmt:ast.Stmt):
+    "stmt never transfers control"
+    match stmt:
+        case ast.IfStmt():
+            return is_simple(stmt.consequent) and is_simple(stmt.alternate)
+        case ast.BlockStmt():
+            return all(is_simple(s) for s in stmt.statements)
+        case ast.InteractiveStmt():
+            return False
+    return not is_terminator(stmt)
+
+
+def optimize_program(program:ast.Program, functions:FunctionRegistry=default_registry,
+                     inline_limit=INLINE_LIMIT, fuse=True) -> ast.Program:
+    """
+    optimized copy of program, the original is left untouched. fuse=False
+    doesn't inline GOSUBs or merge statements, every statement and jump
+    of the source still runs.
+    """
+    body = [ copy.copy(line) for line in program.body ]
+    folder = _ConstantFolder()
+    for line in body:
+        line.statement = folder.stmt(line.statement)
+
+    if fuse:
+        cfg = build_cfg(ast.Program(body))
+        for line in body:
+            line.statement = _inline_gosubs(line.statement, cfg, inline_limit, functions)
+            line.statement = _fuse(line.statement, functions)
+        _fuse_increment_branch(body, cfg, functions)
+
+    _memoize_loops(body, functions)
+
+    return ast.Program(body)
+
+# --- GOSUB inlining ---
+
+def subroutine_at(cfg:ControlFlowGraph, start:int, limit=INLINE_LIMIT):
+    """
+    Statements of the subroutine beginning at body index start,
+    None if it can't be inlined: it's too long, has more than
+    one exit or jumps somewhere.
+    """
+    body = cfg.program.body
+    stmts = []
+    for line in body[start:]:
+        stmt = line.statement
+        if isinstance(stmt, ast.ReturnStmt):
+            return stmts
+        if stmt is None:
+            continue
+        if not is_simple(stmt) or len(stmts) == limit:
+            return None
+        stmts.append(stmt)
+    return None
+
+def _inline_gosubs(stmt:ast.Stmt, cfg:ControlFlowGraph, limit, functions):
+    match stmt:
+        case ast.GosubStmt():
+            dest = cfg.resolve(stmt.destination)
+            if dest is None:
+                return stmt
+            sub = subroutine_at(cfg, dest, limit)
+            if sub is None:
+                return stmt
+            return ast.BlockStmt([ _fuse(s, functions) for s in sub ])
+        case ast.IfStmt():
+            return ast.IfStmt(stmt.test,
+                              _inline_gosubs(stmt.consequent, cfg, limit, functions),
+                              _inline_gosubs(stmt.alternate, cfg, limit, functions))
+    return stmt
+
+# --- superinstructions ---
+
+def _update_of(stmt:ast.Stmt, functions):
+    """
+    Split `V op= X` and `V = V op X` statements into (V, op, X),
+    None for anything else
+    """
+    if not isinstance(stmt, ast.ExpressionStmt):
+        return None
+    expr = stmt.expression
+    if not isinstance(expr, ast.AssignmentExpr) or not isinstance(expr.left, ast.Identifier):
+        return None
+
+    name = expr.left.name
+    if expr.operator != '=':
+        return name, expr.operator[0], expr.right
+
+    right = expr.right
+    if (type(right) is ast.BinaryExpr and right.operator in '+-*/'
+            and isinstance(right.left, ast.Identifier) and right.left.name == name
+            and is_pure(right.right, functions)):
+        return name, right.operator, right.right
+    return None
+
+def _print_text(stmt:ast.PrintStmt):
+    "render a PRINT statement if all of its items are literals"
+    parts = []
+    for item in stmt.printlist:
+        if not isinstance(item.expression, ast.Literal):
+            return None
+        val = item.expression.value
+        if item.sep == ',':
+            parts.append(f"{val:<8}")
+        elif item.sep == ';' or item.sep is None:
+            parts.append(str(val))
+        else:
+            return None
+    parts.append('\n')
+    return ''.join(parts)
+
+def _fuse(stmt:ast.Stmt, functions):
+    "replace a single statement by a specialized one"
+    match stmt:
+        case ast.ExpressionStmt():
+            update = _update_of(stmt, functions)
+            if update:
+                return ast.AccumulateStmt(*update)
+        case ast.PrintStmt():
+            text = _print_text(stmt)
+            if text is not None:
+                return ast.PrintTextStmt(text)
+        case ast.IfStmt():
+            return ast.IfStmt(stmt.test, _fuse(stmt.consequent, functions), _fuse(stmt.alternate, functions))
+    return stmt
+
+def _fuse_increment_branch(body:list[ast.Line], cfg:ControlFlowGraph, functions):
+    """
+    Merge `I = I + 1` followed by `IF I < N THEN GOTO L` into a single
+    statement. It goes in place of the IF, the line of the increment is left empty.
+    """
+    for i in range(len(body) - 1):
+        update, branch = body[i].statement, body[i+1].statement
+
+        # nothing may jump in between the two lines
+        if not isinstance(update, ast.AccumulateStmt) or cfg.is_leader(i+1):
+            continue
+        if update.operator not in '+-':
+            continue
+        if not (isinstance(branch, ast.IfStmt) and branch.alternate is None
+                and type(branch.consequent) is ast.GotoStmt):
+            continue
+
+        test = branch.test
+        if not (type(test) is ast.BinaryExpr and test.operator in RELATIONAL_OPS
+                and isinstance(test.left, ast.Identifier) and test.left.name == update.name
+                and is_pure(test.right, functions)):
+            continue
+
+        dest = branch.consequent.destination
+        target = cfg.resolve(dest)
+        if target is None:
+            continue
+
+        body[i].statement = None
+        body[i+1].statement = ast.IncrementBranchStmt(update.name, update.operator, update.value,
+                                                      test.operator, test.right, dest, target)
+
+# --- loop invariant expressions ---
+
+def find_loops(cfg:ControlFlowGraph):
+    "(start, stop) body ranges of loops made by backward jumps"
+    loops = set()
+    for block in cfg.blocks:
+        for succ in block.successors:
+            if isinstance(succ, int) and succ <= block.start:
+                loops.add((succ, block.stop))
+    return sorted(loops)
+
+def variables_of(expr:ast.Expr):
+    "names of the variables expr reads"
+    match expr:
+        case list():
+            for e in expr:
+                yield from variables_of(e)
+        case ast.Identifier():
+            yield expr.name
+        case ast.Subscript():
+            yield expr.key
+            yield from variables_of(expr.indexes)
+        case ast.BinaryExpr():
+            yield from variables_of(expr.left)
+            yield from variables_of(expr.right)
+        case ast.UnaryExpr():
+            yield from variables_of(expr.argument)
+        case ast.Func():
+            yield from variables_of(expr.arguments)
+        case ast.CachedExpr():
+            yield from expr.deps
+
+def _cost(expr:ast.Expr):
+    "rough count of the work needed to evaluate expr, calls count as a lot"
+    match expr:
+        case list():
+            return sum(_cost(e) for e in expr)
+        case ast.BinaryExpr():
+            return 1 + _cost(expr.left) + _cost(expr.right)
+        case ast.UnaryExpr():
+            return 1 + _cost(expr.argument)
+        case ast.Subscript():
+            return 1 + _cost(expr.indexes)
+        case ast.Func():
+            return 10 + _cost(expr.arguments)
+    return 0
+
+class _ExprRewriter:
+    "rebuilds statements with their expressions passed through self.expr"
+
+    def expr(self, expr:ast.Expr):
+        match expr:
+            case list():
+                return [ self.expr(e) for e in expr ]
+            case ast.AssignmentExpr():
+                left = expr.left
+                if isinstance(left, ast.Subscript):
+                    # the target itself is never rewritten, only its subscripts
+                    left = ast.Subscript(left.name, self.expr(left.indexes))
+                return ast.AssignmentExpr(expr.operator, left, self.expr(expr.right))
+            case ast.Subscript():
+                return ast.Subscript(expr.name, self.expr(expr.indexes))
+            case ast.BinaryExpr():
+                return type(expr)(expr.operator, self.expr(expr.left), self.expr(expr.right))
+            case ast.UnaryExpr():
+                return ast.UnaryExpr(expr.operator, self.expr(expr.argument))
+            case ast.Func():
+                return ast.Func(expr.name, self.expr(expr.arguments), expr.impl)
+            case ast.CachedExpr():
+                return ast.CachedExpr(self.expr(expr.expression), expr.deps, expr.slot)
+        return expr
+
+    def stmt(self, stmt:ast.Stmt):
+        match stmt:
+            case ast.GotoStmt():
+                return type(stmt)(self.expr(stmt.destination))
+            case ast.ExpressionStmt():
+                return ast.ExpressionStmt(self.expr(stmt.expression))
+            case ast.VariableDecl():
+                return ast.VariableDecl(stmt.iden, self.expr(stmt.init))
+            case ast.DimStmt():
+                return ast.DimStmt([ ast.Subscript(a.name, self.expr(a.indexes)) for a in stmt.arrays ])
+            case ast.PrintStmt():
+                return ast.PrintStmt([ ast.PrintItem(self.expr(i.expression), i.sep) for i in stmt.printlist ])
+            case ast.IfStmt():
+                return ast.IfStmt(self.expr(stmt.test), self.stmt(stmt.consequent), self.stmt(stmt.alternate))
+            case ast.BlockStmt():
+                return ast.BlockStmt([ self.stmt(s) for s in stmt.statements ])
+            case ast.AccumulateStmt():
+                return ast.AccumulateStmt(stmt.name, stmt.operator, self.expr(stmt.value))
+            case ast.IncrementBranchStmt():
+                return ast.IncrementBranchStmt(stmt.name, stmt.operator, self.expr(stmt.step),
+                                               stmt.relation, self.expr(stmt.limit),
+                                               stmt.destination, stmt.target)
+            case ast.MatScaleStmt():
+                return ast.MatScaleStmt(stmt.target, self.expr(stmt.factor), stmt.source)
+            case ast.MatFillStmt():
+                return ast.MatFillStmt(stmt.target, stmt.kind, self.expr(stmt.bounds))
+            case ast.ForStmt():
+                return ast.ForStmt(stmt.var, self.expr(stmt.start), self.expr(stmt.limit),
+                                   self.expr(stmt.step), stmt.target)
+        return stmt
+
+class _FunctionBinder(_ExprRewriter):
+    "stores the implementation of each function call in its Func node"
+
+    def __init__(self, resolve:Callable[[str], Callable]):
+        self.resolve = resolve
+
+    def expr(self, expr:ast.Expr):
+        expr = super().expr(expr)
+        if isinstance(expr, ast.Func):
+            expr.impl = self.resolve(expr.name)
+        return expr
+
+def bind_functions(program:ast.Program, resolve:Callable[[str], Callable]) -> ast.Program:
+    "copy of program with Func.impl set to resolve(name)"
+    binder = _FunctionBinder(resolve)
+    body = [ copy.copy(line) for line in program.body ]
+    for line in body:
+        line.statement = binder.stmt(line.statement)
+    return ast.Program(body)
+
+class _ConstantFolder(_ExprRewriter):
+    "short circuits logical operators and IFs with a literal to decide them"
+
+    def expr(self, expr:ast.Expr):
+        expr = super().expr(expr)
+        if isinstance(expr, ast.LogicalExpr) and isinstance(expr.left, ast.Literal):
+            decided = bool(expr.left.value) == (expr.operator == '||')
+            return expr.left if decided else expr.right
+        return expr
+
+    def stmt(self, stmt:ast.Stmt):
+        stmt = super().stmt(stmt)
+        if isinstance(stmt, ast.IfStmt) and isinstance(stmt.test, ast.Literal):
+            return stmt.consequent if stmt.test.value else stmt.alternate
+        return stmt
+
+class _Memoizer(_ExprRewriter):
+    "wraps loop invariant expressions in CachedExpr"
+
+    # cheaper expressions aren't worth a cache lookup
+    MIN_COST = 2
+
+    def __init__(self, functions:FunctionRegistry):
+        self.functions = functions
+        self.slots = 0
+        self.assigned = set()
+
+    def expr(self, expr:ast.Expr):
+        match expr:
+            case ast.Literal() | ast.Identifier() | ast.CachedExpr() | None:
+                return expr
+
+        if not isinstance(expr, list) and is_pure(expr, self.functions) and _cost(expr) >= self.MIN_COST:
+            deps = tuple(dict.fromkeys(variables_of(expr)))
+            if self.assigned.isdisjoint(deps):
+                self.slots += 1
+                return ast.CachedExpr(expr, deps, self.slots)
+
+        return super().expr(expr)
+
+def _memoize_loops(body:list[ast.Line], functions):
+    """
+    Cache pure expressions that only read variables the loop doesn't assign.
+    The interpreter keys each cache on the versions setvar gives the variables,
+    so a value computed before the loop is reused on every iteration.
+    """
+    cfg = build_cfg(ast.Program(body))
+    memo = _Memoizer(functions)
+
+    # outer loops first, inner ones then skip what's already cached
+    for start, stop in sorted(find_loops(cfg), key=lambda r: r[0]-r[1]):
+        lines = body[start:stop]
+        memo.assigned = set()
+        for line in lines:
+            memo.assigned.update(iter_assigned(line.statement))
+            if any(isinstance(j, ast.GosubStmt) for j in iter_jumps(line.statement)):
+                # the subroutine could assign anything
+                memo.assigned.update(cfg.assigned)
+
+        for line in lines:
+            line.statement = memo.stmt(line.statement)
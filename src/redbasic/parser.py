@@ -1,7 +1,13 @@
 import re
-from .spec import Token, basic_spec
+from .spec import Token, scanner
 from .ast import *
 from . import error
+from .functions import FunctionRegistry, default_registry
+
+# MAT A = ZER, CON or IDN
+MAT_FILLS = ('zer', 'con', 'idn')
+# what makes the name of a builtin that isn't reserved a call
+CALL_PAREN = re.compile(r'[ \t]*\(')
 
 def parse_int(string:str):
     "Helper to handle C style octals"
@@ -28,7 +34,7 @@ def is_keyword(tok:Token):
     return tok.name.startswith('kw_')
 
 def check_assignment_target(e):
-    if isinstance(e, Identifier):
+    if isinstance(e, (Identifier, Subscript)):
         return e
     raise TypeError()
 
@@ -37,7 +43,8 @@ def check_assignment_target(e):
 # Spec = { MODE_ROOT: basic_spec, MODE_LIST: { mode: r"code|ast" }, ... }
 
 class Parser:
-    def __init__(self):
+    def __init__(self, functions:FunctionRegistry=None):
+        self.functions = default_registry if functions is None else functions
         self.undostack = []
         self.lookahead:tuple[Token,str] = Token.eof, None
 
@@ -59,26 +66,31 @@ class Parser:
     # --Tokenize--
 
     def next_token(self) -> tuple[Token, str]:
-        if self.cursor >= len(self.code):
-            return Token.eof, None
-        
-        for tok, pattern in basic_spec.items():
-            m = pattern.match(self.code, self.cursor)
+        pattern, tokens = scanner()
+        code = self.code
+        while self.cursor < len(code):
+            m = pattern.match(code, self.cursor)
             if not m:
-                continue
-            
+                raise self._bad_syntax(f"Unexpected '{code[self.cursor]}'")
+
+            tok = tokens[m.lastgroup]
             tvalue = m.group(0)
-            self.cursor += len(tvalue)
+            self.cursor = m.end()
 
             if tok == Token.eol:
                 self.linenum += 1
 
             if tok in (None, Token.comment):
-                return self.next_token()
+                continue
+
+            if tok == Token.identifier:
+                builtin = self.functions.get(tvalue)
+                if builtin is not None and (builtin.reserved or CALL_PAREN.match(code, self.cursor)):
+                    tok = Token.f_builtin
             
             return tok, tvalue
-        
-        raise self._bad_syntax(f"Unexpected '{self.code[self.cursor]}'")
+
+        return Token.eof, None
     
 
     def eat(self, expected:Token = None) -> tuple[Token, str]:
@@ -175,6 +187,14 @@ class Parser:
             case Token.kw_new:
                 self.eat()
                 return NewStmt()
+            case Token.kw_dim:
+                return self.dim_stmt()
+            case Token.kw_mat:
+                return self.mat_stmt()
+            case Token.kw_for:
+                return self.for_stmt()
+            case Token.kw_next:
+                return self.next_stmt()
             case _:
                 e = self.expression_stmt()
                 if e.expression is None:
@@ -209,10 +229,10 @@ class Parser:
         return InputStmt(varlist)
 
     def var_list(self):
-        variables = [ self.identifier() ]
+        variables = [ self.variable() ]
         while self.lookahead[0] == Token.comma:
             self.eat()
-            variables.append(self.identifier())
+            variables.append(self.variable())
         
         return variables
     
@@ -231,12 +251,71 @@ class Parser:
         return self.variable_decl()
     
     def variable_decl(self):
-        iden = self.identifier()
+        iden = self.variable()
         # variable_init
         self.eat(Token.assignment)
         init = self.assignment_expr()
+        if isinstance(iden, Subscript):
+            # arrays are declared by DIM, LET A(I) = X only assigns
+            return ExpressionStmt(AssignmentExpr('=', iden, init))
         return VariableDecl(iden, init)
 
+    def dim_stmt(self):
+        self.eat(Token.kw_dim)
+        arrays = [ self.subscript(self.identifier()) ]
+        while self.lookahead[0] == Token.comma:
+            self.eat()
+            arrays.append(self.subscript(self.identifier()))
+        return DimStmt(arrays)
+
+    def mat_stmt(self):
+        self.eat(Token.kw_mat)
+        target = self.identifier().name
+        self.eat(Token.assignment)
+
+        if self.lookahead[0] == Token.l_paren:
+            factor = self.paren_expr()
+            _, op = self.eat(Token.multiplicative_op)
+            if op != '*':
+                raise self._bad_syntax(f"MAT can only multiply an array by a number, got '{op}'")
+            return MatScaleStmt(target, factor, self.identifier().name)
+
+        left = self.identifier().name
+        if left.casefold() in MAT_FILLS:
+            bounds = None
+            if self.lookahead[0] == Token.l_paren:
+                self.eat()
+                bounds = self.sequence_expr()
+                self.eat(Token.r_paren)
+            return MatFillStmt(target, left.casefold(), bounds)
+
+        if self.lookahead[0] in (Token.additive_op, Token.multiplicative_op):
+            _, op = self.eat()
+            if op == '/':
+                raise self._bad_syntax("MAT can add, subtract and multiply arrays, not divide them")
+            return MatStmt(target, left, op, self.identifier().name)
+        return MatStmt(target, left)
+
+    def for_stmt(self):
+        self.eat(Token.kw_for)
+        var = self.identifier()
+        self.eat(Token.assignment)
+        start = self.single_expression()
+        self.eat(Token.kw_to)
+        limit = self.single_expression()
+        step = None
+        if self.lookahead[0] == Token.kw_step:
+            self.eat()
+            step = self.single_expression()
+        return ForStmt(var, start, limit, step)
+
+    def next_stmt(self):
+        self.eat(Token.kw_next)
+        var = None
+        if self.lookahead[0] == Token.identifier:
+            var = self.identifier()
+        return NextStmt(var)
+
     def if_stmt(self):
         self.eat(Token.kw_if)
         test = self.expression()
@@ -291,10 +370,19 @@ class Parser:
     def builtin_func(self, func):
         _, name = self.eat(func)
         self.eat(Token.l_paren)
-        args = self.sequence_expr()
+        args = []
+        if self.lookahead[0] != Token.r_paren:
+            args.append(self.argument())
+            while self.lookahead[0] == Token.comma:
+                self.eat()
+                args.append(self.argument())
         self.eat(Token.r_paren)
 
-        return Func(name.casefold(), args)
+        name = name.casefold()
+        if not self.functions.get(name).accepts(len(args)):
+            raise self._bad_syntax(f"wrong number of arguments for {name.upper()}: {len(args)}")
+
+        return Func(name, args)
     
     def end_stmt(self):
         self.eat(Token.kw_end)
@@ -424,7 +512,7 @@ class Parser:
             case Token.l_paren:
                 return self.paren_expr()
             case Token.identifier:
-                return self.identifier()
+                return self.variable()
             case Token.eof | Token.eol:
                 return None
             case Token.f_builtin:
@@ -442,6 +530,37 @@ class Parser:
     def identifier(self):
         _, name = self.eat(Token.identifier)
         return Identifier(name)
+
+    def variable(self) -> Identifier|Subscript:
+        "a variable or an array element"
+        iden = self.identifier()
+        if self.lookahead[0] == Token.l_paren:
+            return self.subscript(iden)
+        return iden
+
+    def subscript(self, iden:Identifier) -> Subscript:
+        "A(i, j)"
+        self.eat(Token.l_paren)
+        if self.lookahead[0] == Token.r_paren:
+            raise self._bad_syntax(f"{iden.name}() is a whole array, it can only be a function argument")
+        indexes = self.sequence_expr()
+        self.eat(Token.r_paren)
+        return Subscript(iden.name, indexes)
+
+    def argument(self) -> Expr:
+        "a function argument, an expression or A() for the whole array"
+        if self.lookahead[0] == Token.identifier:
+            iden = self.identifier()
+            if self.lookahead[0] == Token.l_paren:
+                self.eat()
+                if self.lookahead[0] == Token.r_paren:
+                    self.eat()
+                    if self.lookahead[0] in (Token.comma, Token.r_paren):
+                        return Subscript(iden.name, [])
+                    self.undo()
+                self.undo()
+            self.undo()
+        return self.assignment_expr()
     
     # LITERALS
 
@@ -0,0 +1,143 @@
+# redbasic pre-fork worker pool
+import os, gc, time
+from dataclasses import dataclass
+from multiprocessing.connection import Pipe, wait
+from .interpreter import Interpreter
+from .parser import Parser
+from .batch import program_interpreter, fresh_run
+
+
+@dataclass
+class Reply:
+    name:str
+    output:str
+    error:str
+    seconds:float
+    statements:int
+
+
+def _serve(conn, interps:dict[str, Interpreter]):
+    "worker loop, runs (name, stdin) requests until it gets None"
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        name, stdin = request
+        start = time.perf_counter()
+        interp = interps.get(name)
+        if interp is None:
+            conn.send(Reply(name, '', f'KeyError: no program {name!r}', 0.0, 0))
+            continue
+        statements = interp.metrics.statements
+        err = fresh_run(interp, stdin)
+        conn.send(Reply(name, interp.output.getvalue(), err or '',
+                        time.perf_counter() - start, interp.metrics.statements - statements))
+
+
+class PreforkPool:
+    """
+    Workers forked from a parent that has parsed and linked every
+    program, so they start warm and share the programs copy-on-write.
+    Requests go to the workers over pipes. Needs os.fork, so not on
+    Windows, and it's best created before the parent starts threads.
+    """
+
+    def __init__(self, programs:dict[str, str], workers:int=None, freeze:bool=True):
+        parser = Parser()
+        self.interps = { name: program_interpreter(parser.parse(source)) for name, source in programs.items() }
+
+        # objects that exist now are left out of collections from here on,
+        # so the collector doesn't write to their pages in the workers
+        if freeze:
+            gc.collect()
+            gc.freeze()
+        self.workers = []
+        try:
+            for _ in range(workers or os.cpu_count()):
+                ours, theirs = Pipe()
+                pid = os.fork()
+                if pid == 0:
+                    ours.close()
+                    for _, conn in self.workers:
+                        conn.close()
+                    code = 0
+                    try:
+                        _serve(theirs, self.interps)
+                    except BaseException:
+                        code = 1
+                    finally:
+                        os._exit(code)
+                theirs.close()
+                self.workers.append((pid, ours))
+        finally:
+            if freeze:
+                gc.unfreeze()
+
+    @property
+    def pids(self) -> list[int]:
+        return [ pid for pid, _ in self.workers ]
+
+    def map(self, requests):
+        """
+        Replies to (name, stdin) requests in their order, every worker
+        has one request at a time. Stopping early waits for the requests
+        that were already sent, their replies would go to the next map.
+        """
+        requests = iter(requests)
+        idle = [ conn for _, conn in self.workers ]
+        busy = {}
+        done = {}
+        sent = received = 0
+        exhausted = False
+        try:
+            while True:
+                while idle and not exhausted:
+                    request = next(requests, None)
+                    if request is None:
+                        exhausted = True
+                        break
+                    conn = idle.pop()
+                    conn.send(request)
+                    busy[conn] = sent
+                    sent += 1
+                if not busy:
+                    return
+                for conn in wait(list(busy)):
+                    try:
+                        reply = conn.recv()
+                    except EOFError:
+                        raise RuntimeError('a worker of the pool died') from None
+                    done[busy.pop(conn)] = reply
+                    idle.append(conn)
+                while received in done:
+                    yield done.pop(received)
+                    received += 1
+        finally:
+            for conn in busy:
+                try:
+                    conn.recv()
+                except EOFError:
+                    pass
+
+    def run(self, name:str, stdin:str='') -> Reply:
+        return next(self.map([(name, stdin)]))
+
+    def close(self):
+        for pid, conn in self.workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for pid, _ in self.workers:
+            os.waitpid(pid, 0)
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
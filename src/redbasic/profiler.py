@@ -0,0 +1,116 @@
+# redbasic execution profiler
+import json
+from collections import Counter
+from dataclasses import dataclass, asdict
+from . import ast
+
+FORMATS = ('text', 'json', 'collapsed')
+
+
+@dataclass
+class LineStats:
+    count:int = 0
+    # seconds spent running the line, and the part of it spent evaluating expressions
+    total:float = 0.0
+    exprs:float = 0.0
+
+
+class Profiler:
+    """
+    Statistics collected by Interpreter.profile. Lines are keyed by
+    their index in the program body, jumps by (kind, from, to) where
+    kind is goto, gosub or return.
+    """
+
+    def __init__(self):
+        self.lines:dict[int, LineStats] = {}
+        self.edges:Counter[tuple[str, int, int]] = Counter()
+        # seconds per stack of GOSUB call sites, ending in the line that ran
+        self.stacks:Counter[tuple[int, ...]] = Counter()
+        self.elapsed = 0.0
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def record(self, index:int, total:float, exprs:float, stack:tuple[int, ...]):
+        stats = self.lines.get(index)
+        if stats is None:
+            stats = self.lines[index] = LineStats()
+        stats.count += 1
+        stats.total += total
+        stats.exprs += exprs
+        self.stacks[stack + (index,)] += total
+
+    def hot_lines(self):
+        "(index, stats) from the most to the least time spent"
+        return sorted(self.lines.items(), key=lambda x: x[1].total, reverse=True)
+
+    # --- output ---
+
+    def report(self, program:ast.Program, top:int=None) -> str:
+        "hot line table with the source of each line"
+        out = [f"{'count':>9} {'total ms':>10} {'expr ms':>10}  line"]
+        for index, st in self.hot_lines()[:top]:
+            out.append(f"{st.count:>9} {st.total*1e3:>10.3f} {st.exprs*1e3:>10.3f}  {line_source(program, index)}")
+
+        if self.edges:
+            out.append('')
+            out.append(f"{'count':>9} {'jump':<7} from -> to")
+            for (kind, src, dst), count in self.edges.most_common():
+                out.append(f"{count:>9} {kind:<7} {line_name(program, src)} -> {line_name(program, dst)}")
+
+        out.append('')
+        out.append(f"cached expressions: {self.memo_hits} hits, {self.memo_misses} misses")
+        statements = sum(st.count for st in self.lines.values())
+        out.append(f"{statements} statements in {self.elapsed*1e3:.3f} ms")
+        return '\n'.join(out)
+
+    def to_json(self, program:ast.Program) -> str:
+        data = {
+            'elapsed': self.elapsed,
+            'memo': { 'hits': self.memo_hits, 'misses': self.memo_misses },
+            'lines': [
+                { 'index': index, 'line': line_name(program, index),
+                  'source': stmt_source(program, index), **asdict(st) }
+                for index, st in self.hot_lines()
+            ],
+            'edges': [
+                { 'kind': kind, 'from': src, 'to': dst, 'count': count }
+                for (kind, src, dst), count in self.edges.most_common()
+            ],
+        }
+        return json.dumps(data, indent=2)
+
+    def collapsed(self, program:ast.Program) -> str:
+        "folded stacks for flamegraph tools, weights are in microseconds"
+        out = []
+        for stack, seconds in self.stacks.items():
+            # ';' separates frames
+            frames = [ line_source(program, i).replace(';', ':') for i in stack ]
+            out.append(f"{';'.join(['main', *frames])} {round(seconds * 1e6)}")
+        return '\n'.join(out)
+
+    def format(self, program:ast.Program, fmt:str='text') -> str:
+        if fmt == 'text':
+            return self.report(program)
+        if fmt == 'json':
+            return self.to_json(program)
+        if fmt == 'collapsed':
+            return self.collapsed(program)
+        raise ValueError(f"invalid profile format '{fmt}'")
+
+
+def line_name(program:ast.Program, index:int) -> str:
+    "label, line number or #index of a line"
+    line = program.body[index]
+    if isinstance(line, ast.Label):
+        return line.name + ':'
+    if line.linenum:
+        return str(line.linenum)
+    return f'#{index}'
+
+def stmt_source(program:ast.Program, index:int) -> str:
+    stmt = program.body[index].statement
+    return ast.reconstruct_stmt(stmt) if stmt is not None else ''
+
+def line_source(program:ast.Program, index:int) -> str:
+    return f'{line_name(program, index)} {stmt_source(program, index)}'
@@ -0,0 +1,106 @@
+# redbasic random numbers
+import random, importlib.util
+
+# NumPy takes longer to import than the rest of the interpreter together,
+# it's imported by the first generator that uses it
+_numpy = None
+
+def _import_numpy():
+    global _numpy
+    if _numpy is None:
+        import numpy
+        _numpy = numpy
+    return _numpy
+
+def __getattr__(name):
+    # rng.numpy is the module, or None when it isn't installed
+    if name == 'numpy':
+        return _import_numpy() if has_numpy() else None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# whether NumPy is installed, looked up once, every interpreter asks
+_has_numpy:bool = None
+
+def has_numpy() -> bool:
+    global _has_numpy
+    if _has_numpy is None:
+        _has_numpy = _numpy is not None or importlib.util.find_spec('numpy') is not None
+    return _has_numpy
+
+BACKENDS = ('numpy', 'python')
+
+# how many numbers are drawn at once for each RND range
+BATCH_SIZE = 256
+
+
+class RandomSource:
+    """
+    Seedable generator behind RND, every interpreter owns one.
+    Integers are generated in batches per (low, high) range, with
+    NumPy when it's installed and the random module otherwise.
+    """
+
+    def __init__(self, seed=None, batch:int=BATCH_SIZE, backend:str=None):
+        if backend is None:
+            backend = 'numpy' if has_numpy() else 'python'
+        if backend not in BACKENDS or (backend == 'numpy' and not has_numpy()):
+            raise ValueError(f"random backend '{backend}' is not available")
+
+        self.backend = backend
+        self.batch = batch
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        "restart the sequence, None seeds from the OS"
+        # the generator is made on first use, programs without RND never need it
+        self._seed = seed
+        self._gen = None
+        self._batches:dict[tuple[int, int], list[int]] = {}
+
+    def rnd(self, low:int, high:int=None):
+        "RND(high) is in [0, high], RND(low, high) is in [low, high]"
+        if high is None:
+            low, high = 0, low
+        return self.randint(low, high)
+
+    def randint(self, low:int, high:int):
+        try:
+            return self._batches[low, high].pop()
+        except (KeyError, IndexError):
+            pass
+
+        if low > high:
+            raise ValueError(f"empty range for RND({low}, {high})")
+        batch = self._batches[low, high] = self._generate(low, high)
+        return batch.pop()
+
+    def _generator(self):
+        if self._gen is None:
+            if self.backend == 'numpy':
+                self._gen = _import_numpy().random.default_rng(self._seed)
+            else:
+                self._gen = random.Random(self._seed)
+        return self._gen
+
+    def _generate(self, low:int, high:int) -> list[int]:
+        if self.backend == 'numpy':
+            return self._generator().integers(low, high, endpoint=True, size=self.batch).tolist()
+        return self._generator().choices(range(low, high+1), k=self.batch)
+
+    def getstate(self):
+        "state for setstate, pending batches included"
+        if self.backend == 'numpy':
+            gen = self._generator().bit_generator.state
+        else:
+            gen = self._generator().getstate()
+        return self.backend, gen, { k: v.copy() for k, v in self._batches.items() }
+
+    def setstate(self, state):
+        backend, gen, batches = state
+        if backend != self.backend:
+            raise ValueError(f"state is from the '{backend}' backend, this is '{self.backend}'")
+        if self.backend == 'numpy':
+            self._generator().bit_generator.state = gen
+        else:
+            self._generator().setstate(gen)
+        self._batches = { k: v.copy() for k, v in batches.items() }
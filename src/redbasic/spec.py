@@ -1,4 +1,4 @@
-import re
+import re, functools
 from enum import Enum, StrEnum, auto
 from typing import NamedTuple
 
@@ -59,6 +59,12 @@ class Token(StrEnum):
     kw_true = 'true'
     kw_false = 'false'
     kw_new = 'new'
+    kw_dim = 'dim'
+    kw_for = 'for'
+    kw_to = 'to'
+    kw_step = 'step'
+    kw_next = 'next'
+    kw_mat = 'mat'
     # symbols
     l_paren = '('
     r_paren = ')'
@@ -66,65 +72,95 @@ class Token(StrEnum):
     semicolon = ';'
 
 # lang spec definition
-rxc = re.compile
-basic_spec = {
+# (token, pattern, flags) in the order they're tried, None is skipped
+basic_rules = [
     # ignorables
-    Token.eol: rxc(r"(\r\n|\n)"),
-    None: rxc(r'\s+'), 
-    Token.comment: rxc(r"\bREM\b.*", re.IGNORECASE),
-    
+    (Token.eol, r"(\r\n|\n)", 0),
+    (None, r'\s+', 0),
+    (Token.comment, r"\bREM\b.*", re.IGNORECASE),
+
     # Numbers
     #   floating point w/ scientific exponents
-    Token.floatingpoint: rxc(r"(\d+\.\d*)([Ee][-+]?\d+)?"),
+    (Token.floatingpoint, r"(\d+\.\d*)([Ee][-+]?\d+)?", 0),
     #   support oldschool $90 hex: integers, in HEX, OCTAL and DECIMAL respectivly. TODO
-    Token.integer: rxc(r"((0[xX][a-fA-F\d]+)|(0[0-7]+)|(\d+))"),
-    Token.string_literal: rxc(r'"[^"]*"'),
+    (Token.integer, r"((0[xX][a-fA-F\d]+)|(0[0-7]+)|(\d+))", 0),
+    (Token.string_literal, r'"[^"]*"', 0),
 
     # equality
-    Token.equality_op: rxc(r'(==|<>|><)'),
+    (Token.equality_op, r'(==|<>|><)', 0),
 
     # assignment
-    Token.assignment_complex: rxc(r'[-+*/]='),
-    Token.assignment: rxc(r'='),
+    (Token.assignment_complex, r'[-+*/]=', 0),
+    (Token.assignment, r'=', 0),
 
     # relational
-    Token.relational_op: rxc(r'[><]=?'),
+    (Token.relational_op, r'[><]=?', 0),
 
     # math operations
-    Token.additive_op: rxc(r"[+\-]"),
-    Token.multiplicative_op: rxc(r"[*/]"),
+    (Token.additive_op, r"[+\-]", 0),
+    (Token.multiplicative_op, r"[*/]", 0),
 
-    Token.l_paren: rxc(r"\("),
-    Token.r_paren: rxc(r"\)"),
-    Token.comma: rxc(r','),
-    Token.semicolon: rxc(r';'),
+    (Token.l_paren, r"\(", 0),
+    (Token.r_paren, r"\)", 0),
+    (Token.comma, r',', 0),
+    (Token.semicolon, r';', 0),
 
-    Token.logical_not: rxc(r'!'),
-    Token.logical_and: rxc(r'&&'),
-    Token.logical_or: rxc(r'\|\|'),
+    (Token.logical_not, r'!', 0),
+    (Token.logical_and, r'&&', 0),
+    (Token.logical_or, r'\|\|', 0),
 
     # keywords
-    Token.kw_print: rxc(r"\b(PRINT|PR)\b", re.IGNORECASE),
-    Token.kw_if: rxc(r"\bIF\b", re.IGNORECASE),
-    Token.kw_then: rxc(r"\bTHEN\b", re.IGNORECASE),
-    Token.kw_else: rxc(r"\bELSE\b", re.IGNORECASE),
-    Token.kw_input: rxc(r"\bINPUT\b", re.IGNORECASE),
-    Token.kw_let: rxc(r"\bLET\b", re.IGNORECASE),
-    Token.kw_goto: rxc(r"\bGOTO\b", re.IGNORECASE),
-    Token.kw_gosub: rxc(r"\bGOSUB\b", re.IGNORECASE),
-    Token.kw_return: rxc(r"\bRETURN\b", re.IGNORECASE),
-    Token.kw_end: rxc(r"\bEND\b", re.IGNORECASE),
-    Token.kw_clear: rxc(r"\bCLEAR\b", re.IGNORECASE),
-    Token.kw_list: rxc(r"\bLIST\b", re.IGNORECASE),
-    Token.kw_run: rxc(r"\bRUN\b", re.IGNORECASE),
-    Token.kw_new: rxc(r"\bNEW\b", re.IGNORECASE),
-
-    # builtin functions
-    Token.f_builtin: rxc(r"\b(USR|RND|POW|SQRT)\b", re.IGNORECASE),
+    (Token.kw_print, r"\b(PRINT|PR)\b", re.IGNORECASE),
+    (Token.kw_if, r"\bIF\b", re.IGNORECASE),
+    (Token.kw_then, r"\bTHEN\b", re.IGNORECASE),
+    (Token.kw_else, r"\bELSE\b", re.IGNORECASE),
+    (Token.kw_input, r"\bINPUT\b", re.IGNORECASE),
+    (Token.kw_let, r"\bLET\b", re.IGNORECASE),
+    (Token.kw_goto, r"\bGOTO\b", re.IGNORECASE),
+    (Token.kw_gosub, r"\bGOSUB\b", re.IGNORECASE),
+    (Token.kw_return, r"\bRETURN\b", re.IGNORECASE),
+    (Token.kw_end, r"\bEND\b", re.IGNORECASE),
+    (Token.kw_clear, r"\bCLEAR\b", re.IGNORECASE),
+    (Token.kw_list, r"\bLIST\b", re.IGNORECASE),
+    (Token.kw_run, r"\bRUN\b", re.IGNORECASE),
+    (Token.kw_new, r"\bNEW\b", re.IGNORECASE),
+    (Token.kw_dim, r"\bDIM\b", re.IGNORECASE),
+    (Token.kw_for, r"\bFOR\b", re.IGNORECASE),
+    (Token.kw_to, r"\bTO\b", re.IGNORECASE),
+    (Token.kw_step, r"\bSTEP\b", re.IGNORECASE),
+    (Token.kw_next, r"\bNEXT\b", re.IGNORECASE),
+    (Token.kw_mat, r"\bMAT\b", re.IGNORECASE),
+    # builtin functions are identifiers found in the parser's FunctionRegistry
 
     # identifiers
     #   named labels
-    Token.named_label: rxc(r"[a-zA-Z_]\w*:"),
+    (Token.named_label, r"[a-zA-Z_]\w*:", 0),
     #   variables
-    Token.identifier: rxc(r"[a-zA-Z_]\w*")
-}
+    (Token.identifier, r"[a-zA-Z_]\w*", 0),
+]
+
+
+def __getattr__(name):
+    # compiled on first use, it's a good part of the import time otherwise
+    if name == 'basic_spec':
+        global basic_spec
+        basic_spec = { tok: re.compile(pattern, flags) for tok, pattern, flags in basic_rules }
+        return basic_spec
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.cache
+def scanner() -> tuple[re.Pattern, dict[str, Token]]:
+    """
+    All the rules in one pattern, compiled the first time a program is
+    parsed. Alternatives are tried in order like the rules, the name of
+    the group that matched maps to its token.
+    """
+    groups = []
+    tokens = {}
+    for n, (tok, pattern, flags) in enumerate(basic_rules):
+        if flags & re.IGNORECASE:
+            pattern = f'(?i:{pattern})'
+        groups.append(f'(?P<r{n}>{pattern})')
+        tokens[f'r{n}'] = tok
+    return re.compile('|'.join(groups)), tokens
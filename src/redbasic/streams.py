@@ -0,0 +1,210 @@
+# redbasic I/O layer
+import re, io, codecs
+from collections import deque
+from typing import TextIO as Stream
+from .parser import parse_int
+
+# buffering modes
+LINE_BUFFERED = 'line'
+FULLY_BUFFERED = 'full'
+BUFFER_MODES = (LINE_BUFFERED, FULLY_BUFFERED)
+
+BUFFER_SIZE = 64 * 1024
+
+# numbers INPUT understands, anything else is kept as a string. Digits can
+# be grouped with single underscores, 1_000, like Python's int() and float()
+#   groups: 1 decimal integer, 2 hex integer, 3 float
+_DIGITS = r"\d(?:_?\d)*"
+NUMBER = re.compile(rf"[-+]?(?:({_DIGITS})|(0[xX](?:_?[\da-fA-F])+)"
+                    rf"|((?:{_DIGITS}\.?(?:{_DIGITS})?|\.{_DIGITS})(?:[eE][-+]?{_DIGITS})?|(?i:inf(?:inity)?|nan)))")
+_INTEGER, _HEX = 1, 2
+
+
+def parse_value(text:str) -> int|float|str:
+    "convert an INPUT line to the value it represents"
+    if text.isdecimal():
+        # plain integers are the common case, skip the regex
+        return int(text)
+
+    m = NUMBER.fullmatch(text)
+    if m is None:
+        return text
+
+    kind = m.lastindex
+    if kind == _INTEGER:
+        return int(text)
+    if kind == _HEX:
+        return parse_int(text)
+
+    value = float(text)
+    if value.is_integer():
+        value = int(value)
+    return value
+
+
+class OutputBuffer:
+    """
+    Collects program output and hands it to the stream in big writes.
+        line: flush after every complete line, for terminals
+        full: flush when size characters are waiting
+    """
+
+    def __init__(self, stream:Stream, mode:str=None, size:int=BUFFER_SIZE):
+        if mode is None:
+            mode = LINE_BUFFERED if stream.isatty() else FULLY_BUFFERED
+        if mode not in BUFFER_MODES:
+            raise ValueError(f"invalid buffering mode '{mode}'")
+
+        self.stream = stream
+        self.mode = mode
+        self.size = size
+        self._parts:list[str] = []
+        self._pending = 0
+        # bytes handed to the stream so far
+        self.written = 0
+        self.encoding = getattr(stream, 'encoding', None) or 'utf-8'
+
+    def write(self, text:str):
+        self._parts.append(text)
+        self._pending += len(text)
+
+        if self._pending >= self.size or (self.mode == LINE_BUFFERED and '\n' in text):
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            data = ''.join(self._parts)
+            self.stream.write(data)
+            self.written += len(data) if data.isascii() else len(data.encode(self.encoding, 'replace'))
+            self._parts.clear()
+            self._pending = 0
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+class InputReader:
+    """
+    Hands out input lines. Interactive streams are read a line at a
+    time, anything else is read in blocks of up to blocksize characters.
+    Pipes and files are read through their binary buffer, a block is
+    what has arrived so far, so a driver that writes a line and waits
+    for the output doesn't deadlock. Don't read from the stream itself
+    while the reader is in use, text it buffers is skipped.
+    """
+
+    def __init__(self, stream:Stream, blocksize:int=BUFFER_SIZE):
+        self.stream = stream
+        self.blocksize = blocksize
+        self.interactive = stream.isatty()
+        self._raw = None
+        buffer = getattr(stream, 'buffer', None)
+        if not self.interactive and hasattr(buffer, 'read1'):
+            self._raw = buffer
+            decoder = codecs.getincrementaldecoder(stream.encoding)(stream.errors or 'strict')
+            # \r\n and \r are line breaks too, like reading the text stream
+            self._decoder = io.IncrementalNewlineDecoder(decoder, translate=True)
+        # lines handed out so far
+        self.count = 0
+        self._lines:deque[str] = deque()
+        self._partial = ''
+
+    def available(self, n:int):
+        "n lines can be read without waiting, a blocking stream always can"
+        return True
+
+    def readline(self) -> str:
+        "next line without its line break, '' at the end of input"
+        line = self._next()
+        if line is None:
+            return ''
+        self.count += 1
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self._next()
+        if line is None:
+            raise StopIteration
+        self.count += 1
+        return line
+
+    def mark(self):
+        "where the reader is, for rewind, the stream has to be seekable"
+        return self.count, self.stream.tell(), list(self._lines), self._partial
+
+    def rewind(self, mark):
+        "go back to a mark, the lines read since then are handed out again"
+        self.count, pos, lines, self._partial = mark
+        self.stream.seek(pos)
+        self._lines = deque(lines)
+
+    def _next(self):
+        if self.interactive:
+            line = self.stream.readline()
+            return line.rstrip('\n') if line else None
+
+        lines = self._lines
+        while not lines and self._fill():
+            pass
+        return lines.popleft() if lines else None
+
+    def _fill(self):
+        "read a block, False at the end of input"
+        if self._raw is None:
+            block = self.stream.read(self.blocksize)
+        else:
+            # blocks only until some input arrives
+            data = self._raw.read1(self.blocksize)
+            block = self._decoder.decode(data, final=not data)
+        if not block:
+            if self._partial:
+                self._lines.append(self._partial)
+                self._partial = ''
+            return False
+
+        lines = (self._partial + block).split('\n')
+        self._partial = lines.pop()
+        self._lines.extend(lines)
+        return True
+
+
+class FeedReader:
+    """
+    Input for hosts that receive it asynchronously. Text is fed in as
+    it arrives and close() marks the end of input, INPUT raises
+    error.InputNeeded while the lines it needs haven't arrived.
+    """
+
+    interactive = False
+
+    def __init__(self):
+        self.closed = False
+        self.count = 0
+        self._lines:deque[str] = deque()
+        self._partial = ''
+
+    def feed(self, text:str):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        self._lines.extend(lines)
+
+    def close(self):
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = ''
+        self.closed = True
+
+    def available(self, n:int):
+        return self.closed or len(self._lines) >= n
+
+    def readline(self) -> str:
+        "next line without its line break, '' at the end of input or when there's none yet"
+        if not self._lines:
+            return ''
+        self.count += 1
+        return self._lines.popleft()
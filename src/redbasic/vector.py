@@ -0,0 +1,513 @@
+# redbasic lane-vectorized execution
+#   runs a program for many inputs at once, a lane per input. Values that
+#   are the same in every lane stay Python values, the rest are NumPy arrays.
+#   As long as the lanes take the same jumps a statement runs once for all
+#   of them; when they'd part ways, or an array operation could give another
+#   result than Python would, the lanes go on one at a time in Interpreters.
+import io, operator
+from dataclasses import dataclass
+from . import ast, error
+from .cfg import build_cfg
+from .functions import FunctionRegistry, default_registry
+from .interpreter import Interpreter, DONE, VAR_NOT_FOUND
+from .optimize import is_pure
+from .streams import InputReader, parse_value
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# int arrays hold values up to this size, Python ints have no limit
+INT_LIMIT = 2**63 - 1
+# ints up to this size convert to floats exactly
+EXACT_FLOAT = 2**53
+
+# statements an Interpreter runs between checks when lanes go on one at a time
+SLICE = 100_000
+
+SCALAR_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '<>': operator.ne,
+    '><': operator.ne,
+}
+
+ARITHMETIC = ('+', '-', '*', '/')
+
+if numpy is not None:
+    ARRAY_OPS = {
+        '+': numpy.add,
+        '-': numpy.subtract,
+        '*': numpy.multiply,
+        '/': numpy.true_divide,
+        '>': numpy.greater,
+        '>=': numpy.greater_equal,
+        '<': numpy.less,
+        '<=': numpy.less_equal,
+        '==': numpy.equal,
+        '<>': numpy.not_equal,
+        '><': numpy.not_equal,
+    }
+
+
+class Diverge(Exception):
+    "the lanes can't go on together"
+
+
+class Mixed(list):
+    "values of every lane that don't fit an array, e.g. INPUT read numbers in some lanes and text in others"
+
+
+@dataclass
+class LaneResult:
+    "what an Interpreter running the program for the lane would end with"
+    variables:dict
+    output:str
+    error:Exception = None
+
+
+@dataclass
+class LaneBatch:
+    lanes:list[LaneResult]
+    # body index where the lanes went on one at a time, None if they never did
+    diverged_at:int = None
+    # statements run for all lanes at once
+    vector_statements:int = 0
+
+
+def run_lanes(program:ast.Program, inputs:list[str], seeds:list=None,
+              functions:FunctionRegistry=None) -> LaneBatch:
+    """
+    Run program once per input text, as Interpreter(textin=StringIO(text),
+    seed=seeds[i]) would, with every lane's variables and output in the
+    result. Without NumPy all lanes run one at a time.
+    """
+    return VectorRun(program, inputs, seeds, functions).run()
+
+
+def _kind(value):
+    "b, i or f for booleans, ints and floats, None for anything else"
+    if isinstance(value, numpy.ndarray):
+        return value.dtype.kind
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'i'
+    if isinstance(value, float):
+        return 'f'
+    return None
+
+def _bound(value) -> int:
+    "largest magnitude of an int value"
+    if isinstance(value, numpy.ndarray):
+        return int(numpy.abs(value).max())
+    return abs(value)
+
+def _as_int(value):
+    "booleans take part in arithmetic as ints"
+    if isinstance(value, numpy.ndarray):
+        return value.astype(numpy.int64)
+    return int(value)
+
+
+class VectorRun:
+    "state of a lane-vectorized run, see run_lanes"
+
+    def __init__(self, program:ast.Program, inputs:list[str], seeds:list=None,
+                 functions:FunctionRegistry=None):
+        self.program = program
+        self.functions = (default_registry if functions is None else functions)
+        self.seeds = seeds
+        self.lanes = len(inputs)
+        self.readers = [ InputReader(io.StringIO(text)) for text in inputs ]
+        self.outputs:list[list[str]] = [ [] for _ in inputs ]
+        self.index = build_cfg(program).index
+        self.variables = {}
+        self.substack = []
+        # lanes an IF with a test that differs between lanes runs its branch for
+        self.mask = None
+        self.statements = 0
+
+    def run(self) -> LaneBatch:
+        body = self.program.body
+        self.cursor = 0
+        if numpy is None or not self.lanes:
+            return self.per_lane()
+
+        with numpy.errstate(all='ignore'):
+            return self._run(body)
+
+    def _run(self, body:list[ast.Line]) -> LaneBatch:
+        maxcursor = len(body)
+        while self.cursor < maxcursor:
+            stmt = body[self.cursor].statement
+            # arrays are never changed in place, a shallow copy is a snapshot
+            saved = self.variables.copy()
+            # PRINT and INPUT, also in the branches of an IF, write and read lanes
+            io_stmt = not isinstance(stmt, (ast.ExpressionStmt, ast.VariableDecl))
+            if io_stmt:
+                printed = [ len(out) for out in self.outputs ]
+                marks = [ reader.mark() for reader in self.readers ]
+            self.nextcursor = None
+            try:
+                self.exec_statement(stmt)
+            except Exception:
+                # Diverge, or an error that may only happen in some lanes:
+                # every lane runs the statement again on its own, from where it was
+                self.variables = saved
+                if io_stmt:
+                    for out, n in zip(self.outputs, printed):
+                        del out[n:]
+                    for reader, mark in zip(self.readers, marks):
+                        reader.rewind(mark)
+                self.mask = None
+                return self.per_lane()
+
+            self.statements += 1
+            if self.nextcursor is not None:
+                self.cursor = self.nextcursor
+            else:
+                self.cursor += 1
+
+        lanes = self._lane_variables()
+        return LaneBatch([ LaneResult(lanes[i], ''.join(self.outputs[i])) for i in range(self.lanes) ],
+                         None, self.statements)
+
+    def per_lane(self) -> LaneBatch:
+        "run every lane from the cursor in an Interpreter of its own"
+        results = []
+        lanes = self._lane_variables()
+        for i in range(self.lanes):
+            interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(), optimize=False,
+                                 seed=self.seeds[i] if self.seeds else None, functions=self.functions)
+            interp.ast = self.program
+            interp.reader = self.readers[i]
+            interp.begin()
+            interp.variables = lanes[i]
+            interp.substack = self.substack.copy()
+            interp.cursor = self.cursor
+
+            err = None
+            try:
+                while interp.run_for(SLICE) != DONE:
+                    pass
+            except Exception as e:
+                err = e
+            results.append(LaneResult(interp.variables, ''.join(self.outputs[i]) + interp.output.getvalue(), err))
+        return LaneBatch(results, self.cursor, self.statements)
+
+    def _lane_variables(self) -> list[dict]:
+        values = { name: self._lanes(value) for name, value in self.variables.items() }
+        return [ { name: v[i] for name, v in values.items() } for i in range(self.lanes) ]
+
+    # --- values ---
+
+    def _lanes(self, value) -> list:
+        "the value of every lane, as Python values"
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+        if isinstance(value, Mixed):
+            return value
+        return [value] * self.lanes
+
+    def _array(self, values:list):
+        "value holding a Python value per lane"
+        first = values[0]
+        kind = type(first)
+        if all(type(v) is kind for v in values):
+            if kind is bool:
+                return numpy.array(values, dtype=numpy.bool_)
+            if kind is int and max(map(abs, values)) <= INT_LIMIT:
+                return numpy.array(values, dtype=numpy.int64)
+            if kind is float:
+                return numpy.array(values, dtype=numpy.float64)
+            if all(v == first for v in values):
+                return first
+        return Mixed(values)
+
+    def _where(self, mask, a, b):
+        "a in the lanes of mask, b in the others"
+        if not isinstance(a, numpy.ndarray) and not isinstance(b, numpy.ndarray) and type(a) is type(b) and a == b:
+            return a
+        ka, kb = _kind(a), _kind(b)
+        # a lane would end up with another type than in Python
+        if ka is None or ka != kb:
+            raise Diverge()
+        if ka == 'i' and max(_bound(a), _bound(b)) > INT_LIMIT:
+            raise Diverge()
+        return numpy.where(mask, a, b)
+
+    def _truth(self, value):
+        "bool array of the lanes where value is true"
+        if _kind(value) is None:
+            raise Diverge()
+        return value != 0
+
+    # --- statements ---
+
+    def exec_statement(self, stmt:ast.Stmt):
+        masked = self.mask is not None
+        match stmt:
+            case ast.VariableDecl():
+                name = stmt.iden.name
+                if name in self.variables:
+                    raise RuntimeError(f"'{name}' already defined")
+                if masked:
+                    raise Diverge()
+                self.setvar(name, self.eval(stmt.init))
+            case ast.ExpressionStmt():
+                val = self.eval(stmt.expression)
+                if not isinstance(stmt.expression, ast.AssignmentExpr):
+                    self.setvar(Interpreter.TEMP_VAR, val)
+            case ast.PrintStmt():
+                self._print(stmt)
+            case ast.GotoStmt() if not masked:
+                self._goto(stmt)
+            case ast.EndStmt() if not masked:
+                self.nextcursor = 2**31
+            case ast.IfStmt():
+                self._if(stmt)
+            case ast.InputStmt() if not masked:
+                self._input(stmt)
+            case ast.ReturnStmt() if not masked:
+                self.nextcursor = self.substack.pop()
+            case None:
+                pass
+            case _:
+                # jumps in some lanes only, and statements for the REPL
+                raise Diverge()
+
+    def _print(self, stmt:ast.PrintStmt):
+        columns = []
+        for item in stmt.printlist:
+            val = self.eval(item.expression)
+            if item.sep == ',':
+                fmt = lambda v: format(v, '<8')
+            elif item.sep == ';' or item.sep is None:
+                fmt = str
+            else:
+                raise error.BadSyntax(f"Bad print separator '{item.sep}'", self.cursor)
+            if isinstance(val, (numpy.ndarray, Mixed)):
+                columns.append([ fmt(v) for v in self._lanes(val) ])
+            else:
+                columns.append(fmt(val))
+
+        lanes = range(self.lanes) if self.mask is None else numpy.flatnonzero(self.mask).tolist()
+        if all(isinstance(c, str) for c in columns):
+            text = ''.join(columns) + '\n'
+            for i in lanes:
+                self.outputs[i].append(text)
+        else:
+            for i in lanes:
+                self.outputs[i].append(''.join(c if isinstance(c, str) else c[i] for c in columns) + '\n')
+
+    def _goto(self, goto:ast.GotoStmt):
+        if isinstance(goto.destination, ast.Identifier):
+            dest = self.variables.get(goto.destination.name, VAR_NOT_FOUND)
+        else:
+            dest = self.eval(goto.destination)
+
+        if dest is VAR_NOT_FOUND:
+            dest = goto.destination.name
+        if isinstance(dest, (numpy.ndarray, Mixed)):
+            raise Diverge()
+        if dest == 0:
+            raise error.Err("0 is not a valid destination")
+
+        dest = self.index.get(dest, -1)
+        if dest == -1:
+            raise RuntimeError(f"Unexpected destination {dest}")
+
+        if isinstance(goto, ast.GosubStmt):
+            if len(self.substack) > 255:
+                raise RecursionError()
+            self.substack.append(self.cursor+1)
+        self.nextcursor = dest
+
+    def _if(self, stmt:ast.IfStmt):
+        cond = self.eval(stmt.test)
+        if not isinstance(cond, (numpy.ndarray, Mixed)):
+            if cond:
+                self.exec_statement(stmt.consequent)
+            elif stmt.alternate:
+                self.exec_statement(stmt.alternate)
+            return
+
+        truth = self._truth(cond)
+        outer = self.mask
+        taken = truth if outer is None else truth & outer
+        skipped = ~truth if outer is None else ~truth & outer
+        if not skipped.any():
+            self.exec_statement(stmt.consequent)
+        elif not taken.any():
+            if stmt.alternate:
+                self.exec_statement(stmt.alternate)
+        else:
+            # both branches run, each one only changes its own lanes
+            try:
+                self.mask = taken
+                self.exec_statement(stmt.consequent)
+                if stmt.alternate:
+                    self.mask = skipped
+                    self.exec_statement(stmt.alternate)
+            finally:
+                self.mask = outer
+
+    def _input(self, stmt:ast.InputStmt):
+        if any(isinstance(var, ast.Subscript) for var in stmt.varlist):
+            raise Diverge()
+        for var in stmt.varlist:
+            values = [ parse_value(reader.readline().strip()) for reader in self.readers ]
+            self.setvar(var.name, self._array(values))
+
+    # --- expressions ---
+
+    def eval(self, expr:ast.Expr):
+        match expr:
+            case ast.Literal():
+                return expr.value
+            case list():
+                return [self.eval(e) for e in expr]
+            case ast.AssignmentExpr():
+                return self._assignment(expr)
+            case ast.LogicalExpr():
+                return self._logical_expr(expr)
+            case ast.BinaryExpr():
+                return self._binop(expr.operator, self.eval(expr.left), self.eval(expr.right))
+            case ast.UnaryExpr():
+                return self._unary_expr(expr)
+            case ast.Identifier():
+                return self.getvar(expr.name)
+            case ast.Func():
+                return self._func(expr)
+        raise Diverge()
+
+    def _assignment(self, expr:ast.AssignmentExpr):
+        # arrays aren't vectorized, DIM already sent the lanes their own ways
+        if not isinstance(expr.left, ast.Identifier):
+            raise Diverge()
+        name = expr.left.name
+        value = self.eval(expr.right)
+        if expr.operator != '=':
+            value = self._binop(expr.operator[0], self.getvar(name), value)
+        self.setvar(name, value)
+        return value
+
+    def _binop(self, op:str, a, b):
+        arrays = (numpy.ndarray, Mixed)
+        if not isinstance(a, arrays) and not isinstance(b, arrays):
+            # the same in every lane, exactly what the interpreter does
+            return SCALAR_OPS[op](a, b)
+
+        ka, kb = _kind(a), _kind(b)
+        if ka is None or kb is None:
+            raise Diverge()
+
+        if op in ARITHMETIC:
+            if ka == 'b':
+                a, ka = _as_int(a), 'i'
+            if kb == 'b':
+                b, kb = _as_int(b), 'i'
+            if op == '/':
+                if numpy.any(b == 0):
+                    raise Diverge()
+                # Python divides ints exactly, floats are only exact this far
+                if ka == kb == 'i' and max(_bound(a), _bound(b)) > EXACT_FLOAT:
+                    raise Diverge()
+            elif ka == kb == 'i':
+                limit = _bound(a) * _bound(b) if op == '*' else _bound(a) + _bound(b)
+                if limit > INT_LIMIT:
+                    raise Diverge()
+        elif 'f' in (ka, kb) and 'i' in (ka, kb):
+            # Python compares ints and floats exactly
+            if _bound(a if ka == 'i' else b) > EXACT_FLOAT:
+                raise Diverge()
+        elif ka == kb == 'i' and max(_bound(a), _bound(b)) > INT_LIMIT:
+            raise Diverge()
+
+        return ARRAY_OPS[op](a, b)
+
+    def _unary_expr(self, expr:ast.UnaryExpr):
+        arg = self.eval(expr.argument)
+        if not isinstance(arg, (numpy.ndarray, Mixed)):
+            match expr.operator:
+                case '+':
+                    return +arg
+                case '-':
+                    return -arg
+                case '!':
+                    return not arg
+            raise RuntimeError(f"bad unary operator '{expr.operator}'")
+
+        kind = _kind(arg)
+        if kind is None:
+            raise Diverge()
+        match expr.operator:
+            case '+':
+                return _as_int(arg) if kind == 'b' else arg
+            case '-':
+                return -_as_int(arg) if kind == 'b' else -arg
+            case '!':
+                return numpy.logical_not(arg)
+        raise RuntimeError(f"bad unary operator '{expr.operator}'")
+
+    def _logical_expr(self, expr:ast.LogicalExpr):
+        if expr.operator not in ('&&', '||'):
+            raise RuntimeError(f"bad logical operator '{expr.operator}'")
+        lhs = self.eval(expr.left)
+        both = expr.operator == '&&'
+        if not isinstance(lhs, (numpy.ndarray, Mixed)):
+            if bool(lhs) == both:
+                return self.eval(expr.right)
+            return lhs
+
+        truth = self._truth(lhs)
+        # the lanes where the left side decides
+        decided = ~truth if both else truth
+        if decided.all():
+            return lhs
+        if not decided.any():
+            return self.eval(expr.right)
+        # the right side runs for every lane, it must not change anything
+        if not is_pure(expr.right, self.functions):
+            raise Diverge()
+        return self._where(decided, lhs, self.eval(expr.right))
+
+    def _func(self, func:ast.Func):
+        builtin = self.functions.get(func.name)
+        if builtin is None:
+            raise RuntimeError(f"unknown function '{func.name}'")
+        # RND and the like would draw numbers in another order than per lane
+        if not builtin.pure or builtin.context:
+            raise Diverge()
+
+        args = self.eval(func.arguments)
+        if not any(isinstance(a, (numpy.ndarray, Mixed)) for a in args):
+            return builtin.func(*args)
+        lanes = zip(*[ self._lanes(a) for a in args ])
+        return self._array([ builtin.func(*a) for a in lanes ])
+
+    # ---
+
+    def getvar(self, name:str):
+        try:
+            return self.variables[name]
+        except KeyError:
+            raise error.UndefinedVar(name)
+
+    def setvar(self, name:str, value):
+        if self.mask is not None:
+            old = self.variables.get(name, VAR_NOT_FOUND)
+            if old is VAR_NOT_FOUND:
+                # it would only exist in some lanes
+                raise Diverge()
+            value = self._where(self.mask, value, old)
+        self.variables[name] = value
@@ -1,11 +1,21 @@
-import unittest, io, random
+import unittest, io, random, math, json
+import asyncio, socket, os, tempfile, pickle, subprocess, threading
 import functools
+from unittest import mock
 # HACK: fix path and imports
 import pathlib, sys
 scriptdir = pathlib.Path(__file__).absolute()
 sys.path.append(str(scriptdir.parent.parent/'src'))
 
-from redbasic import Interpreter
+from redbasic import Interpreter, ast, rng, batch, error, matrix
+from redbasic.cfg import build_cfg
+from redbasic.streams import InputReader, FeedReader, parse_value
+from redbasic.aio import AsyncInterpreter
+from redbasic import vector
+from redbasic.prefork import PreforkPool
+from redbasic.vector import run_lanes
+from redbasic.metrics import to_openmetrics
+from redbasic.memory import deep_sizeof
 
 
 class TestCase(unittest.TestCase):
@@ -29,6 +39,17 @@ class TestCase(unittest.TestCase):
         self.input.truncate()
         self.input.seek(0)
 
+    def run_spawned(self, source, code):
+        "stdout of code run on the program of source, in a new process whose pools spawn their workers"
+        script = ("import multiprocessing, redbasic\n"
+                  "from redbasic import batch\n"
+                  "multiprocessing.set_start_method('spawn')\n"
+                  "program = redbasic.Interpreter().parser.parse(sys.argv[1])\n") + code
+        env = dict(os.environ, PYTHONPATH=str(scriptdir.parent.parent/'src'), PYTHONHASHSEED='random')
+        proc = subprocess.run([sys.executable, '-c', 'import sys\n' + script, source], env=env, capture_output=True, text=True)
+        self.assertEqual(proc.stderr, '')
+        return proc.stdout
+
     def execScript(self, script):
         with open(self.testdir/script, encoding='utf-8') as f:
             code = f.read()
@@ -51,11 +72,27 @@ class interpreterTests(TestCase):
         tc.assertDictEqual({'name':'Pedro', 'age':32}, tc.interp.variables)
 
     def test_rnd(tc):
-        random.seed(1993)
-        code = "69 let r = rnd(1, 100)"
-        tc.interp.set_source(code)
-        tc.interp.exec()
-        tc.assertEqual(tc.interp.variables['r'], 62)
+        code = "69 let r = rnd(1, 100)\nlet s = rnd(10)"
+        values = []
+        for _ in range(2):
+            interp = Interpreter(textout=tc.output, textin=tc.input, seed=1993)
+            interp.set_source(code)
+            interp.exec()
+            values.append(interp.variables)
+        tc.assertEqual(values[0], values[1])
+        tc.assertTrue(1 <= values[0]['r'] <= 100)
+        tc.assertTrue(0 <= values[0]['s'] <= 10)
+
+        # the sequence of a seed doesn't change, with either backend
+        expected = {'python': {'r': 56, 's': 5}, 'numpy': {'r': 20, 's': 2}}
+        for backend in rng.BACKENDS:
+            if backend == 'numpy' and not rng.has_numpy():
+                continue
+            interp = Interpreter(textout=tc.output, textin=tc.input)
+            interp.rng = rng.RandomSource(1993, backend=backend)
+            interp.set_source(code)
+            interp.exec()
+            tc.assertEqual(interp.variables, expected[backend], backend)
 
     def test_pow(tc):
         code = '10 let p = pow(2, 10)'
@@ -125,6 +162,1242 @@ class ScriptTests(TestCase):
         tc.assertRegex(out, "label")
         tc.assertRegex(out, "end")
 
+class functionTests(TestCase):
+    def test_register(tc):
+        tc.interp.functions.register('double', lambda x: x * 2, (1, 1))
+        tc.interp.set_source("let d = DOUBLE(21)")
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['d'], 42)
+        # registries are per interpreter
+        other = Interpreter(textout=tc.output, textin=tc.input)
+        tc.assertNotIn('double', other.functions)
+
+    def test_bound_once(tc):
+        tc.interp.set_source("let r = sqrt(16)")
+        linked = tc.interp.link().program.body[0].statement.init
+        tc.assertIs(linked.impl, math.sqrt)
+        tc.assertIsNone(tc.interp.ast.body[0].statement.init.impl)
+
+    def test_arity_checked_at_parse_time(tc):
+        with tc.assertRaises(SyntaxError):
+            tc.interp.set_source("let r = sqrt(1, 2)")
+        with tc.assertRaises(SyntaxError):
+            tc.interp.set_source("let r = rnd()")
+
+    def test_usr_hook(tc):
+        tc.interp.set_source("let u = usr(1, 2, 3)")
+        with tc.assertRaises(RuntimeError):
+            tc.interp.exec()
+        tc.interp.usr = lambda *args: sum(args)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['u'], 6)
+
+    def test_impure_registered(tc):
+        "registered functions aren't cached in loops unless they're declared pure"
+        calls = []
+        tc.interp.functions.register('tick', lambda: calls.append(1) or len(calls), (0, 0))
+        tc.interp.set_source("let i = 0\n10 t = tick() * 2\ni += 1\nif i < 3 then goto 10")
+        tc.interp.exec()
+        tc.assertEqual(len(calls), 3)
+        tc.assertEqual(tc.interp.variables['t'], 6)
+
+        tc.interp.functions.register('tick', lambda: calls.append(1) or len(calls), (0, 0), pure=True)
+        tc.interp.invalidate()
+        tc.interp.run()
+        tc.assertEqual(len(calls), 4)
+
+class rngTests(TestCase):
+    def draw(tc, rng, n=1000):
+        return [ rng.rnd(1, 6) for _ in range(n) ]
+
+    def test_seeded(tc):
+        for backend in rng.BACKENDS:
+            if backend == 'numpy' and rng.numpy is None:
+                continue
+            a = rng.RandomSource(42, backend=backend)
+            b = rng.RandomSource(42, backend=backend)
+            tc.assertEqual(tc.draw(a), tc.draw(b))
+            tc.assertTrue(set(tc.draw(a)) <= set(range(1, 7)))
+
+    def test_independent(tc):
+        a = Interpreter(textout=tc.output, textin=tc.input, seed=7)
+        b = Interpreter(textout=tc.output, textin=tc.input, seed=7)
+        expected = tc.draw(rng.RandomSource(7), 10)
+        first = [ a.rng.rnd(1, 6) for _ in range(5) ]
+        # drawing from b or the random module doesn't disturb a
+        tc.draw(b.rng)
+        random.seed(0)
+        random.random()
+        tc.assertEqual(first + [ a.rng.rnd(1, 6) for _ in range(5) ], expected)
+
+    def test_state(tc):
+        a = rng.RandomSource(3, batch=8)
+        tc.draw(a, 5)
+        state = a.getstate()
+        expected = tc.draw(a, 20)
+        a.setstate(state)
+        tc.assertEqual(tc.draw(a, 20), expected)
+
+class outputTests(TestCase):
+    def test_full_buffering(tc):
+        interp = Interpreter(textout=tc.output, textin=tc.input, buffering='full')
+        interp.exec_statement(interp.parser.parse_line('print "a"; 1').statement)
+        tc.assertEqual(tc.output.getvalue(), "")
+        interp.flush()
+        tc.assertEqual(tc.output.getvalue(), "a1\n")
+
+    def test_line_buffering(tc):
+        interp = Interpreter(textout=tc.output, textin=tc.input, buffering='line')
+        interp.exec_statement(interp.parser.parse_line('print "a", 1').statement)
+        tc.assertEqual(tc.output.getvalue(), "a       1\n")
+
+    def test_size_threshold(tc):
+        interp = Interpreter(textout=tc.output, textin=tc.input, buffering='full')
+        interp.out.size = 10
+        stmt = interp.parser.parse_line('print "12345"').statement
+        interp.exec_statement(stmt)
+        tc.assertEqual(tc.output.getvalue(), "")
+        interp.exec_statement(stmt)
+        tc.assertEqual(tc.output.getvalue(), "12345\n12345\n")
+
+    def test_flush_on_input(tc):
+        tc.setInput(1)
+        interp = Interpreter(textout=tc.output, textin=tc.input, buffering='full')
+        interp.exec_statement(interp.parser.parse_line('print "prompt"').statement)
+        interp.exec_statement(interp.parser.parse_line('input n').statement)
+        tc.assertEqual(tc.output.getvalue(), "prompt\n")
+
+    def test_flush_on_error(tc):
+        tc.interp.set_source('print "before"\nprint undefined')
+        with tc.assertRaises(LookupError):
+            tc.interp.exec()
+        tc.assertEqual(tc.output.getvalue(), "before\n")
+
+    def test_bad_mode(tc):
+        with tc.assertRaises(ValueError):
+            Interpreter(textout=tc.output, textin=tc.input, buffering='nope')
+
+class inputTests(TestCase):
+    def test_parse_value(tc):
+        cases = {
+            '32': 32, '-7': -7, '3.5': 3.5, '3.0': 3, '1e3': 1000, '.5': 0.5,
+            '0x1F': 31, '-0x10': -16, '077': 77,
+            'abc': 'abc', '1.2.3': '1.2.3', '': '', '0x': '0x',
+            # digits grouped with underscores
+            '1_000': 1000, '-1_000.5': -1000.5, '1e1_0': 10**10, '0x_ff': 255, '0_17': 17,
+            '1__0': '1__0', '_1': '_1', '1_': '1_', '1._5': '1._5',
+        }
+        for text, value in cases.items():
+            result = parse_value(text)
+            tc.assertEqual(result, value, text)
+            tc.assertIs(type(result), type(value), text)
+
+    def test_block_reads(tc):
+        lines = [ str(i) for i in range(100) ]
+        reader = InputReader(io.StringIO('\n'.join(lines)), blocksize=7)
+        tc.assertEqual(list(reader), lines)
+        tc.assertEqual(reader.readline(), '')
+
+    def test_pipe_lines(tc):
+        "a line written to a pipe is handed out before the writer closes it"
+        rfd, wfd = os.pipe()
+        with open(rfd, encoding='utf-8') as r, open(wfd, 'wb', buffering=0) as w:
+            reader = InputReader(r)
+            lines = []
+            w.write('olá\r\n1\n'.encode())
+            thread = threading.Thread(target=lambda: lines.extend((reader.readline(), reader.readline())))
+            thread.start()
+            thread.join(5)
+            tc.assertFalse(thread.is_alive())
+            tc.assertEqual(lines, ['olá', '1'])
+            w.write(b'\xc3')
+            w.write(b'\xa9')
+            w.close()
+            tc.assertEqual(list(reader), ['é'])
+
+    def test_input_many(tc):
+        tc.setInput(*range(50))
+        tc.interp.reader.blocksize = 16
+        tc.interp.set_source("let s = 0\nlet i = 0\n10 input n\ns += n\ni += 1\nif i < 50 then goto 10")
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['s'], sum(range(50)))
+
+class logicalTests(TestCase):
+    def run_both(tc, code):
+        "run code with and without the optimizer, both must agree"
+        results = []
+        for optimize in (False, True):
+            out = io.StringIO()
+            interp = Interpreter(textout=out, textin=tc.input, optimize=optimize)
+            interp.set_source(code)
+            interp.exec()
+            results.append((out.getvalue(), interp.variables))
+        tc.assertEqual(results[0], results[1])
+        return results[0]
+
+    def test_and_skips_right(tc):
+        _, var = tc.run_both("let f = 0\nlet x = 0\nlet r = f && (x = 1)")
+        tc.assertEqual(var['x'], 0)
+        tc.assertEqual(var['r'], 0)
+
+    def test_or_skips_right(tc):
+        _, var = tc.run_both("let t = 1\nlet x = 0\nlet r = t || (x = 1)")
+        tc.assertEqual(var['x'], 0)
+        tc.assertEqual(var['r'], 1)
+
+    def test_right_runs_when_needed(tc):
+        _, var = tc.run_both("let t = 1\nlet x = 0\nlet r = t && (x = 5)")
+        tc.assertEqual(var['x'], 5)
+        tc.assertEqual(var['r'], 5)
+
+    def test_left_to_right(tc):
+        _, var = tc.run_both("let r = (a = 1) && (b = a + 1)")
+        tc.assertEqual(var['b'], 2)
+
+    def test_skipped_operand_not_evaluated(tc):
+        # undefined would raise if it was evaluated
+        out, _ = tc.run_both("let f = 0\nif f && undefined then print \"error\" else print \"ok\"")
+        tc.assertEqual(out, "ok\n")
+
+    def test_if_test(tc):
+        out, var = tc.run_both("let n = 0\nlet c = 0\nif n || (c += 1) then print \"if\"\nif 1 || (c += 1) then print \"if\"")
+        tc.assertEqual(out, "if\nif\n")
+        tc.assertEqual(var['c'], 1)
+
+    def test_greater_equal(tc):
+        "'>=' includes equality, in generic comparisons and in the fused increment and branch"
+        code = "let I = 3\nlet C = 0\n10 C += 1\nI -= 1\nif I >= 0 then goto 10\nlet E = 2 >= 2\nlet G = 1 >= 2"
+        tc.interp.set_source(code)
+        tc.assertIsInstance(tc.interp.link().program.body[4].statement, ast.IncrementBranchStmt)
+        out, var = tc.run_both(code)
+        tc.assertEqual((var['C'], var['I']), (4, -1))
+        tc.assertEqual((bool(var['E']), bool(var['G'])), (True, False))
+
+    def test_constant_short_circuit(tc):
+        tc.interp.set_source('if 0 && x then print "a" else print "b"\nlet r = 1 || y')
+        body = tc.interp.link().program.body
+        tc.assertEqual(body[0].statement, ast.PrintTextStmt("b\n"))
+        tc.assertEqual(body[1].statement.init, ast.IntLiteral(1))
+
+class profilerTests(TestCase):
+    def test_counts(tc):
+        interp = Interpreter(textout=tc.output, textin=tc.input, optimize=False)
+        interp.set_source("let I = 0\n10 print I\nI += 1\nif I < 5 then goto 10\ngosub 20\nend\n20 return")
+        prof = interp.profile()
+        counts = { i: st.count for i, st in prof.lines.items() }
+        tc.assertEqual(counts, {0: 1, 1: 5, 2: 5, 3: 5, 4: 1, 6: 1, 5: 1})
+        tc.assertEqual(prof.edges['goto', 3, 1], 4)
+        tc.assertEqual(prof.edges['gosub', 4, 6], 1)
+        tc.assertEqual(prof.edges['return', 6, 5], 1)
+        tc.assertIn((4, 6), prof.stacks)
+        tc.assertEqual(tc.output.getvalue(), "0\n1\n2\n3\n4\n")
+        # exec isn't instrumented afterwards
+        tc.assertNotIn('eval', vars(interp))
+
+    def test_inlined_gosub(tc):
+        "the optimizer would inline the subroutine, the profile still has its lines and jumps"
+        tc.interp.set_source("let I = 0\n10 gosub 20\nif I < 3 then goto 10\nend\n20 I += 1\nreturn")
+        prof = tc.interp.profile()
+        tc.assertEqual(prof.edges['gosub', 1, 4], 3)
+        tc.assertEqual(prof.edges['return', 5, 2], 3)
+        tc.assertEqual(prof.lines[4].count, 3)
+
+    def test_report(tc):
+        tc.interp.set_source("let N = 9\nlet I = 0\n10 r = SQRT(N)\nI += 1\nif I < 3 then goto 10")
+        prof = tc.interp.profile()
+        report = prof.report(tc.interp.ast)
+        tc.assertIn("10 r=sqrt(N)", report)
+        tc.assertRegex(report, "2 hits, 1 misses")
+        data = json.loads(prof.to_json(tc.interp.ast))
+        tc.assertEqual(data['memo'], {'hits': 2, 'misses': 1})
+        tc.assertEqual(len(prof.collapsed(tc.interp.ast).splitlines()), len(prof.stacks))
+
+    def test_end(tc):
+        tc.interp.set_source("let I = 0\n10 I += 1\nif I < 3 then goto 10\nend\nprint I")
+        prof = tc.interp.profile()
+        tc.assertEqual(set(prof.edges), {('goto', 2, 1)})
+        tc.assertIn("end", prof.report(tc.interp.ast))
+        json.loads(prof.to_json(tc.interp.ast))
+        prof.collapsed(tc.interp.ast)
+
+class metricsTests(TestCase):
+    def test_stats(tc):
+        interp = Interpreter(textout=tc.output, textin=tc.input, optimize=False)
+        tc.setInput(3)
+        interp.set_source("input N\nlet I = 0\n10 print \"é\"\nI += 1\nif I < N then goto 10\ngosub 20\nend\n20 return")
+        interp.exec()
+        stats = interp.stats()
+        tc.assertEqual(stats['statements'], 1 + 1 + 3*3 + 3)
+        tc.assertEqual((stats['gotos'], stats['gosubs'], stats['returns']), (2, 1, 1))
+        tc.assertEqual(stats['max_depth'], 1)
+        tc.assertEqual(stats['variables'], 2)
+        tc.assertEqual(stats['print_bytes'], 3 * len("é\n".encode()))
+        tc.assertEqual(stats['input_lines'], 1)
+        tc.assertGreater(stats['parse_seconds'], 0)
+        tc.assertGreater(stats['exec_seconds'], 0)
+
+    def test_inlined_gosub(tc):
+        code = "let I = 0\n10 gosub 20\nif I < 3 then goto 10\nend\n20 I += 1\nreturn"
+        for optimize in (False, True):
+            interp = Interpreter(textout=tc.output, textin=tc.input, optimize=optimize)
+            interp.set_source(code)
+            interp.exec()
+            stats = interp.stats()
+            tc.assertEqual((stats['gosubs'], stats['returns'], stats['max_depth']), (3, 3, 1), optimize)
+
+    def test_fused_statements(tc):
+        # the optimizer fuses the increment and the IF, the jumps and statements are still counted
+        code = "let I = 0\n10 I += 1\nif I < 4 then goto 10"
+        for optimize in (False, True):
+            interp = Interpreter(textout=tc.output, textin=tc.input, optimize=optimize)
+            interp.set_source(code)
+            interp.exec()
+            tc.assertEqual(interp.stats()['gotos'], 3)
+            tc.assertEqual(interp.stats()['statements'], 1 + 4*2)
+
+    def test_source_statements(tc):
+        "statements of the source, however the optimizer fused or inlined them"
+        code = ("let I = 0\nlet S = 0\n10 gosub 20\nprint \"x\"\nS = S + I\nI += 1\nif I < 5 then goto 10\n"
+                "for J = 1 to 3\ngosub 20\nnext J\nend\n20 S += 1\nS *= 2\nreturn")
+        counts = []
+        for optimize in (False, True):
+            interp = Interpreter(textout=tc.output, textin=tc.input, optimize=optimize)
+            interp.set_source(code)
+            interp.exec()
+            counts.append(interp.stats()['statements'])
+            # and a step at a time
+            interp.reset()
+            interp.begin()
+            while interp.run_for(3) != 'done':
+                pass
+            counts.append(interp.stats()['statements'] - counts[-1])
+        tc.assertEqual(counts, [counts[0]] * 4)
+
+    def test_openmetrics(tc):
+        tc.interp.set_source("10 print 1")
+        tc.interp.exec()
+        text = to_openmetrics(tc.interp.stats())
+        tc.assertIn("# TYPE redbasic_statements counter\n", text)
+        tc.assertIn("redbasic_statements_total 1\n", text)
+        tc.assertIn("# UNIT redbasic_exec_seconds seconds\n", text)
+        tc.assertIn("\nredbasic_variables 0\n", text)
+        tc.assertTrue(text.endswith("# EOF\n"))
+
+class memoryTests(TestCase):
+    def test_report(tc):
+        tc.interp.set_source("let A = 1\n10 print \"a long string literal\", A\nA += 1\nif A < 3 then goto 10")
+        tc.interp.exec()
+        report = tc.interp.memory_report()
+        tc.assertEqual(sorted(report.lines), [0, 1, 2, 3])
+        tc.assertEqual(report.node_count['Line'], 4)
+        tc.assertEqual(report.ast_bytes, sum(report.node_bytes.values()))
+        # the print line holds the most
+        tc.assertEqual(max(report.lines, key=report.lines.get), 1)
+        tc.assertIn('undostack', report.parser)
+        tc.assertGreater(report.variables, 0)
+        tc.assertGreater(report.linked, 0)
+        tc.assertIn("10 print", report.format(tc.interp.ast))
+
+    def test_deep_sizeof(tc):
+        shared = list(range(100))
+        tc.assertEqual(deep_sizeof([shared, shared]), deep_sizeof([shared, list(shared)]) - sys.getsizeof(shared))
+        # bound builtins don't pull the interpreter in
+        tc.assertLess(deep_sizeof(tc.interp.bind_function('rnd')), 1000)
+
+class asyncTests(TestCase):
+    def session(tc, code, **kwargs):
+        "run code in an AsyncInterpreter over a socket pair, returns it and the client streams"
+        async def start():
+            server, client = socket.socketpair()
+            reader, writer = await asyncio.open_connection(sock=server)
+            interp = AsyncInterpreter(reader, writer, **kwargs)
+            interp.set_source(code)
+            return interp, await asyncio.open_connection(sock=client)
+        return start()
+
+    def test_input_waits(tc):
+        async def main():
+            interp, (reader, writer) = await tc.session("10 input A\nprint A*2\nif A > 0 then goto 10")
+            task = asyncio.create_task(interp.exec_async())
+            writer.write(b"3\n")
+            tc.assertEqual(await reader.readline(), b"6\n")
+            tc.assertFalse(task.done())
+            writer.write(b"0\n")
+            tc.assertEqual(await reader.readline(), b"0\n")
+            await task
+            interp.stream_writer.close()
+            writer.close()
+        asyncio.run(main())
+
+    def test_slices(tc):
+        # a busy program lets other tasks run
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        async def main():
+            interp, (reader, writer) = await tc.session("let I = 0\n10 I += 1\nif I < 5000 then goto 10\nprint I", slice=100)
+            t = asyncio.create_task(ticker())
+            await interp.exec_async()
+            t.cancel()
+            tc.assertEqual(await reader.readline(), b"5000\n")
+            interp.stream_writer.close()
+            writer.close()
+        asyncio.run(main())
+        tc.assertGreater(ticks, 20)
+
+    def feed_run(tc, interp, *lines):
+        "run interp in slices feeding it a line whenever it waits"
+        interp.reader = FeedReader()
+        interp.begin()
+        lines = list(lines)
+        while (status := interp.run_for(3)) != 'done':
+            if status == 'waiting':
+                interp.reader.feed(f'{lines.pop(0)}\n')
+
+    def test_if_test_not_repeated(tc):
+        calls = []
+        tc.interp.usr = lambda: calls.append(1) or 1
+        tc.interp.set_source("10 if usr() then input A, B\nprint A + B")
+        tc.feed_run(tc.interp, 1, 2)
+        tc.assertEqual(len(calls), 1)
+        tc.assertEqual(tc.output.getvalue(), "3\n")
+
+    def test_inlined_subroutine_resumes(tc):
+        tc.interp.set_source('gosub 100\nend\n100 print "a"\ninput B\nprint B\nreturn')
+        tc.feed_run(tc.interp, 7)
+        tc.assertIsInstance(tc.interp.link().program.body[0].statement, ast.BlockStmt)
+        tc.assertEqual(tc.output.getvalue(), "a\n7\n")
+
+class steppingTests(TestCase):
+    def test_budget(tc):
+        tc.interp.set_source('\n'.join(f'print {i}' for i in range(10)))
+        tc.interp.begin()
+        tc.assertEqual(tc.interp.run_for(3), 'yielded')
+        tc.assertEqual(tc.interp.stats()['statements'], 3)
+        tc.assertEqual(tc.interp.run_for(5), 'yielded')
+        tc.assertEqual(tc.interp.run_for(5), 'done')
+        tc.assertEqual(tc.interp.stats()['statements'], 10)
+        tc.assertEqual(tc.output.getvalue(), ''.join(f'{i}\n' for i in range(10)))
+
+    def test_waiting(tc):
+        tc.interp.reader = FeedReader()
+        tc.interp.set_source('print "name?"\ninput N\nprint N')
+        tc.interp.begin()
+        tc.assertEqual(tc.interp.run_for(100), 'waiting')
+        # the prompt is out before waiting
+        tc.assertEqual(tc.output.getvalue(), "name?\n")
+        tc.assertEqual(tc.interp.run_for(100), 'waiting')
+        tc.interp.reader.feed("Ana\n")
+        tc.assertEqual(tc.interp.run_for(100), 'done')
+        tc.assertEqual(tc.output.getvalue(), "name?\nAna\n")
+
+    def test_steps(tc):
+        tc.interp.set_source("let I = 0\n10 I += 1\nif I < 10 then goto 10")
+        steps = list(tc.interp.steps(4))
+        tc.assertTrue(steps and all(s == 'yielded' for s in steps))
+        tc.assertEqual(tc.interp.variables['I'], 10)
+
+    def test_round_robin(tc):
+        outputs = [io.StringIO(), io.StringIO()]
+        interps = [ Interpreter(textout=out, textin=tc.input) for out in outputs ]
+        for i, interp in enumerate(interps):
+            interp.set_source(f"let I = 0\n10 I += 1\nif I < {(i+1) * 50} then goto 10\nprint I")
+            interp.begin()
+        runnable = list(interps)
+        finished = []
+        while runnable:
+            for interp in list(runnable):
+                if interp.run_for(10) == 'done':
+                    runnable.remove(interp)
+                    finished.append(interp)
+        tc.assertEqual(finished, interps)
+        tc.assertEqual([out.getvalue() for out in outputs], ["50\n", "100\n"])
+
+    def test_run_restarts(tc):
+        # RUN from a program used to nest exec calls until the Python stack ran out
+        tc.interp.variables['C'] = 0
+        tc.interp.set_source("C += 1\nif C < 5000 then run\nprint C")
+        tc.interp.exec()
+        tc.assertEqual(tc.output.getvalue(), "5000\n")
+        tc.assertFalse(tc.interp.running)
+
+class batchTests(TestCase):
+    def setUp(tc):
+        super().setUp()
+        tc.tmp = tempfile.TemporaryDirectory()
+        tc.addCleanup(tc.tmp.cleanup)
+
+    def script(tc, name, code, stdin=None):
+        path = os.path.join(tc.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(code)
+        if stdin is not None:
+            with open(os.path.splitext(path)[0] + '.in', 'w') as f:
+                f.write(stdin)
+        return path
+
+    def test_jobs(tc):
+        out = os.path.join(tc.tmp.name, 'out')
+        os.mkdir(out)
+        jobs = [
+            batch.make_job(tc.script('double.bas', 'input A\nprint A*2', '21\n'), output_dir=out),
+            batch.make_job(tc.script('loop.bas', '10 goto 10'), timeout=0.05),
+            batch.make_job(tc.script('bad.bas', 'print x'), output_dir=out),
+        ]
+        for workers in (1, 2):
+            results = list(batch.run_batch(jobs, workers))
+            tc.assertEqual([r.status for r in results], ['ok', 'timeout', 'error'])
+            tc.assertIn('x is undefined', results[2].error)
+            with open(os.path.join(out, 'double.out')) as f:
+                tc.assertEqual(f.read(), "42\n")
+        tc.assertIn("3 jobs, 1 error, 1 ok, 1 timeout", batch.summary(results))
+
+    def test_timeout_bound(tc):
+        "jobs stop soon after the timeout, however long their statements take"
+        jobs = [ batch.Job(tc.script('loop.bas', '10 goto 10'), timeout=0.1),
+                 batch.Job(tc.script('mat.bas', 'dim A(40, 40)\n10 mat B = A * A\ngoto 10'), timeout=0.1) ]
+        with mock.patch.object(matrix, 'NUMPY_MIN_SIZE', None):
+            results = list(batch.run_batch(jobs, 1))
+        for r in results:
+            tc.assertEqual(r.status, 'timeout', r.path)
+            tc.assertLess(r.seconds, 1.0, r.path)
+
+    def test_missing_files(tc):
+        script = tc.script('a.bas', 'print 1')
+        jobs = [ batch.Job(script, stdin=os.path.join(tc.tmp.name, 'nope.in')),
+                 batch.Job(script, stdout=os.path.join(tc.tmp.name, 'nope', 'a.out')),
+                 batch.Job(script) ]
+        for workers in (1, 2):
+            results = list(batch.run_batch(jobs, workers))
+            tc.assertEqual([r.status for r in results], ['error', 'error', 'ok'])
+            tc.assertIn('FileNotFoundError', results[0].error)
+
+    def test_manifest(tc):
+        tc.script('a.bas', 'print 1')
+        tc.script('data.txt', '5\n')
+        manifest = tc.script('jobs.txt', '# comment\na.bas\n\na.bas data.txt a2.out  # with files\n')
+        jobs = batch.read_manifest(manifest)
+        tc.assertEqual(len(jobs), 2)
+        tc.assertEqual(jobs[1].stdin, os.path.join(tc.tmp.name, 'data.txt'))
+        tc.assertEqual(jobs[1].stdout, os.path.join(tc.tmp.name, 'a2.out'))
+
+class recordTests(TestCase):
+    code = "input N, V\nlet D = V * 2\nprint N; D"
+
+    def test_in_order(tc):
+        program = tc.interp.parser.parse(tc.code)
+        records = [ [f'r{i}', str(i)] for i in range(50) ]
+        expected = [ (f'r{i}{i*2}\n', '') for i in range(50) ]
+        for workers in (1, 2):
+            # LET would fail on the second record if the variables weren't reset
+            tc.assertEqual(list(batch.run_records(program, records, workers, chunk=3)), expected)
+
+    def test_errors(tc):
+        program = tc.interp.parser.parse("input A\nprint 10 / A")
+        results = list(batch.run_records(program, [['5'], ['0'], ['2']], 1))
+        tc.assertEqual([out for out, err in results], ["2.0\n", "", "5.0\n"])
+        tc.assertIn("ZeroDivisionError", results[1][1])
+
+    def test_streaming(tc):
+        consumed = 0
+        def records():
+            nonlocal consumed
+            for i in range(100):
+                consumed += 1
+                yield [str(i), '1']
+        program = tc.interp.parser.parse(tc.code)
+        results = batch.run_records(program, records(), 2, chunk=2, window=1)
+        next(results)
+        tc.assertLessEqual(consumed, 6)
+        tc.assertEqual(len(list(results)), 99)
+
+    def test_seed(tc):
+        "every record starts RND from the seed, whatever worker runs it"
+        program = tc.interp.parser.parse("input N\nprint N; rnd(1000000); rnd(1000000)")
+        records = [ [str(i)] for i in range(10) ]
+        runs = [ list(batch.run_records(program, records, workers, chunk=3, seed=5)) for workers in (1, 2, 2) ]
+        tc.assertEqual(runs[0], runs[1])
+        tc.assertEqual(runs[0], runs[2])
+        tc.assertEqual(len({ out[1:] for out, _ in runs[0] }), 1)
+
+    def test_seed_cli(tc):
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, 'r.bas')
+            records = os.path.join(tmp, 'records.txt')
+            with open(script, 'w') as f:
+                f.write("input N\nprint N; \" \"; rnd(1000000)")
+            with open(records, 'w') as f:
+                f.write("1\n2\n3\n")
+            env = dict(os.environ, PYTHONPATH=str(scriptdir.parent.parent/'src'))
+            args = [sys.executable, '-m', 'redbasic', '-f', script, '--per-record', records, '--seed', '7', '-j', '1']
+            outputs = [ subprocess.run(args, env=env, capture_output=True, text=True, check=True).stdout for _ in range(2) ]
+        tc.assertEqual(outputs[0], outputs[1])
+        tc.assertEqual(len(outputs[0].splitlines()), 3)
+
+    def test_spawned_workers(tc):
+        # labels must resolve in the workers too
+        source = "input N\nif N > 1 then goto big\nprint \"small\"\nend\nbig: print \"big\""
+        out = tc.run_spawned(source, "print(*batch.run_records(program, [['1'], ['5']], 2))")
+        tc.assertEqual(out, "('small\\n', '') ('big\\n', '')\n")
+
+@unittest.skipUnless(hasattr(os, 'fork'), "needs os.fork")
+class preforkTests(TestCase):
+    programs = {
+        'double': "input A\nprint A*2",
+        'sum': "input N\nlet S = 0\nlet I = 0\n10 S += I\nI += 1\nif I <= N then goto 10\nprint S",
+        'bad': "print x",
+    }
+
+    def test_map(tc):
+        with PreforkPool(tc.programs, 2) as pool:
+            requests = [ ('sum', f'{i}\n') for i in range(20) ] + [('double', '21\n'), ('bad', ''), ('nope', '')]
+            replies = list(pool.map(requests))
+            tc.assertEqual([ r.output for r in replies[:20] ], [ f'{i*(i+1)//2}\n' for i in range(20) ])
+            tc.assertEqual(replies[20].output, "42\n")
+            tc.assertIn('x is undefined', replies[21].error)
+            tc.assertIn('no program', replies[22].error)
+            tc.assertEqual(pool.run('double', '5\n').output, "10\n")
+            pids = pool.pids
+        tc.assertEqual(len(pids), 2)
+        tc.assertEqual(pool.workers, [])
+
+    def test_stop_early(tc):
+        "replies of a map that was left early don't go to the next one"
+        with PreforkPool(tc.programs, 2) as pool:
+            # the other worker is still busy with the long sum when the first reply comes
+            for reply in pool.map([('double', '0\n'), ('sum', '100000\n')] + [('double', '1\n')] * 8):
+                break
+            tc.assertEqual(reply.output, "0\n")
+            replies = pool.map([ ('sum', f'{i}\n') for i in range(4) ])
+            tc.assertEqual([ r.output for r in replies ], ["0\n", "1\n", "3\n", "6\n"])
+            tc.assertEqual(pool.run('double', '5\n').output, "10\n")
+
+    def test_statements(tc):
+        with PreforkPool(tc.programs, 1) as pool:
+            tc.assertEqual(pool.run('double', '1\n').statements, 2)
+            tc.assertEqual(pool.run('double', '1\n').statements, 2)
+
+class ensembleTests(TestCase):
+    code = "let H = 0\nlet I = 0\n10 H += rnd(1)\nI += 1\nif I < 20 then goto 10\nprint H"
+
+    def test_independent_of_workers(tc):
+        program = tc.interp.parser.parse(tc.code)
+        results = [ batch.run_ensemble(program, 300, 42, ['H'], workers, chunk=16) for workers in (1, 2) ]
+        a, b = results[0].summaries['H'], results[1].summaries['H']
+        tc.assertEqual((a.count, a.min, a.max), (b.count, b.min, b.max))
+        tc.assertAlmostEqual(a.mean, b.mean)
+        tc.assertAlmostEqual(a.std, b.std)
+        tc.assertEqual(list(results[0].summaries), ['H'])
+
+    def test_each_run(tc):
+        program = tc.interp.parser.parse(tc.code)
+        runs = []
+        result = batch.run_ensemble(program, 10, 5, workers=1, each=lambda *run: runs.append(run))
+        tc.assertEqual([seed for seed, _, _ in runs], list(range(5, 15)))
+        values = [ variables['H'] for _, variables, _ in runs ]
+        tc.assertEqual([ f'{h}\n' for h in values ], [ output for _, _, output in runs ])
+        tc.assertEqual(result.summaries['H'].max, max(values))
+        tc.assertAlmostEqual(result.summaries['H'].mean, sum(values) / 10)
+
+    def test_summary_merge(tc):
+        values = [ random.uniform(-5, 5) for _ in range(100) ]
+        whole, left, right = batch.Summary(), batch.Summary(), batch.Summary()
+        for i, x in enumerate(values):
+            whole.add(x)
+            (left if i < 37 else right).add(x)
+        left.merge(right)
+        tc.assertAlmostEqual(left.mean, whole.mean)
+        tc.assertAlmostEqual(left.std, whole.std)
+        tc.assertAlmostEqual(whole.std, math.sqrt(sum((x - whole.mean)**2 for x in values) / 99))
+
+    def test_errors(tc):
+        program = tc.interp.parser.parse("let R = rnd(3)\nprint 1 / R")
+        result = batch.run_ensemble(program, 50, 0, workers=1)
+        tc.assertTrue(result.errors)
+        tc.assertEqual(result.summaries['R'].count, 50 - len(result.errors))
+        tc.assertIn("ZeroDivisionError", result.errors[0][1])
+
+    def test_spawned_workers(tc):
+        # labels must resolve in the workers too
+        source = "let I = 0\nloop: I += rnd(1, 2)\nif I < 10 then goto loop"
+        out = tc.run_spawned(source, "r = batch.run_ensemble(program, 20, 0, ['I'], 2, chunk=5)\n"
+                                     "print(r.runs, r.errors, r.summaries['I'].count, r.summaries['I'].min >= 10)")
+        tc.assertEqual(out, "20 [] 20 True\n")
+
+class vectorTests(TestCase):
+    def scalar(tc, code, text):
+        out = io.StringIO()
+        interp = Interpreter(textout=out, textin=io.StringIO(text))
+        interp.set_source(code)
+        err = None
+        try:
+            interp.exec()
+        except Exception as e:
+            err = e
+        return interp.variables, out.getvalue(), err
+
+    def assertSameAsScalar(tc, code, inputs):
+        batch = run_lanes(tc.interp.parser.parse(code), inputs)
+        for lane, text in zip(batch.lanes, inputs):
+            variables, output, err = tc.scalar(code, text)
+            tc.assertEqual(lane.output, output)
+            tc.assertEqual(lane.variables, variables)
+            # 1 and 1.0 are equal but print differently
+            tc.assertEqual({ k: type(v) for k, v in lane.variables.items() }, { k: type(v) for k, v in variables.items() })
+            tc.assertEqual(repr(lane.error), repr(err))
+        return batch
+
+    def test_uniform(tc):
+        code = "input X\nlet S = 0\nlet I = 0\n10 S += X * I\nI += 1\nif I < 5 then goto 10\nprint X, S; S / 2\nlet B = S > 3\nprint B + B; -B; !S"
+        batch = tc.assertSameAsScalar(code, [ f'{i}.5\n' for i in range(-3, 4) ])
+        if vector.numpy:
+            tc.assertIsNone(batch.diverged_at)
+            tc.assertGreater(batch.vector_statements, 10)
+
+    def test_masked_if(tc):
+        code = "input A\nlet T = 0\nif A > 2 then T += A else T -= 1\nif A == 3 then print \"three\"\nprint T; A && 5; A || 7"
+        batch = tc.assertSameAsScalar(code, [ f'{i}\n' for i in range(6) ])
+        if vector.numpy:
+            tc.assertIsNone(batch.diverged_at)
+
+    def test_diverging_jump(tc):
+        code = "input A\nprint \"start\"\nif A > 3 then goto 20\nprint \"low\"\nend\n20 print \"high\", A"
+        batch = tc.assertSameAsScalar(code, [ f'{i}\n' for i in range(7) ])
+        if vector.numpy:
+            tc.assertEqual(batch.diverged_at, 2)
+
+    def test_diverge_after_print(tc):
+        "lanes that part ways after a masked PRINT don't print it twice"
+        code = '10 input X\n20 if X > 5 then print "big" else goto 40\n30 print "mid"\n40 print "end"'
+        tc.assertSameAsScalar(code, ['1\n', '9\n'])
+        code = 'input X\nif X > 5 then print "big" else print 1 / 0\nprint "end"'
+        tc.assertSameAsScalar(code, ['1\n', '9\n'])
+        code = 'input X\nif X > 0 then input Y else print 1 / 0\nprint Y'
+        tc.assertSameAsScalar(code, ['1\n4\n', '0\n5\n'])
+
+    def test_python_semantics(tc):
+        # results an array would get wrong run per lane instead
+        tc.assertSameAsScalar("input A\nprint 10 / A", ['2\n', '0\n', '5\n'])
+        tc.assertSameAsScalar("input A\nprint A * 9223372036854775807", ['1\n', '2\n'])
+        tc.assertSameAsScalar("input A\nprint A + 1", ['1\n', '2.5\n', 'x\n'])
+        tc.assertSameAsScalar("input A\nprint sqrt(A); pow(A, 2)", ['4\n', '-1\n'])
+        tc.assertSameAsScalar("input A\nif A > 1 then let Z = 1\nprint A", ['1\n', '2\n'])
+
+class reuseTests(TestCase):
+    code = "input A\nif A < 3 then let B = 10\nlet C = A * 2\nprint B + C"
+
+    def test_run_many(tc):
+        interp = tc.interp
+        tc.assertEqual(interp.run(tc.code, input="1\n", output=io.StringIO()).getvalue(), "12\n")
+        program, cfg = interp.ast, interp.link()
+        for a in (2, 1):
+            output = io.StringIO()
+            tc.assertIs(interp.run(tc.code, input=f"{a}\n", output=output), output)
+            tc.assertEqual(output.getvalue(), f"{10 + a*2}\n")
+            # B only exists in the run that set it
+            with tc.assertRaises(error.UndefinedVar):
+                interp.run(tc.code, input="3\n")
+        tc.assertIs(interp.ast, program)
+        tc.assertIs(interp.link(), cfg)
+        tc.assertEqual(interp.stats()['input_lines'], 5)
+
+    def test_program_object(tc):
+        program = tc.interp.parser.parse("input A\nprint A + 1")
+        tc.interp.run(program, input="1")
+        tc.interp.run(program, input="2")
+        tc.interp.run(input="3")
+        tc.assertEqual(tc.output.getvalue(), "2\n3\n4\n")
+
+    def test_memo_after_reset(tc):
+        tc.interp.run("input A\nlet X = 0\nlet Y = 0\n10 Y = A * A\nX += 1\nif X < 3 then goto 10\nprint Y", input="3")
+        tc.interp.run(input="4")
+        tc.assertEqual(tc.output.getvalue(), "9\n16\n")
+
+    def test_reset(tc):
+        tc.interp.exec_src("let A = 1\ngosub 10\nend\n10 print A")
+        tc.interp.reset()
+        tc.assertEqual((tc.interp.variables, tc.interp.substack, tc.interp.cursor), ({}, [], 0))
+        tc.assertIsNotNone(tc.interp.ast)
+        tc.interp.reset(keep_program=False)
+        tc.assertIsNone(tc.interp.ast)
+
+class arrayTests(TestCase):
+    def execute(tc, code, *lines):
+        tc.setInput(*lines)
+        tc.interp.set_source(code)
+        tc.interp.exec()
+        return tc.output.getvalue()
+
+    def test_loops(tc):
+        code = ("dim A(10), M(2, 3)\nlet I = 0\n10 A(I) = I * I\nI += 1\nif I <= 10 then goto 10\n"
+                "let S = 0\nI = 0\n20 S += A(I)\nI += 1\nif I <= 10 then goto 20\n"
+                "M(2, 3) = S\nM(1, 0) += 4\nprint M(2, 3); \" \"; M(1, 0)")
+        tc.assertEqual(tc.execute(code), "385 4\n")
+        tc.assertEqual(tc.interp.arrays['M'].data.tolist()[-1], 385)
+        tc.assertEqual(len(tc.interp.arrays['M']), 12)
+        tc.assertNotIn('A', tc.interp.variables)
+
+    def test_element_kinds(tc):
+        tc.assertEqual(tc.execute("dim A(2)\nA(0) = 3\nA(1) = A(0) / 2\nprint A(1); \" \"; A(0)"), "1.5 3.0\n")
+        tc.assertEqual(tc.interp.arrays['A'].data.typecode, 'd')
+        with tc.assertRaises(TypeError):
+            tc.execute('dim B(2)\nB(1) = "text"')
+
+    def test_bounds(tc):
+        for code in ("dim A(3)\nprint A(4)", "dim A(3)\nA(-1) = 1", "dim A(3)\nprint A(1.5)", "dim M(2, 2)\nprint M(1)"):
+            with tc.subTest(code=code), tc.assertRaises(IndexError):
+                Interpreter(textout=io.StringIO(), textin=io.StringIO()).exec_src(code)
+        tc.assertEqual(tc.execute("dim A(3)\nA(3.0) = 1\nprint A(3)"), "1\n")
+
+    def test_errors(tc):
+        with tc.assertRaises(error.UndefinedVar):
+            tc.execute("print A(1)")
+        with tc.assertRaises(RuntimeError):
+            tc.execute("dim A(1)\ndim A(2)")
+
+    def test_input(tc):
+        tc.assertEqual(tc.execute("dim A(2)\nlet I = 1\ninput A(I), A(I+1)\nprint A(1) + A(2)", 4, 5), "9\n")
+
+    def test_memo_sees_writes(tc):
+        "a cached expression over an array is computed again once an element changes"
+        code = ("dim A(0)\nlet J = 0\nlet I = 0\nlet S = 0\n10 A(0) = J + 1\nI = 0\n"
+                "20 S += A(0) * A(0)\nI += 1\nif I < 2 then goto 20\nJ += 1\nif J < 3 then goto 10\nprint S")
+        tc.assertEqual(tc.execute(code), f"{2 * (1 + 4 + 9)}\n")
+        tc.assertEqual((tc.interp.memo_hits, tc.interp.memo_misses), (3, 3))
+
+    def test_state(tc):
+        tc.execute("dim A(3)\nA(2) = 7")
+        other = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+        other.restore(tc.interp.snapshot(program=True))
+        tc.assertEqual(other.arrays['A'].data.tolist(), [0, 0, 7, 0])
+        tc.interp.reset()
+        tc.assertEqual(tc.interp.arrays, {})
+        tc.assertGreater(other.memory_report().arrays, 32)
+
+    def test_numpy_view(tc):
+        if not rng.has_numpy():
+            tc.skipTest("needs numpy")
+        tc.execute("dim M(1, 2)\nM(1, 2) = 5")
+        view = tc.interp.arrays['M'].numpy()
+        tc.assertEqual(view.shape, (2, 3))
+        view[0, 1] = 3
+        tc.assertEqual(tc.execute("print M(0, 1) + M(1, 2)"), "8\n")
+
+    def test_lanes(tc):
+        program = tc.interp.parser.parse("input N\ndim A(N)\nA(N) = N * 2\nprint A(N)")
+        batch = run_lanes(program, ["1", "2", "3"])
+        tc.assertEqual([ lane.output for lane in batch.lanes ], ["2\n", "4\n", "6\n"])
+
+class forTests(TestCase):
+    nested = ("let S = 0\nfor I = 1 to 3\nfor J = 10 to 1 step -4\nS += I * J\nnext J\nnext\n"
+              "print S; \" \"; I; \" \"; J")
+    # the same loops with GOTOs
+    gotos = ("let S = 0\nlet J = 0\nlet I = 1\n10 J = 10\n20 S += I * J\nJ += -4\nif J >= 1 then goto 20\n"
+             "I += 1\nif I <= 3 then goto 10\nprint S; \" \"; I; \" \"; J")
+
+    def execute(tc, code, interp=None):
+        interp = interp or tc.interp
+        return interp.run(code, output=io.StringIO()).getvalue()
+
+    def test_loops(tc):
+        expected = "108 4 -2\n"
+        tc.assertEqual(tc.execute(tc.nested), expected)
+        tc.assertEqual(tc.interp.loops, [])
+        tc.assertEqual(tc.interp.stats()['gotos'], 8)
+        for optimize in (True, False):
+            interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(), optimize=optimize)
+            tc.assertEqual(tc.execute(tc.gotos, interp), expected)
+            interp = Interpreter(textout=io.StringIO(), textin=io.StringIO(), optimize=optimize)
+            tc.assertEqual(tc.execute(tc.nested, interp), expected)
+
+    def test_limits(tc):
+        # no times at all, limit and step are evaluated once, float steps
+        code = ("for I = 5 to 1\nprint \"never\"\nnext I\nlet N = 3\nlet C = 0\n"
+                "for K = 1 to N step N - 2\nN = 10\nC += 1\nnext\nfor X = 0 to 1 step 0.25\nnext\n"
+                "print I; \" \"; C; \" \"; X")
+        tc.assertEqual(tc.execute(code), "5 3 1.25\n")
+
+    def test_next_var(tc):
+        # NEXT I also ends the loop on J, which has no NEXT of its own
+        code = ("let C = 0\nfor I = 1 to 3\nfor J = 1 to 100\nC += 1\nif J == I then goto 50\n"
+                "next J\n50 next I\nprint C")
+        tc.assertEqual(tc.execute(code), "6\n")
+        # a FOR on a looping variable replaces its loop
+        code = "let C = 0\n10 for I = 1 to 2\nC += 1\nif C < 5 then goto 10\nnext\nprint C; \" \"; I"
+        tc.assertEqual(tc.execute(code), "6 3\n")
+        tc.assertEqual(tc.interp.loops, [])
+
+    def test_errors(tc):
+        for code in ("next", "for I = 1 to 2\nnext J", "for I = 2 to 1\nprint I"):
+            with tc.subTest(code=code), tc.assertRaises(RuntimeError):
+                Interpreter(textout=io.StringIO(), textin=io.StringIO()).exec_src(code)
+
+    def test_stepping(tc):
+        "a run can stop anywhere in a loop and pick it up, or be restored there"
+        tc.interp.set_source(tc.nested)
+        tc.interp.begin()
+        tc.assertEqual(tc.interp.run_for(5), 'yielded')
+        tc.assertEqual(len(tc.interp.loops), 2)
+        other = Interpreter(textout=io.StringIO(), textin=io.StringIO())
+        other.restore(tc.interp.snapshot(program=True))
+        while other.run_for(3) != 'done':
+            pass
+        tc.assertEqual(other.output.getvalue(), "108 4 -2\n")
+        tc.interp.reset()
+        tc.assertEqual(tc.interp.loops, [])
+
+    def test_hooks(tc):
+        jumps = []
+        tc.interp.add_hook('jump', lambda interp, event, arg: jumps.append(arg))
+        tc.assertEqual(tc.execute("for I = 1 to 3\nnext\nprint I"), "4\n")
+        tc.assertEqual(jumps, [(1, 1), (1, 1)])
+
+    def test_cfg(tc):
+        tc.interp.set_source(tc.nested)
+        cfg = tc.interp.link()
+        tc.assertEqual([ (b.start, b.successors) for b in cfg.blocks ],
+                       [(0, [6, 2]), (2, [5, 3]), (3, [3, 5]), (5, [2, 6]), (6, [])])
+        # NEXT gets the variable of its FOR
+        tc.assertEqual(cfg.program.body[5].statement.var, ast.Identifier('I'))
+        tc.assertIn('next\n', ast.reconstruct(tc.interp.ast))
+
+    def test_memo(tc):
+        "the loop variable is assigned by NEXT, expressions over it aren't cached"
+        code = "let S = 0\nlet N = 4\nfor I = 1 to 3\nS += I * I + N * N * N\nnext\nprint S"
+        tc.assertEqual(tc.execute(code), "206\n")
+        tc.assertEqual((tc.interp.memo_hits, tc.interp.memo_misses), (2, 1))
+
+    def test_lanes(tc):
+        program = tc.interp.parser.parse("input N\nlet S = 0\nfor I = 1 to N\nS += I\nnext\nprint S")
+        batch = run_lanes(program, ["1", "2", "3"])
+        tc.assertEqual([ lane.output for lane in batch.lanes ], ["1\n", "3\n", "6\n"])
+
+class matTests(TestCase):
+    code = ("dim A(1, 2), V(2)\nA(0, 0) = 1\nA(0, 1) = 2\nA(1, 2) = 3\nmat B = con(1, 2)\n"
+            "mat C = A + B\nmat D = A - B\nmat E = (4 / 2) * A\nmat V = con\nmat F = A * V\n"
+            "mat G = idn(2, 2)\nmat H = G * G\nmat B = zer\nmat K = A\nK(0, 0) = 9\n"
+            "print sum(C()); \" \"; min(D()); \" \"; max(E(), 7); \" \"; sum(H(), B()); \" \"; A(0, 0)")
+
+    def execute(tc, code):
+        return tc.interp.run(code, output=io.StringIO()).getvalue()
+
+    def backends(tc):
+        "NumPy for every size when it's installed, then the loops"
+        for size in (0, None):
+            with tc.subTest(numpy_min_size=size), mock.patch.object(matrix, 'NUMPY_MIN_SIZE', size):
+                yield
+
+    def test_statements(tc):
+        for _ in tc.backends():
+            tc.assertEqual(tc.execute(tc.code), "12 -1 7 3 1\n")
+            arrays = tc.interp.arrays
+            tc.assertEqual(arrays['E'].data.tolist(), [2.0, 4.0, 0.0, 0.0, 0.0, 6.0])
+            tc.assertEqual(arrays['F'].data.tolist(), [3, 3])
+            tc.assertEqual(arrays['F'].shape, (2,))
+            tc.assertEqual(arrays['G'].data.tolist(), [1, 0, 0, 0, 1, 0, 0, 0, 1])
+            tc.assertEqual(arrays['B'].data.tolist(), [0] * 6)
+
+    def test_product(tc):
+        code = ("dim A(3, 2), B(2, 4)\nfor I = 0 to 3\nfor J = 0 to 2\nA(I, J) = I - J\nnext\nnext\n"
+                "for I = 0 to 2\nfor J = 0 to 4\nB(I, J) = I * J + 1\nnext\nnext\nmat C = A * B\n"
+                "mat B = (0.5) * B\nmat D = A * B")
+        results = []
+        for _ in tc.backends():
+            tc.execute(code)
+            arrays = tc.interp.arrays
+            tc.assertEqual(arrays['C'].shape, (4, 5))
+            tc.assertEqual(arrays['C'].data.tolist(), [ x * 2 for x in arrays['D'].data ])
+            results.append(arrays['C'].data.tolist())
+        tc.assertEqual(results[0], results[-1])
+
+    def test_overflow(tc):
+        "int results past int64 raise like element stores do, NumPy would wrap around"
+        for _ in tc.backends():
+            with tc.assertRaises(OverflowError):
+                tc.execute(f"dim A(99)\nA(5) = {2**62}\nmat B = A + A")
+            tc.execute(f"dim A(99)\nA(5) = {2**62}\nmat B = A - A\nprint sum(A(), A())")
+            tc.assertEqual(tc.interp.arrays['B'].data.tolist(), [0] * 100)
+            tc.assertEqual(tc.interp.output.getvalue(), f"{2**63}\n")
+
+    def test_errors(tc):
+        for code, exc in (("dim A(2), B(3)\nmat C = A + B", ValueError), ("dim A(2, 3)\nmat A = idn", ValueError),
+                          ("dim A(2, 3)\nmat C = A * A", ValueError), ("mat C = A", error.UndefinedVar),
+                          ("dim A(2)\nmat C = (\"x\") * A", TypeError)):
+            with tc.subTest(code=code), tc.assertRaises(exc):
+                Interpreter(textout=io.StringIO(), textin=io.StringIO()).exec_src(code)
+
+    def test_aggregates(tc):
+        # SUM, MIN and MAX can still be variables
+        code = ("let sum = 4\nlet max = 2\ndim A(3)\nA(2) = -1.5\n"
+                "print sum(sum, max); \" \"; min(A(), 0); \" \"; max(A()); \" \"; sum(A()) + max")
+        for _ in tc.backends():
+            tc.assertEqual(tc.execute(code), "6 -1.5 0.0 0.5\n")
+
+    def test_float_sum(tc):
+        "floats add up the same with and without NumPy"
+        code = "dim A(999)\nfor I = 0 to 999\nA(I) = 0.1\nnext I\nprint sum(A())"
+        for _ in tc.backends():
+            tc.assertEqual(tc.execute(code), "100.0\n")
+
+    def test_memo(tc):
+        "a cached SUM(A()) is computed again after MAT changes A"
+        code = ("dim A(2)\nlet S = 0\nfor I = 1 to 3\nmat A = con\nmat A = (I) * A\n"
+                "for J = 1 to 2\nS += sum(A()) * 2\nnext J\nnext I\nprint S")
+        tc.assertEqual(tc.execute(code), "72\n")
+        tc.assertEqual((tc.interp.memo_hits, tc.interp.memo_misses), (3, 3))
+
+class snapshotTests(TestCase):
+    code = "let I = 0\nlet S = 0\n10 S += rnd(1, 100) * I\ngosub 50\nI += 1\nif I < 20 then goto 10\nprint S\nend\n50 S -= 1\nreturn"
+
+    def new(tc, **kwargs):
+        return Interpreter(textout=io.StringIO(), textin=tc.input, seed=7, **kwargs)
+
+    def test_checkpoint(tc):
+        whole = tc.new()
+        whole.set_source(tc.code)
+        whole.exec()
+
+        first = tc.new()
+        first.set_source(tc.code)
+        first.begin()
+        tc.assertEqual(first.run_for(23), 'yielded')
+        blob = first.snapshot(program=True)
+
+        # in another interpreter, as if in another process
+        second = tc.new(optimize=False)
+        second.restore(blob)
+        while second.run_for(10) != 'done':
+            pass
+        tc.assertTrue(second.optimize)
+        tc.assertEqual(second.output.getvalue(), whole.output.getvalue())
+        tc.assertEqual(second.variables, whole.variables)
+
+    def test_warm_start(tc):
+        setup = tc.new()
+        setup.set_source("let A = 2\nlet B = 3\nprint A * B")
+        setup.begin()
+        setup.run_for(2)
+        blob = setup.snapshot(program=True)
+        for _ in range(3):
+            interp = tc.new()
+            interp.restore(blob)
+            tc.assertEqual(interp.run_for(100), 'done')
+            tc.assertEqual(interp.output.getvalue(), "6\n")
+
+    def test_waiting_in_if(tc):
+        interp = tc.new()
+        interp.usr = lambda: 1
+        interp.reader = FeedReader()
+        interp.set_source("10 if usr() then input A, B\nprint A + B")
+        interp.begin()
+        tc.assertEqual(interp.run_for(10), 'waiting')
+        interp.reader.feed("1\n")
+        tc.assertEqual(interp.run_for(10), 'waiting')
+        blob = interp.snapshot(program=True)
+
+        other = tc.new()
+        # the test isn't evaluated again after restoring either
+        other.usr = None
+        other.reader = FeedReader()
+        other.restore(blob)
+        other.reader.feed("2\n5\n")
+        tc.assertEqual(other.run_for(10), 'done')
+        tc.assertEqual(other.output.getvalue(), "7\n")
+
+    def test_other_process(tc):
+        "labels still resolve where str hashes are salted differently"
+        interp = tc.new()
+        interp.set_source("let I = 0\nloop: I += 1\nif I < 3 then goto loop\ngosub sub\nend\nsub: print I\nreturn")
+        interp.begin()
+        interp.run_for(2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.snapshot')
+            with open(path, 'wb') as f:
+                f.write(interp.snapshot(program=True))
+            code = ("import io, sys, redbasic\n"
+                    "interp = redbasic.Interpreter(textout=io.StringIO())\n"
+                    "interp.restore(open(sys.argv[1], 'rb').read())\n"
+                    "interp.run_for(100)\n"
+                    "print(interp.output.getvalue(), end='')")
+            env = dict(os.environ, PYTHONPATH=str(scriptdir.parent.parent/'src'), PYTHONHASHSEED='12345')
+            proc = subprocess.run([sys.executable, '-c', code, path], env=env, capture_output=True, text=True)
+        tc.assertEqual(proc.stderr, '')
+        tc.assertEqual(proc.stdout, "3\n")
+
+    def test_bad_version(tc):
+        with tc.assertRaises(ValueError):
+            tc.interp.restore(pickle.dumps({'version': 0}))
+
+class startupTests(TestCase):
+    def test_lazy_imports(tc):
+        "modules only some runs need aren't imported by a plain run"
+        heavy = ['argparse', 'pprint', 'pickle', 'tracemalloc', 'json', 'numpy', 'multiprocessing', 'concurrent.futures',
+                 'redbasic.matrix', 'redbasic.arrays']
+        code = ("import sys, redbasic.__main__\n"
+                "redbasic.Interpreter().set_source('print 1')\n"
+                f"print(*[ m for m in {heavy!r} if m in sys.modules ])")
+        env = dict(os.environ, PYTHONPATH=str(scriptdir.parent.parent/'src'))
+        proc = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        tc.assertEqual(proc.stdout.split(), [])
+
+class hookTests(TestCase):
+    def record(tc, *events):
+        log = []
+        callback = lambda interp, event, arg: log.append((event, arg))
+        for e in events:
+            tc.interp.add_hook(e, callback)
+        return log, callback
+
+    def test_events(tc):
+        tc.setInput(7)
+        log, _ = tc.record('line', 'jump', 'gosub', 'return', 'print', 'input')
+        tc.interp.set_source("input n\ngosub 10\ngoto 20\n10 print n\nreturn\n20 end")
+        tc.interp.exec()
+        # the optimizer is on, the subroutine is seen even though exec would inline it
+        tc.assertEqual(log, [
+            ('line', 0), ('input', '7'), ('line', 1), ('gosub', (1, 3)), ('line', 3), ('print', '7\n'),
+            ('line', 4), ('return', (4, 2)), ('line', 2), ('jump', (2, 5)), ('line', 5),
+        ])
+        tc.assertEqual(tc.output.getvalue(), "7\n")
+
+    def test_gosub_return(tc):
+        interp = tc.interp = Interpreter(textout=tc.output, textin=tc.input, optimize=False)
+        log, _ = tc.record('gosub', 'return')
+        interp.set_source("gosub 10\nend\n10 return")
+        interp.exec()
+        tc.assertEqual(log, [('gosub', (0, 2)), ('return', (2, 1))])
+
+    def test_error(tc):
+        log, _ = tc.record('error')
+        tc.interp.set_source("print nope")
+        with tc.assertRaises(LookupError):
+            tc.interp.exec()
+        tc.assertEqual(len(log), 1)
+        tc.assertIsInstance(log[0][1], LookupError)
+
+    def test_remove(tc):
+        log, callback = tc.record('line')
+        tc.interp.remove_hook('line', callback)
+        tc.assertEqual(tc.interp.hooks, {})
+        tc.interp.set_source("print 1")
+        tc.interp.exec()
+        tc.assertEqual(log, [])
+        with tc.assertRaises(ValueError):
+            tc.interp.add_hook('nope', callback)
+
+class cfgTests(TestCase):
+    def test_blocks(tc):
+        tc.execScript("gosub.bas")
+        cfg = build_cfg(tc.interp.ast)
+        starts = [ b.start for b in cfg.blocks ]
+        tc.assertEqual(starts, [0, 1, 3, 5, 7, 8])
+        # gosub falls through to the return site
+        tc.assertEqual(cfg.blocks[3].successors, [1, 7])
+        tc.assertEqual(cfg.blocks[1].successors, ['return'])
+
+    def test_straight_line(tc):
+        tc.execScript("math.bas")
+        cfg = tc.interp.link()
+        tc.assertEqual(len(cfg.blocks), 1)
+        tc.assertEqual(cfg.blocks[0].successors, [])
+
+    def test_computed_goto(tc):
+        code = "let d = 20\n10 goto d\n20 print \"ok\"\n30 end"
+        tc.interp.set_source(code)
+        tc.interp.exec()
+        cfg = tc.interp.link()
+        tc.assertIn('?', cfg.blocks[1].successors)
+        tc.assertEqual(tc.output.getvalue(), "ok\n")
+
+    def test_list_cfg(tc):
+        tc.execScript("goto.bas")
+        tc.output.seek(0)
+        tc.output.truncate()
+        tc.interp.exec_line("list cfg")
+        out = tc.output.getvalue()
+        tc.assertRegex(out, r"B0 \[0:2\] -> B2")
+        tc.assertRegex(out, r"goto quit")
+
+class optimizerTests(TestCase):
+    loop = "10 let I = 0\n20 let S = 0\n30 S = S + I\n40 I = I + 1\n50 if I < 10 then goto 30\n60 print \"sum\"; S"
+
+    def linked(tc, code):
+        tc.interp.set_source(code)
+        return [ line.statement for line in tc.interp.link().program.body ]
+
+    def test_superinstructions(tc):
+        stmts = tc.linked(tc.loop)
+        tc.assertIsInstance(stmts[2], ast.AccumulateStmt)
+        tc.assertIsNone(stmts[3])
+        tc.assertIsInstance(stmts[4], ast.IncrementBranchStmt)
+        tc.interp.exec()
+        tc.assertEqual(tc.output.getvalue(), "sum45\n")
+        tc.assertEqual(tc.interp.variables['I'], 10)
+
+    def test_print_text(tc):
+        stmts = tc.linked('print "a", 1; "b"')
+        tc.assertEqual(stmts[0], ast.PrintTextStmt("a       1b\n"))
+
+    def test_inline_gosub(tc):
+        stmts = tc.linked(tc.testdir.joinpath("gosub.bas").read_text())
+        tc.assertNotIn(ast.GosubStmt, [ type(s) for s in stmts ])
+        tc.interp.exec()
+        tc.assertEqual(tc.output.getvalue(), "start\nlabel\nlineno\nend\n")
+        tc.assertEqual(tc.interp.substack, [])
+
+    def test_no_inline_recursive(tc):
+        code = "let n = 0\ngosub 10\nend\n10 n += 1\nif n < 3 then gosub 10\nreturn"
+        stmts = tc.linked(code)
+        tc.assertIsInstance(stmts[1], ast.GosubStmt)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['n'], 3)
+
+    def test_no_fusion_across_jump_target(tc):
+        code = "let I = 0\ngoto 20\n10 I += 1\n20 if I < 5 then goto 10"
+        stmts = tc.linked(code)
+        tc.assertIsInstance(stmts[3], ast.IfStmt)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['I'], 5)
+
+    def test_same_results(tc):
+        for script in ("gosub.bas", "goto.bas", "if.bas", "math.bas", "relational.bas"):
+            results = []
+            for optimize in (False, True):
+                out = io.StringIO()
+                interp = Interpreter(textout=out, textin=tc.input, optimize=optimize)
+                interp.set_source((tc.testdir/script).read_text())
+                interp.exec()
+                results.append((out.getvalue(), interp.variables))
+            tc.assertEqual(results[0], results[1], script)
+
+class memoTests(TestCase):
+    def test_invariant_cached(tc):
+        code = "let N = 16\nlet I = 0\nlet S = 0\n10 S = S + SQRT(N)\nI = I + 1\nif I < 5 then goto 10"
+        tc.interp.set_source(code)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['S'], 20)
+        tc.assertEqual((tc.interp.memo_hits, tc.interp.memo_misses), (4, 1))
+
+    def test_recomputed_after_assignment(tc):
+        code = ("let N = 0\nlet T = 0\n10 N += 1\nI = 0\n"
+                "20 T = T + POW(N, 2)\nI += 1\nif I < 3 then goto 20\nif N < 3 then goto 10")
+        tc.interp.set_source(code)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.variables['T'], 42)
+        tc.assertEqual((tc.interp.memo_hits, tc.interp.memo_misses), (6, 3))
+
+    def test_impure_not_cached(tc):
+        code = "let I = 0\n10 r = rnd(5) * 2\nI += 1\nif I < 5 then goto 10"
+        tc.interp.set_source(code)
+        stmt = tc.interp.link().program.body[1].statement
+        tc.assertIsInstance(stmt.expression.right, ast.BinaryExpr)
+        tc.interp.exec()
+        tc.assertEqual(tc.interp.memo_misses, 0)
+
 class invalidTests(TestCase):
     def test_raise_on_unknown_ast(tc):       
         with tc.assertRaises(NotImplementedError):
@@ -5,6 +5,7 @@ import pathlib, sys
 sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent/'src'))
 
 from redbasic.parser import Parser, parse_int, is_keyword
+from redbasic import spec
 from redbasic.spec import Token
 from redbasic.ast import *
 
@@ -38,6 +39,18 @@ class parserHelpers(unittest.TestCase):
         tc.assertFalse(is_keyword(Token.eol))
         tc.assertFalse(is_keyword(Token.semicolon))
 
+    def test_scanner(tc):
+        "the combined pattern picks the same rule as trying them one by one"
+        pattern, tokens = spec.scanner()
+        code = 'print "a"; 1.5e3 <> 0x1F rem x\n10 IF a1 >= 07 then goto end_: x += 1 && !y || z'
+        pos = 0
+        while pos < len(code):
+            expected = next( (tok, m.group()) for tok, rule in spec.basic_spec.items()
+                             if (m := rule.match(code, pos)) )
+            m = pattern.match(code, pos)
+            tc.assertEqual((tokens[m.lastgroup], m.group()), expected)
+            pos = m.end()
+
 class mathTests(TestCase):
     def test_addition(tc):
         tc.assertAst(
@@ -267,6 +280,47 @@ class statmentTests(TestCase):
         tc.assertAst('x = 420', Program(body=[Line(statement=ExpressionStmt(expression=AssignmentExpr(operator='=', left=Identifier(name='x'), right=IntLiteral(value=420))), linenum=0)]))
 
 
+    def test_dim_stmt(tc):
+        tc.assertAst('dim A(10), M(2, n+1)', Program([Line(DimStmt([
+            Subscript('A', [IntLiteral(10)]),
+            Subscript('M', [IntLiteral(2), BinaryExpr('+', Identifier('n'), IntLiteral(1))])]))]))
+        tc.assertAst('A(i) += M(1, 2)', Program([Line(ExpressionStmt(AssignmentExpr('+=',
+            Subscript('A', [Identifier('i')]), Subscript('M', [IntLiteral(1), IntLiteral(2)]))))]))
+        tc.assertAstEqual('let A(1) = 2', 'A(1) = 2')
+        tc.assertAst('input x, A(x)', Program([Line(InputStmt([Identifier('x'), Subscript('A', [Identifier('x')])]))]))
+
+    def test_mat_stmt(tc):
+        tc.assertAst('mat C = A + B', Program([Line(MatStmt('C', 'A', '+', 'B'))]))
+        tc.assertAst('MAT C = A * B', Program([Line(MatStmt('C', 'A', '*', 'B'))]))
+        tc.assertAst('mat C = A', Program([Line(MatStmt('C', 'A'))]))
+        tc.assertAst('mat C = (k + 1) * A', Program([Line(MatScaleStmt('C', BinaryExpr('+', Identifier('k'), IntLiteral(1)), 'A'))]))
+        tc.assertAst('mat A = ZER', Program([Line(MatFillStmt('A', 'zer'))]))
+        tc.assertAst('mat I = idn(n, n)', Program([Line(MatFillStmt('I', 'idn', [Identifier('n'), Identifier('n')]))]))
+        with tc.assertRaises(SyntaxError):
+            parser.parse('mat C = A / B')
+        for code in ('mat C=A-B', 'mat C=(2)*A', 'mat A=con(3,3)', 'print sum(A(),1)'):
+            tc.assertEqual(reconstruct_stmt(parser.parse(code).body[0].statement), code)
+        # SUM is only a call with parentheses
+        tc.assertAst('print sum(A())', Program([Line(PrintStmt([PrintItem(Func('sum', [Subscript('A', [])]), None)]))]))
+        tc.assertAst('let sum = 1', Program([Line(VariableDecl(Identifier('sum'), IntLiteral(1)))]))
+        tc.assertAst('print max(A(), A(1) + 1)', Program([Line(PrintStmt([PrintItem(Func('max',
+            [Subscript('A', []), BinaryExpr('+', Subscript('A', [IntLiteral(1)]), IntLiteral(1))]), None)]))]))
+        # A() is the whole array only as an argument
+        for code in ('print a()', 'x = a()', 'print sum(a() + 1)', 'a() = 1', 'input a()'):
+            with tc.subTest(code=code), tc.assertRaises(SyntaxError):
+                parser.parse(code)
+
+    def test_for_stmt(tc):
+        tc.assertAst('for i = 1 to n', Program([Line(ForStmt(Identifier('i'), IntLiteral(1), Identifier('n')))]))
+        tc.assertAst('FOR i = n-1 TO 0 STEP -2', Program([Line(ForStmt(Identifier('i'),
+            BinaryExpr('-', Identifier('n'), IntLiteral(1)), IntLiteral(0), UnaryExpr('-', IntLiteral(2))))]))
+        tc.assertAst('next', Program([Line(NextStmt())]))
+        tc.assertAst('next i', Program([Line(NextStmt(Identifier('i')))]))
+        # TOTAL and STEPS are still identifiers
+        tc.assertAst('for k = total to steps', Program([Line(ForStmt(Identifier('k'), Identifier('total'), Identifier('steps')))]))
+        for code in ('for i = 1 to 10 step 2', 'next i'):
+            tc.assertEqual(reconstruct_stmt(parser.parse(code).body[0].statement), code.replace(' = ', '='))
+
     def test_list_stmt(tc):
         tc.assertAst('list', Program([Line(ListStmt(None, 'code'))]))
         tc.assertAst('list 1,5',  Program([Line(ListStmt([IntLiteral(1), IntLiteral(5)], 'code'))]))